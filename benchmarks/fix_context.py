@@ -0,0 +1,164 @@
+"""
+Fix prompt size with and without the AST-scoped code context.
+
+Builds synthetic SDKs the shape Rivet generates (one pydantic model per schema, one client
+method per operation), breaks one method in the middle, and compares the SDK fix prompt
+that carries the whole file against the one that carries only the excerpt around the failure.
+
+    uv run python benchmarks/fix_context.py --operations 20 --operations 200 --operations 1000
+"""
+
+import time
+from typing import List
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from rivet.core.schema import TestCaseResult, TestFrame, TestRunReport
+from rivet.tools.test_report import summarize_failures
+from rivet.utils.code_context import CHARS_PER_TOKEN, build_code_context, names_in_message
+from rivet.utils.prompts import get_fix_sdk_usr_prompt
+
+console = Console()
+
+HEADER = """import httpx
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel
+
+
+class APIError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+
+
+def _raise_for_status(response: httpx.Response) -> None:
+    if response.status_code >= 400:
+        raise APIError(response.status_code, response.text)
+"""
+
+MODEL = """
+
+class Resource{i}(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    tags: List[str] = []
+    owner_id: Optional[int] = None
+    metadata: Dict[str, Any] = {{}}
+"""
+
+CLIENT = """
+
+class Client:
+    def __init__(self, base_url: str, api_key: Optional[str] = None, timeout: float = 30.0):
+        self.base_url = base_url.rstrip("/")
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._client = httpx.Client(base_url=self.base_url, headers=headers, timeout=timeout)
+
+    def _request(self, method: str, path: str, **kwargs: Any) -> Any:
+        response = self._client.request(method, path, **kwargs)
+        _raise_for_status(response)
+        return response.json()
+"""
+
+METHOD = '''
+    def get_resource_{i}(self, resource_id: int, expand: Optional[str] = None) -> Resource{i}:
+        """Fetch one resource {i} by its ID"""
+        params = {{"expand": expand}} if expand else None
+        data = self._request("GET", f"/resources_{i}/{{resource_id}}", params=params)
+        return Resource{i}(**data)
+'''
+
+
+def synthetic_sdk(operations: int) -> str:
+    models = "".join(MODEL.format(i=i) for i in range(operations))
+    methods = "".join(METHOD.format(i=i) for i in range(operations))
+    return HEADER + models + CLIENT + methods
+
+
+def _failing_line(sdk: str, operation: int) -> int:
+    marker = f"return Resource{operation}(**data)"
+    return next(n for n, line in enumerate(sdk.split("\n"), start=1) if marker in line)
+
+
+def _report(operation: int, line: int) -> TestRunReport:
+    message = f"NameError: name 'Resource{operation}' is not defined"
+    return TestRunReport(
+        exit_code=1,
+        cases=[
+            TestCaseResult(
+                node_id=f"test_client.py::test_get_resource_{operation}",
+                outcome="failed",
+                exception_type="NameError",
+                message=message,
+                frames=[
+                    TestFrame(path="test_client.py", line=12, function="test_get_resource"),
+                    TestFrame(path="client.py", line=line, function=f"get_resource_{operation}"),
+                ],
+                traceback=f"client.py:{line}: in get_resource_{operation}\n    {message}",
+            )
+        ],
+    )
+
+
+def _prompt(sdk: str, report: TestRunReport, excerpt: bool) -> str:
+    case = report.failures[0]
+    return get_fix_sdk_usr_prompt(
+        current_sdk=sdk,
+        error_logs=summarize_failures(report),
+        error_category="sdk_structure",
+        error_suggestion="Define or import the missing name",
+        error_message=case.message,
+        file_path="client.py",
+        line_number=case.frames[-1].line,
+        patch=True,
+        excerpt=excerpt,
+    )
+
+
+def main(
+    operations: List[int] = typer.Option([10, 50, 200, 1000], help="Operations per SDK"),
+    max_tokens: int = typer.Option(2000, help="Context budget in tokens"),
+):
+    table = Table(title=f"SDK fix prompt size (context budget {max_tokens} tokens)")
+    table.add_column("Operations", justify="right")
+    table.add_column("SDK (lines)", justify="right")
+    table.add_column("Full prompt (~tokens)", justify="right")
+    table.add_column("Scoped prompt (~tokens)", justify="right")
+    table.add_column("Reduction", justify="right")
+    table.add_column("Build (ms)", justify="right")
+
+    for count in operations:
+        sdk = synthetic_sdk(count)
+        broken = count // 2
+        line = _failing_line(sdk, broken)
+        report = _report(broken, line)
+
+        started = time.perf_counter()
+        excerpt = build_code_context(
+            sdk,
+            lines=[line],
+            names=names_in_message(report.failures[0].message),
+            max_tokens=max_tokens,
+        )
+        elapsed = (time.perf_counter() - started) * 1000
+
+        full = len(_prompt(sdk, report, excerpt=False)) // CHARS_PER_TOKEN
+        scoped = len(_prompt(excerpt or sdk, report, excerpt=excerpt is not None))
+        scoped //= CHARS_PER_TOKEN
+        table.add_row(
+            str(count),
+            str(sdk.count("\n") + 1),
+            f"{full:,}",
+            f"{scoped:,}",
+            f"{full / scoped:.1f}x",
+            f"{elapsed:.1f}",
+        )
+
+    console.print(table)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,103 @@
+"""
+Per-iteration latency of the sandbox backends.
+
+Runs the same small SDK + test suite through each backend a few times, the way the
+self-healing loop does, and reports cold (first) and warm (subsequent) iteration times.
+
+    uv run python benchmarks/sandbox_latency.py --iterations 5
+"""
+
+import statistics
+import time
+from typing import List
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from rivet.tools.sandbox import SANDBOX_BACKENDS, get_sandbox_backend, shutdown_sandbox
+
+console = Console()
+
+SDK_CODE = """
+import httpx
+from pydantic import BaseModel
+
+
+class Pet(BaseModel):
+    id: int
+    name: str
+
+
+class PetClient:
+    def __init__(self, base_url: str = "https://petstore.example.com"):
+        self.base_url = base_url
+
+    def parse_pet(self, payload: dict) -> Pet:
+        return Pet(**payload)
+"""
+
+TEST_CODE = """
+import pytest
+from client import Pet, PetClient
+
+
+def test_parse_pet():
+    pet = PetClient().parse_pet({"id": 1, "name": "Rex"})
+    assert pet == Pet(id=1, name="Rex")
+
+
+@pytest.mark.parametrize("pet_id", range(20))
+def test_many(pet_id):
+    assert PetClient().parse_pet({"id": pet_id, "name": "x"}).id == pet_id
+"""
+
+
+def _bench(backend_name: str, iterations: int) -> List[float]:
+    backend = get_sandbox_backend({"configurable": {"sandbox_backend": backend_name}})
+    timings = []
+    for i in range(iterations):
+        # Vary the test file like the fix loop does, so nothing is served from a cache
+        test_code = TEST_CODE + f"\n# iteration {i}\n"
+        started = time.perf_counter()
+        result = backend.run({"client.py": SDK_CODE, "test_client.py": test_code})
+        timings.append(time.perf_counter() - started)
+        if result.exit_code != 0:
+            raise RuntimeError(f"{backend_name} run failed:\n{result.output[-2000:]}")
+    return timings
+
+
+def main(
+    iterations: int = typer.Option(5, help="Test iterations per backend"),
+    backends: List[str] = typer.Option(list(SANDBOX_BACKENDS), "--backend", help="Backends"),
+):
+    table = Table(title=f"Sandbox latency ({iterations} iterations)")
+    table.add_column("Backend")
+    table.add_column("Cold (s)", justify="right")
+    table.add_column("Warm mean (s)", justify="right")
+    table.add_column("Warm median (s)", justify="right")
+    table.add_column("Warm max (s)", justify="right")
+
+    for name in backends:
+        console.print(f"⏱️ Benchmarking {name}...")
+        try:
+            timings = _bench(name, iterations)
+        except Exception as e:
+            console.print(f"[yellow]⚠️ Skipping {name}: {str(e)}[/yellow]")
+            continue
+
+        warm = timings[1:] or timings
+        table.add_row(
+            name,
+            f"{timings[0]:.2f}",
+            f"{statistics.mean(warm):.2f}",
+            f"{statistics.median(warm):.2f}",
+            f"{max(warm):.2f}",
+        )
+
+    shutdown_sandbox()
+    console.print(table)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -1,12 +1,74 @@
 import logging
+from collections import deque
 
 from rich.layout import Layout
 from rich.panel import Panel
 from rich.spinner import Spinner
 from rich.syntax import Syntax
+from rich.table import Table
+from rich.text import Text
+
+from rivet.core.inference import STREAM_KEY as LLM_STREAM_KEY
+from rivet.utils.live_output import STREAM_KEY
 
 logger = logging.getLogger(__name__)
 
+# Last lines of the running pytest session, shown while the sandbox works
+OUTPUT_TAIL_LINES = 20
+# Last lines of code shown while the LLM is still writing it
+CODE_TAIL_LINES = 40
+_output_tail: deque = deque(maxlen=OUTPUT_TAIL_LINES)
+# Graph nodes whose LLM calls are reported under a different name
+LLM_NODE_NAMES = {"slice_node": "slice"}
+
+
+def _output_style(line: str) -> str:
+    if "FAILED" in line or "ERROR" in line or line.startswith("E "):
+        return "red"
+    if "PASSED" in line:
+        return "green"
+    if "SKIPPED" in line:
+        return "yellow"
+    return "white"
+
+
+def _update_on_llm_output(layout: Layout, data: dict):
+    lines = data.get("text", "").split("\n")
+    start = max(len(lines) - CODE_TAIL_LINES, 0)
+    syntax = Syntax(
+        "\n".join(lines[start:]),
+        "python",
+        theme="monokai",
+        line_numbers=True,
+        start_line=start + 1,
+    )
+    state = "done" if data.get("done") else "streaming"
+    layout["body"].update(
+        Panel(
+            syntax,
+            title=f"{data.get('title', 'LLM Output')} ({len(lines)} lines, {state})",
+            border_style="yellow",
+        )
+    )
+
+
+def update_on_output(layout: Layout, event: dict):
+    if LLM_STREAM_KEY in event:
+        _update_on_llm_output(layout, event[LLM_STREAM_KEY])
+        return
+
+    line = event.get(STREAM_KEY)
+    if line is None:
+        return
+    if "test session starts" in line:
+        _output_tail.clear()
+    _output_tail.append(line)
+
+    text = Text()
+    for tail_line in _output_tail:
+        text.append(tail_line[:200] + "\n", style=_output_style(tail_line))
+    layout["body"].update(Panel(text, title="🧪 Running Tests (live)", border_style="cyan"))
+
 
 def update_on_event(layout: Layout, event: dict):
     logger.info(f"TUI Event received: {list(event.keys())}")
@@ -193,3 +255,69 @@ def update_on_event(layout: Layout, event: dict):
                     border_style="orange1",
                 )
             )
+
+
+def _tokens(value: int) -> str:
+    return f"{value / 1000:.1f}k" if value >= 1000 else str(value)
+
+
+def render_run_summary(report: dict) -> Table:
+    """Per-node time, LLM usage and cost of a finished run (see build_run_report)"""
+    llm = report.get("llm", {})
+    cost = llm.get("cost_usd")
+    table = Table(
+        title="📊 Run Summary",
+        caption=(
+            f"Wall time {report.get('duration_s', 0):.1f}s · "
+            f"sandbox {report.get('sandbox_time_s', 0):.1f}s · "
+            f"LLM queue wait {llm.get('queue_wait_s', 0):.1f}s"
+        ),
+        title_justify="left",
+    )
+    table.add_column("Node")
+    table.add_column("Runs", justify="right")
+    table.add_column("Time (s)", justify="right")
+    table.add_column("Model")
+    table.add_column("LLM calls", justify="right")
+    table.add_column("Tokens in / out / cached", justify="right")
+    table.add_column("Retries", justify="right")
+    table.add_column("Cost ($)", justify="right")
+
+    llm_nodes = report.get("llm_nodes", {})
+    for name, timing in report.get("nodes", {}).items():
+        usage = llm_nodes.get(LLM_NODE_NAMES.get(name, name))
+        if usage is None:
+            table.add_row(name, str(timing["runs"]), f"{timing['total_s']:.1f}")
+            continue
+        tokens = " / ".join(
+            _tokens(usage[key]) for key in ("prompt_tokens", "completion_tokens", "cached_tokens")
+        )
+        table.add_row(
+            name,
+            str(timing["runs"]),
+            f"{timing['total_s']:.1f}",
+            usage["model"] or "",
+            f"{usage['calls']} ({usage['cache_hits']} cached)"
+            if usage["cache_hits"]
+            else str(usage["calls"]),
+            f"~{tokens}" if usage["tokens_estimated"] else tokens,
+            str(usage["retries"]),
+            f"{usage['cost_usd']:.4f}" if usage["cost_usd"] is not None else "-",
+        )
+
+    table.add_section()
+    table.add_row(
+        "total",
+        "",
+        f"{report.get('duration_s', 0):.1f}",
+        "",
+        str(llm.get("calls", 0)),
+        " / ".join(
+            _tokens(llm.get(key, 0))
+            for key in ("prompt_tokens", "completion_tokens", "cached_tokens")
+        ),
+        str(llm.get("retries", 0)),
+        f"{cost:.4f}" if cost is not None else "-",
+        style="bold",
+    )
+    return table
@@ -1,6 +1,11 @@
 import ast
+import asyncio
+import functools
 import json
 import logging
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END, StateGraph
@@ -8,11 +13,37 @@ from rich.console import Console
 
 from rivet.core.inference import direct_chat_completion
 from rivet.core.schema import AgentState
+from rivet.core.sdk_candidates import CandidateSettings, generate_sdk_candidates
+from rivet.tools.dependency_resolver import UnresolvedImportError
+from rivet.tools.import_check import check_import
 from rivet.tools.sandbox import run_safe_test
+from rivet.tools.sandbox_base import OutputCallback
 from rivet.tools.scrape import ingest_resource
 from rivet.tools.slicer import slice_spec
-from rivet.utils.code_cleaner import clean_code
-from rivet.utils.errors import get_error_analysis
+from rivet.tools.test_report import (
+    PYTEST_NO_TESTS,
+    PYTEST_USAGE_ERROR,
+    condense_tracebacks,
+    summarize_failures,
+)
+from rivet.utils.code_cleaner import CodeStreamGuard, clean_code
+from rivet.utils.code_context import (
+    DEFAULT_CONTEXT_TOKENS,
+    build_code_context,
+    names_in_message,
+    referenced_names,
+)
+from rivet.utils.code_patch import PatchError, apply_patch
+from rivet.utils.errors import (
+    DEFAULT_LOG_CHARS,
+    ErrorAnalysis,
+    ErrorCategory,
+    condense_log,
+    get_import_error_analysis,
+    get_report_analysis,
+)
+from rivet.utils.live_output import LiveTestOutput
+from rivet.utils.metrics import run_metrics
 from rivet.utils.prompts import (
     get_code_sys_prompt,
     get_code_usr_prompt,
@@ -31,6 +62,9 @@ logger = logging.getLogger(__name__)
 # But we will make do with this for now.
 MAX_SDK_RETRIES = 5
 MAX_TEST_RETRIES = 5
+# patch: fixes come back as changed definitions / diffs, rewrite: as the whole file
+FIX_MODES = ("patch", "rewrite")
+DEFAULT_FIX_MODE = "patch"
 
 
 async def ingest_node(state: AgentState, config: RunnableConfig):
@@ -55,7 +89,7 @@ async def ingest_node(state: AgentState, config: RunnableConfig):
 
 async def slice_node(state: AgentState, config: RunnableConfig):
     try:
-        sliced = await slice_spec(state.spec_json, config, state.requirement)
+        sliced = await slice_spec(state.spec_json, config, state.requirement, source=state.url)
 
         if not sliced["paths"]:
             return {"status": "error", "error": "No matching endpoints found."}
@@ -74,6 +108,15 @@ async def slice_node(state: AgentState, config: RunnableConfig):
 # SDK GENERATION AND VALIDATION
 
 
+async def _check_sdk_candidate(sdk_code: str, config: RunnableConfig) -> Optional[str]:
+    """What validate_sdk would reject, plus errors that only show up on import"""
+    try:
+        compile(sdk_code, "<string>", "exec")
+    except SyntaxError as e:
+        return f"SyntaxError: {str(e)} at line {e.lineno}"
+    return await asyncio.to_thread(check_import, sdk_code, config)
+
+
 async def generate_sdk(state: AgentState, config: RunnableConfig):
     config_params = config.get("configurable", {})
     output_dir = config_params.get("output_dir", "./output")
@@ -86,18 +129,30 @@ async def generate_sdk(state: AgentState, config: RunnableConfig):
             logger.warning(f"⚠️ Regenerating SDK due to: {error_context}")
 
     logger.info("🔧 Generating SDK code...")
-    raw_sdk_code = await direct_chat_completion(
-        config=config,
-        sys_msg_content=get_code_sys_prompt(),
-        usr_msg_content=get_code_usr_prompt(
-            swagger_spec=json.dumps(state.required_spec),
-            docs_text=state.doc_text,
-            user_requirements=state.requirement or None,
-            error=error_context,
-        ),
+    sys_prompt = get_code_sys_prompt()
+    usr_prompt = get_code_usr_prompt(
+        swagger_spec=json.dumps(state.required_spec),
+        docs_text=state.doc_text,
+        user_requirements=state.requirement or None,
+        error=error_context,
     )
-
-    generated_sdk_code = clean_code(raw_sdk_code)
+    if CandidateSettings.from_config(config).enabled:
+        generated_sdk_code = await generate_sdk_candidates(
+            config,
+            sys_prompt,
+            usr_prompt,
+            check=functools.partial(_check_sdk_candidate, config=config),
+        )
+    else:
+        raw_sdk_code = await direct_chat_completion(
+            config=config,
+            sys_msg_content=sys_prompt,
+            usr_msg_content=usr_prompt,
+            stream_title="Generating SDK Code",
+            guard=CodeStreamGuard,
+            node="generate_sdk",
+        )
+        generated_sdk_code = clean_code(raw_sdk_code)
 
     if not generated_sdk_code:
         logger.error("❌ LLM failed to generate SDK code")
@@ -208,6 +263,9 @@ async def generate_tests(state: AgentState, config: RunnableConfig):
             user_requirements=state.requirement or None,
             error=error_context,
         ),
+        stream_title="Generating Tests",
+        guard=CodeStreamGuard,
+        node="generate_tests",
     )
 
     generated_test_code = clean_code(raw_test_code)
@@ -238,45 +296,164 @@ async def generate_tests(state: AgentState, config: RunnableConfig):
 # TEST EXECUTION AND ANALYSIS
 
 
-async def test_code(state: AgentState, config: RunnableConfig):
-    sdk_code = state.sdk_code
-    test_code = state.test_code
-    config_params = config.get("configurable", {})
-    output_dir = config_params.get("output_dir", "./output")
+def _analysis_to_dict(analysis: ErrorAnalysis) -> dict:
+    return {
+        "category": analysis.category.value,
+        "is_sdk_error": analysis.is_sdk_error,
+        "severity": analysis.severity,
+        "suggestion": analysis.suggested_action,
+        "error_type": analysis.error_type,
+        "error_message": analysis.error_message,
+        "file_path": analysis.file_path,
+        "line_number": analysis.line_number,
+        "failing_tests": analysis.failing_tests,
+    }
 
-    logger.info("🧪 Running tests...")
-    passed, logs = await run_safe_test(sdk_code, test_code)
 
-    # Save test logs
+def _failure_context(state: AgentState) -> str:
+    """What the fix prompts see: the structured failures when we have them, raw logs otherwise"""
+    if state.test_report and state.test_report.failures:
+        return summarize_failures(state.test_report)
+    # Already condensed to the failure sections by test_code
+    return state.error or ""
+
+
+def _failed_first_targets(state: AgentState, config: RunnableConfig) -> List[str]:
+    """Node IDs worth re-running on their own before paying for the whole suite"""
+    if not config.get("configurable", {}).get("sandbox_failed_first", True):
+        return []
+    report = state.test_report
+    if report is None or report.passed:
+        return []
+    # A collection error is reported against the module, which is the whole suite anyway
+    if any(case.is_collection_error for case in report.failures):
+        return []
+    return report.failing_node_ids
+
+
+async def _run_failed_first(
+    state: AgentState, config: RunnableConfig, on_output: Optional[OutputCallback] = None
+) -> Dict[str, Any]:
+    """
+    Like pytest --ff, but cheaper: re-run last iteration's failures alone and only run the
+    full suite once they pass. Returns the report to judge plus the state fields to update.
+    """
+    targets = _failed_first_targets(state, config)
+    if targets:
+        logger.info(f"🎯 Re-running {len(targets)} previously failing tests first...")
+        focused = await run_safe_test(
+            state.sdk_code,
+            state.test_code,
+            config,
+            targets,
+            previous=state.test_report,
+            on_output=on_output,
+        )
+        run_metrics.incr("tests.failed_first.runs")
+        run_metrics.incr("tests.failed_first.spent_s", focused.duration)
+
+        # 4/5: the node IDs no longer exist (tests were rewritten), so fall through
+        if focused.exit_code in (PYTEST_USAGE_ERROR, PYTEST_NO_TESTS):
+            logger.info("🔁 Previous failures no longer match the suite, running everything")
+        elif not focused.passed:
+            saved = max(state.full_suite_duration - focused.duration, 0.0)
+            run_metrics.incr("tests.failed_first.full_runs_skipped")
+            run_metrics.incr("tests.failed_first.saved_s", saved)
+            logger.info(f"⏱️ Skipped the full suite, saving ~{saved:.1f}s")
+            return {"report": focused}
+        else:
+            logger.info("✅ Previous failures pass now, running the full suite...")
+
+    report = await run_safe_test(
+        state.sdk_code, state.test_code, config, previous=state.test_report, on_output=on_output
+    )
+    run_metrics.incr("tests.full_runs")
+    return {"report": report, "full_suite_duration": report.duration}
+
+
+def _save_logs(output_dir: str, logs: str) -> Optional[str]:
+    """
+    Write the complete logs to logs.txt (the latest run) and to a numbered copy under
+    logs/, which the state refers to instead of carrying the text around.
+    """
     try:
         with open(f"{output_dir}/logs.txt", "w") as f:
             f.write(logs)
+        archive = f"{output_dir}/logs"
+        os.makedirs(archive, exist_ok=True)
+        path = f"{archive}/test_run_{len(os.listdir(archive)) + 1}.txt"
+        with open(path, "w") as f:
+            f.write(logs)
+        return path
     except Exception as e:
         logger.warning(f"⚠️ Failed to save logs: {str(e)}")
+        return None
+
+
+def _condense(logs: str, config: RunnableConfig) -> str:
+    max_chars = config.get("configurable", {}).get("error_log_max_chars", DEFAULT_LOG_CHARS)
+    condensed = condense_log(logs, max_chars)
+    run_metrics.incr("logs.condensed.chars_saved", max(len(logs) - len(condensed), 0))
+    return condensed
+
+
+async def test_code(state: AgentState, config: RunnableConfig):
+    config_params = config.get("configurable", {})
+    output_dir = config_params.get("output_dir", "./output")
 
-    if passed:
-        logger.info("✅ All tests passed!")
+    logger.info("🧪 Running tests...")
+    # Streams into logs.txt as pytest runs; rewritten with the complete logs afterwards
+    live_output = LiveTestOutput(f"{output_dir}/logs.txt")
+    try:
+        run = await _run_failed_first(state, config, live_output)
+    except UnresolvedImportError as e:
+        analysis = get_import_error_analysis(e.modules, e.details)
+        logger.error(f"❌ Skipped pytest: {analysis.error_message}")
+        return {
+            "status": "test_failed",
+            "error": _condense(analysis.traceback, config),
+            "error_log_path": None,
+            "error_analysis": _analysis_to_dict(analysis),
+            "test_report": None,
+        }
+    finally:
+        live_output.close()
+
+    report = run.pop("report")
+    log_path = _save_logs(output_dir, report.logs)
+
+    if report.passed:
+        logger.info(f"✅ All tests passed! ({len(report.cases)} tests in {report.duration:.1f}s)")
         return {
             "status": "success",
             "error": None,
+            "error_log_path": log_path,
             "error_analysis": {},
+            "test_report": report.model_copy(update={"logs": ""}),
+            **run,
         }
 
-    logger.info("❌ Tests failed, analyzing errors...")
+    logger.info(f"❌ Tests failed {report.counts()}, analyzing errors...")
 
-    analysis = get_error_analysis(logs)
+    # Analysis sees the raw logs and tracebacks; state and the fix prompts the condensed ones
+    analysis = get_report_analysis(report)
+    logs = _condense(report.logs, config)
+    report = report.model_copy(update={"logs": logs, "cases": condense_tracebacks(report.cases)})
 
     if not analysis:
         logger.error("❌ Could not analyze test failure")
         return {
             "status": "error",
             "error": logs,
+            "error_log_path": log_path,
             "error_analysis": {
                 "category": "unknown",
                 "is_sdk_error": True,
                 "severity": "high",
                 "suggestion": "Could not categorize error. Check logs manually.",
             },
+            "test_report": report,
+            **run,
         }
 
     logger.info("📊 Error Analysis:")
@@ -285,30 +462,129 @@ async def test_code(state: AgentState, config: RunnableConfig):
     logger.info(f"   Severity: {analysis.severity}")
     logger.info(f"   SDK Error: {analysis.is_sdk_error}")
     logger.info(f"   Suggestion: {analysis.suggested_action}")
+    logger.info(f"   Failing tests: {len(analysis.failing_tests)}")
 
     return {
         "status": "test_failed",
         "error": logs,
-        "error_analysis": {
-            "category": analysis.category.value,
-            "is_sdk_error": analysis.is_sdk_error,
-            "severity": analysis.severity,
-            "suggestion": analysis.suggested_action,
-            "error_type": analysis.error_type,
-            "error_message": analysis.error_message,
-            "file_path": analysis.file_path,
-            "line_number": analysis.line_number,
-        },
+        "error_log_path": log_path,
+        "error_analysis": _analysis_to_dict(analysis),
+        "test_report": report,
+        **run,
     }
 
 
 # TARGETED FIX NODES
 
 
+def _failure_lines(state: AgentState, file_name: str) -> List[int]:
+    """Lines of `file_name` the failure points at: traceback frames and the analysed location"""
+    lines = []
+    if state.test_report:
+        for case in state.test_report.failures:
+            lines.extend(f.line for f in case.frames if os.path.basename(f.path) == file_name)
+            if file_name == "test_client.py" and case.node_id.startswith(file_name):
+                lines.extend(_test_lines(state.test_code, case.node_id))
+    analysis = state.error_analysis or {}
+    if os.path.basename(analysis.get("file_path") or "") == file_name:
+        if analysis.get("line_number"):
+            lines.append(int(analysis["line_number"]))
+    return lines
+
+
+def _test_lines(test_code: Optional[str], node_id: str) -> List[int]:
+    """Line of the test a node ID refers to, for failures without a frame in the test file"""
+    parts = node_id.split("::")[1:]
+    if not parts or not test_code:
+        return []
+    try:
+        body = ast.parse(test_code).body
+    except SyntaxError:
+        return []
+    node = None
+    for part in parts:
+        name = part.split("[", 1)[0]
+        node = next((n for n in body if getattr(n, "name", None) == name), None)
+        if node is None:
+            return []
+        body = getattr(node, "body", [])
+    return [node.lineno]
+
+
+def _code_excerpt(
+    state: AgentState,
+    config: RunnableConfig,
+    source: Optional[str],
+    file_name: str,
+    names: Iterable[str] = (),
+) -> Optional[str]:
+    """The part of `source` a fix needs, or None to send the whole file"""
+    if not source:
+        return None
+    max_tokens = int(
+        config.get("configurable", {}).get("fix_context_tokens", DEFAULT_CONTEXT_TOKENS)
+    )
+    message = (state.error_analysis or {}).get("error_message")
+    excerpt = build_code_context(
+        source,
+        lines=_failure_lines(state, file_name),
+        names=[*names_in_message(message), *names],
+        max_tokens=max_tokens,
+    )
+    if excerpt is not None:
+        run_metrics.incr("fix.context.chars_saved", len(source) - len(excerpt))
+        logger.info(f"✂️ Sending {len(excerpt)} of {len(source)} chars of {file_name}")
+    return excerpt
+
+
+async def _generate_fix(
+    config: RunnableConfig,
+    node: str,
+    title: str,
+    current_code: str,
+    prompts: Callable[[bool], Tuple[str, str]],
+) -> str:
+    """
+    Ask for a fix of `current_code`. In patch mode (`fix_mode`, the default) the model only
+    returns the changed definitions or a diff, applied locally; if that reply doesn't
+    apply cleanly, the whole file is requested instead, as in `rewrite` mode.
+    """
+    fix_mode = config.get("configurable", {}).get("fix_mode", DEFAULT_FIX_MODE)
+    if fix_mode == "patch" and current_code:
+        sys_prompt, usr_prompt = prompts(True)
+        reply = await direct_chat_completion(
+            config=config,
+            sys_msg_content=sys_prompt,
+            usr_msg_content=usr_prompt,
+            stream_title=f"{title} (patch)",
+            guard=CodeStreamGuard,
+            node=node,
+        )
+        try:
+            patched = apply_patch(current_code, reply)
+            run_metrics.incr(f"{node}.patch.applied")
+            logger.info(f"🩹 Patch applied ({len(reply)} chars instead of the whole file)")
+            return patched
+        except PatchError as e:
+            run_metrics.incr(f"{node}.patch.failed")
+            logger.warning(f"⚠️ Patch did not apply ({str(e)}), requesting the whole file")
+
+    sys_prompt, usr_prompt = prompts(False)
+    fixed_code = await direct_chat_completion(
+        config=config,
+        sys_msg_content=sys_prompt,
+        usr_msg_content=usr_prompt,
+        stream_title=title,
+        guard=CodeStreamGuard,
+        node=node,
+    )
+    return clean_code(fixed_code)
+
+
 async def fix_sdk_targeted(state: AgentState, config: RunnableConfig):
     analysis = state.error_analysis
     current_sdk = state.sdk_code
-    error_logs = state.error
+    error_logs = _failure_context(state)
 
     sdk_retry_count = state.sdk_retry_count + 1
     logger.info(f"🔧 Fixing SDK (attempt {sdk_retry_count}/3)...")
@@ -319,26 +595,25 @@ async def fix_sdk_targeted(state: AgentState, config: RunnableConfig):
     file_path = analysis.get("file_path", "")
     line_number = analysis.get("line_number", "")
 
-    fix_prompt = get_fix_sdk_usr_prompt(
-        current_sdk=current_sdk,
-        error_logs=error_logs,
-        error_category=error_category,
-        error_suggestion=error_suggestion,
-        error_message=error_message,
-        file_path=file_path,
-        line_number=line_number,
-    )
+    def prompts(patch: bool):
+        # Patches name what they replace, so they can be written from an excerpt
+        excerpt = _code_excerpt(state, config, current_sdk, "client.py") if patch else None
+        return get_fix_sdk_sys_prompt(patch), get_fix_sdk_usr_prompt(
+            current_sdk=excerpt or current_sdk,
+            excerpt=excerpt is not None,
+            error_logs=error_logs,
+            error_category=error_category,
+            error_suggestion=error_suggestion,
+            error_message=error_message,
+            file_path=file_path,
+            line_number=line_number,
+            patch=patch,
+        )
 
     config_params = config.get("configurable", {})
     output_dir = config_params.get("output_dir", "./output")
 
-    fixed_sdk_code = await direct_chat_completion(
-        config=config,
-        sys_msg_content=get_fix_sdk_sys_prompt(),
-        usr_msg_content=fix_prompt,
-    )
-
-    fixed_sdk_code = clean_code(fixed_sdk_code)
+    fixed_sdk_code = await _generate_fix(config, "fix_sdk", "Fixing SDK Code", current_sdk, prompts)
 
     if not fixed_sdk_code:
         logger.error("❌ Failed to fix SDK code")
@@ -366,7 +641,7 @@ async def fix_tests_targeted(state: AgentState, config: RunnableConfig):
     analysis = state.error_analysis
     current_tests = state.test_code
     sdk_code = state.sdk_code
-    error_logs = state.error
+    error_logs = _failure_context(state)
 
     test_retry_count = state.test_retry_count + 1
     logger.info(f"🧪 Fixing tests (attempt {test_retry_count}/3)...")
@@ -375,26 +650,32 @@ async def fix_tests_targeted(state: AgentState, config: RunnableConfig):
     error_suggestion = analysis.get("suggestion", "Fix the error")
     error_message = analysis.get("error_message", "")
 
-    fix_prompt = get_fix_test_usr_prompt(
-        current_tests=current_tests,
-        sdk_code=sdk_code,
-        error_logs=error_logs,
-        error_category=error_category,
-        error_suggestion=error_suggestion,
-        error_message=error_message,
-    )
+    def prompts(patch: bool):
+        tests_excerpt = sdk_excerpt = None
+        if patch:
+            tests_excerpt = _code_excerpt(state, config, current_tests, "test_client.py")
+            # The SDK is context only: what the failing tests use is what matters
+            used = referenced_names(current_tests, _failure_lines(state, "test_client.py"))
+            sdk_excerpt = _code_excerpt(state, config, sdk_code, "client.py", used)
+        return get_fix_test_sys_prompt(patch), get_fix_test_usr_prompt(
+            current_tests=tests_excerpt or current_tests,
+            sdk_code=sdk_excerpt or sdk_code,
+            sdk_excerpt=sdk_excerpt is not None,
+            tests_excerpt=tests_excerpt is not None,
+            error_logs=error_logs,
+            error_category=error_category,
+            error_suggestion=error_suggestion,
+            error_message=error_message,
+            patch=patch,
+        )
 
     config_params = config.get("configurable", {})
     output_dir = config_params.get("output_dir", "./output")
 
-    fixed_test_code = await direct_chat_completion(
-        config=config,
-        sys_msg_content=get_fix_test_sys_prompt(),
-        usr_msg_content=fix_prompt,
+    fixed_test_code = await _generate_fix(
+        config, "fix_tests", "Fixing Tests", current_tests, prompts
     )
 
-    fixed_test_code = clean_code(fixed_test_code)
-
     if not fixed_test_code:
         logger.error("❌ Failed to fix test code")
         return {
@@ -447,6 +728,10 @@ def route_after_test(state: AgentState) -> str:
     sdk_retry_count = state.sdk_retry_count
     test_retry_count = state.test_retry_count
 
+    if analysis.get("category") == ErrorCategory.SANDBOX_TIMEOUT.value:
+        # Not SDK code: hangs come from tests calling the real network or looping forever
+        logger.warning(f"⏱️ Sandbox timeout: {analysis.get('error_message')}")
+
     if analysis.get("is_sdk_error"):
         if sdk_retry_count >= MAX_SDK_RETRIES:
             logger.error(f"❌ Max SDK retry limit reached ({MAX_SDK_RETRIES})")
@@ -466,17 +751,35 @@ def route_after_test(state: AgentState) -> str:
 # GRAPH CONSTRUCTION
 
 
+def _timed(name: str, node):
+    """Wrap a graph node so each run of it is recorded as `node.<name>` in the run metrics"""
+
+    @functools.wraps(node)
+    async def wrapper(state: AgentState, config: RunnableConfig):
+        started = time.monotonic()
+        try:
+            return await node(state, config)
+        finally:
+            run_metrics.observe(f"node.{name}", time.monotonic() - started)
+
+    return wrapper
+
+
 def build_graph():
     workflow = StateGraph(AgentState)
 
-    workflow.add_node("ingest_node", ingest_node)
-    workflow.add_node("slice_node", slice_node)
-    workflow.add_node("generate_sdk", generate_sdk)
-    workflow.add_node("validate_sdk", validate_sdk)
-    workflow.add_node("generate_tests", generate_tests)
-    workflow.add_node("test_code", test_code)
-    workflow.add_node("fix_sdk", fix_sdk_targeted)
-    workflow.add_node("fix_tests", fix_tests_targeted)
+    nodes = {
+        "ingest_node": ingest_node,
+        "slice_node": slice_node,
+        "generate_sdk": generate_sdk,
+        "validate_sdk": validate_sdk,
+        "generate_tests": generate_tests,
+        "test_code": test_code,
+        "fix_sdk": fix_sdk_targeted,
+        "fix_tests": fix_tests_targeted,
+    }
+    for name, node in nodes.items():
+        workflow.add_node(name, _timed(name, node))
 
     workflow.set_entry_point("ingest_node")
 
@@ -1,39 +1,361 @@
 import logging
-from typing import List
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
 
 from langchain_core.runnables import RunnableConfig
+from langgraph.config import get_stream_writer
 from openai import AsyncOpenAI
 from rich.console import Console
 
+from rivet.core.llm_cache import CacheMissError, LLMCache
+from rivet.core.llm_client import (
+    LLMClientSettings,
+    NodeLLMSettings,
+    estimate_cost,
+    get_llm_client,
+    with_retries,
+)
+from rivet.core.llm_scheduler import (
+    DEFAULT_PRIORITY,
+    LLMScheduler,
+    SchedulerSettings,
+    get_llm_scheduler,
+    node_priority,
+)
 from rivet.core.schema import Message
+from rivet.utils.code_cleaner import CodeStreamGuard, merge_continuation
+from rivet.utils.metrics import run_metrics
 
 console = Console()
 logger = logging.getLogger(__name__)
 
+STREAM_KEY = "llm_output"
+STREAM_INTERVAL = 0.25  # Seconds between live updates of a streaming completion
+DEFAULT_GUARD_RETRIES = 2
+DEFAULT_MAX_CONTINUATIONS = 3
+CHARS_PER_TOKEN = 4  # Rough estimate for providers that don't report usage
+DEFAULT_COMPLETION_ESTIMATE = 4096  # Tokens budgeted for a reply without max_tokens
 
-async def chat_completion(config: RunnableConfig, msgs: List[Message]) -> str:
+CONTINUE_PROMPT = (
+    "Your previous reply was cut off by the output limit. Continue exactly where it stopped, "
+    "starting with the next character. Do not repeat anything, do not explain and do not "
+    "open a new code block."
+)
+
+
+class CompletionAborted(Exception):
+    """A streaming completion was cancelled by its guard"""
+
+    def __init__(self, reason: str):
+        self.reason = reason
+        super().__init__(f"Completion cancelled: {reason}")
+
+
+@dataclass
+class CompletionResult:
+    text: str
+    finish_reason: Optional[str] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0  # Prompt tokens served from the provider's prompt cache
+    usage_reported: bool = True  # False when the token counts are estimates
+
+    def add_usage(self, other: "CompletionResult"):
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.cached_tokens += other.cached_tokens
+        self.usage_reported = self.usage_reported and other.usage_reported
+
+
+@dataclass
+class _Request:
+    """Everything one logical completion needs across guard retries and continuations"""
+
+    client: AsyncOpenAI
+    settings: LLMClientSettings
+    route: NodeLLMSettings
+    config_params: Dict[str, Any]
+    stream_title: Optional[str] = None
+    options: Dict[str, Any] = field(default_factory=dict)  # Per-request, not cached on
+    scheduler: Optional[LLMScheduler] = None
+    run: str = "default"  # Fair-queuing key of the run this request belongs to
+    priority: str = DEFAULT_PRIORITY
+    node: Optional[str] = None
+
+    @property
+    def stream(self) -> bool:
+        return bool(self.config_params.get("llm_stream", True))
+
+    def estimate_tokens(self, messages: List[Dict[str, str]]) -> int:
+        """Upper-ish guess of a request's size, charged against the tokens/minute budget"""
+        prompt = _estimated_usage(messages, "")["prompt_tokens"]
+        return prompt + (self.route.max_tokens or DEFAULT_COMPLETION_ESTIMATE)
+
+    async def create(self, messages: List[Dict[str, str]], **kwargs):
+        """Send one request (retried as configured), waiting for the scheduler first"""
+        estimated = self.estimate_tokens(messages)
+
+        async def call():
+            if self.scheduler is not None:
+                await self.scheduler.acquire(self.run, self.priority, estimated)
+            return await self.client.chat.completions.create(
+                model=self.route.model,
+                messages=messages,
+                **self.route.params,
+                **self.options,
+                **kwargs,
+            )
+
+        return await with_retries(call, self.settings, self.node)
+
+    def settle(self, messages: List[Dict[str, str]], result: "CompletionResult"):
+        if self.scheduler is not None:
+            self.scheduler.settle(
+                self.estimate_tokens(messages), result.prompt_tokens + result.completion_tokens
+            )
+
+
+def _stream_writer() -> Optional[Callable[[Any], None]]:
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        return None  # Not running inside a graph
+
+
+def _estimated_usage(messages: List[Dict[str, str]], text: str) -> Dict[str, int]:
+    prompt_chars = sum(len(m.get("content") or "") for m in messages)
+    return {
+        "prompt_tokens": prompt_chars // CHARS_PER_TOKEN,
+        "completion_tokens": len(text) // CHARS_PER_TOKEN,
+    }
+
+
+def _result(text: str, finish_reason: Optional[str], usage: Any, messages) -> CompletionResult:
+    if usage is not None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        return CompletionResult(
+            text,
+            finish_reason,
+            usage.prompt_tokens or 0,
+            usage.completion_tokens or 0,
+            cached_tokens=getattr(details, "cached_tokens", None) or 0,
+        )
+    return CompletionResult(
+        text, finish_reason, **_estimated_usage(messages, text), usage_reported=False
+    )
+
+
+async def _stream_completion(
+    request: _Request,
+    messages: List[Dict[str, str]],
+    guard: Optional[CodeStreamGuard] = None,
+    prefix: str = "",
+) -> CompletionResult:
+    """Stream a completion, publishing it live (after `prefix`) and checking it with `guard`"""
+    options = {}
+    if request.config_params.get("llm_stream_usage", True):
+        options["stream_options"] = {"include_usage": True}
+
+    stream = await request.create(messages, stream=True, **options)
+    title = request.stream_title
+    writer = _stream_writer() if title else None
+    parts: List[str] = []
+    finish_reason = usage = None
+    started = last_emit = time.monotonic()
+    try:
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if not parts:
+                run_metrics.observe("llm.first_token", time.monotonic() - started)
+            parts.append(delta)
+
+            problem = guard.feed(delta) if guard else None
+            if problem:
+                raise CompletionAborted(problem)
+
+            if writer and time.monotonic() - last_emit >= STREAM_INTERVAL:
+                writer({STREAM_KEY: {"title": title, "text": prefix + "".join(parts)}})
+                last_emit = time.monotonic()
+    finally:
+        # Closing the response is what stops generation (and billing) on the server side
+        await stream.close()
+
+    text = "".join(parts)
+    if writer:
+        writer({STREAM_KEY: {"title": title, "text": prefix + text, "done": True}})
+    result = _result(text, finish_reason, usage, messages)
+    request.settle(messages, result)
+    return result
+
+
+async def _complete_once(
+    request: _Request,
+    messages: List[Dict[str, str]],
+    guard: Optional[Callable[[], CodeStreamGuard]] = None,
+    prefix: str = "",
+) -> CompletionResult:
+    if not request.stream:
+        response = await request.create(messages)
+        choice = response.choices[0]
+        result = _result(
+            choice.message.content or "", choice.finish_reason, response.usage, messages
+        )
+        request.settle(messages, result)
+        return result
+
+    guard_retries = int(request.config_params.get("llm_guard_retries", DEFAULT_GUARD_RETRIES))
+    attempt_messages = messages
+    attempt = 0
+    while True:
+        attempt_guard = guard() if guard and attempt < guard_retries else None
+        try:
+            return await _stream_completion(request, attempt_messages, attempt_guard, prefix)
+        except CompletionAborted as e:
+            attempt += 1
+            run_metrics.incr("llm.stream.aborted")
+            logger.warning(f"⚠️ {str(e)}. Retrying ({attempt}/{guard_retries})...")
+            attempt_messages = messages + [
+                {
+                    "role": "user",
+                    "content": f"Your previous reply was cancelled: {e.reason}. "
+                    "Reply with the Python code only, no explanations.",
+                }
+            ]
+
+
+async def _complete(
+    request: _Request,
+    messages: List[Dict[str, str]],
+    guard: Optional[Callable[[], CodeStreamGuard]] = None,
+) -> CompletionResult:
+    result = await _complete_once(request, messages, guard)
+    if result.finish_reason != "length":
+        return result
+
+    # Hit the output limit: ask the model to carry on from where it was cut off
+    run_metrics.incr("llm.truncated")
+    max_rounds = int(request.config_params.get("llm_max_continuations", DEFAULT_MAX_CONTINUATIONS))
+    rounds = 0
+    while result.finish_reason == "length" and rounds < max_rounds:
+        rounds += 1
+        run_metrics.incr("llm.continuations")
+        logger.warning(
+            f"✂️ LLM output truncated at {len(result.text)} chars, "
+            f"continuing ({rounds}/{max_rounds})..."
+        )
+        continuation_messages = messages + [
+            {"role": "assistant", "content": result.text},
+            {"role": "user", "content": CONTINUE_PROMPT},
+        ]
+        # No guard: a continuation starts mid-file, which looks nothing like a fresh answer
+        more = await _complete_once(request, continuation_messages, prefix=result.text)
+        more.add_usage(result)
+        more.text = merge_continuation(result.text, more.text)
+        result = more
+
+    if result.finish_reason == "length":
+        run_metrics.incr("llm.truncated_final")
+        logger.error(f"❌ LLM output still truncated after {max_rounds} continuations")
+    return result
+
+
+def _record_node_usage(
+    config: RunnableConfig, node: str, model: str, result: CompletionResult, seconds: float
+):
+    prefix = f"llm.node.{node}"
+    run_metrics.observe(prefix, seconds)
+    run_metrics.incr(f"{prefix}.prompt_tokens", result.prompt_tokens)
+    run_metrics.incr(f"{prefix}.completion_tokens", result.completion_tokens)
+    run_metrics.incr(f"{prefix}.cached_tokens", result.cached_tokens)
+    if not result.usage_reported:
+        run_metrics.incr(f"{prefix}.estimated_calls")
+    cost = estimate_cost(config, model, result.prompt_tokens, result.completion_tokens)
+    if cost is not None:
+        run_metrics.incr(f"{prefix}.cost_usd", cost)
+
+
+async def chat_completion(
+    config: RunnableConfig,
+    msgs: List[Message],
+    stream_title: Optional[str] = None,
+    guard: Optional[Callable[[], CodeStreamGuard]] = None,
+    node: Optional[str] = None,
+    priority: Optional[str] = None,
+) -> str:
+    """
+    Run a chat completion with the model and parameters configured for `node`.
+    Requests wait for the rate-limit scheduler (`llm_rpm` / `llm_tpm`) at `priority`,
+    which defaults to the node's class (fixes go first).
+    Unless `llm_stream` is off, the response is streamed: shown live under `stream_title`,
+    and checked by a fresh `guard()` that can cancel and retry it (up to `llm_guard_retries`
+    times, the last attempt always runs unguarded).
+    """
     config_params = config.get("configurable", {})
-    llm_api_key = config_params.get("llm_api_key")
-    llm_base_url = config_params.get("llm_base_url")
-    llm_name = config_params.get("llm_name")
+    route = NodeLLMSettings.from_config(config, node)
 
-    if not llm_api_key or not llm_base_url or not llm_name:
+    if not route.api_key or not route.base_url or not route.model:
         logger.error("❌ LLM Configuration not set!")
         console.print(
             "❌ LLM Configuration not set! Please make sure LLM's API key, Base URL and the Model Name is set properly."
         )
         raise ValueError("LLM Configuration not set.")
 
+    node = node or "default"
     try:
-        client = AsyncOpenAI(
-            base_url=llm_base_url,
-            api_key=llm_api_key,
+        messages = [msg.model_dump() for msg in msgs]
+
+        cache = LLMCache.from_config(config)
+        key = (
+            cache.next_key(
+                route.model,
+                messages,
+                route.params,
+                route.base_url,
+                config_params.get("llm_cache_stream"),
+            )
+            if cache.enabled
+            else None
         )
-        response = await client.chat.completions.create(
-            model=llm_name,
-            messages=[msg.model_dump() for msg in msgs],
+        if key:
+            cached = cache.get(key)
+            if cached is not None:
+                logger.info(f"💾 LLM response for {node} served from cache ({key[:12]})")
+                run_metrics.incr(f"llm.node.{node}.cache_hits")
+                writer = _stream_writer() if stream_title else None
+                if writer:
+                    writer({STREAM_KEY: {"title": stream_title, "text": cached, "done": True}})
+                return cached
+            if cache.mode == "replay":
+                raise CacheMissError(key, route.model)
+
+        settings = LLMClientSettings.from_config(config)
+        request = _Request(
+            client=get_llm_client(route.base_url, route.api_key, settings),
+            settings=settings,
+            route=route,
+            config_params=config_params,
+            stream_title=stream_title,
+            options={"timeout": route.timeout} if route.timeout else {},
+            scheduler=get_llm_scheduler(SchedulerSettings.from_config(config)),
+            run=str(config_params.get("run_id") or config_params.get("output_dir") or "default"),
+            priority=priority or node_priority(node),
+            node=node,
         )
-        return response.choices[0].message.content
+
+        started = time.monotonic()
+        result = await _complete(request, messages, guard)
+        _record_node_usage(config, node, route.model, result, time.monotonic() - started)
+
+        if key and result.text is not None:
+            cache.put(key, route.model, result.text)
+        return result.text
 
     except Exception as e:
         logger.error(f"❌ Failed to create chat completion: {str(e)}")
@@ -45,6 +367,10 @@ async def direct_chat_completion(
     config: RunnableConfig,
     sys_msg_content: str,
     usr_msg_content: str,
+    stream_title: Optional[str] = None,
+    guard: Optional[Callable[[], CodeStreamGuard]] = None,
+    node: Optional[str] = None,
+    priority: Optional[str] = None,
 ) -> str:
     try:
         sys_msg = Message(
@@ -56,7 +382,7 @@ async def direct_chat_completion(
             content=usr_msg_content,
         )
         final_msgs = [sys_msg, usr_msg]
-        return await chat_completion(config, final_msgs)
+        return await chat_completion(config, final_msgs, stream_title, guard, node, priority)
 
     except Exception as e:
         logger.error(f"❌ Failed to create chat completion: {str(e)}")
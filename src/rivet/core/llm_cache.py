@@ -0,0 +1,191 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import platformdirs
+from langchain_core.runnables import RunnableConfig
+
+from rivet.utils.metrics import run_metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path(platformdirs.user_cache_dir("rivet")) / "llm"
+
+# off: always call the LLM | read_write: serve hits, store misses
+# record: always call, store everything | replay: serve from disk only, a miss is an error
+CACHE_MODES = ("off", "read_write", "record", "replay")
+# Off unless asked for: with the cache on, re-running a spec replays the previous run's
+# answers, including those of a run that failed
+DEFAULT_CACHE_MODE = "off"
+
+# How often each key was requested in this run. The n-th identical request maps to the
+# n-th recorded answer, so a retry with the same prompt doesn't get the same reply back
+# (read_write) and a replay follows the recorded run step by step (replay). Requests that
+# run concurrently are counted per stream (e.g. per SDK candidate), so the order in which
+# they happen to arrive doesn't decide which answer each one gets.
+_occurrences: Dict[Tuple[str, Optional[str]], int] = defaultdict(int)
+_occurrences_lock = threading.Lock()
+_evict_lock = threading.Lock()
+# Bytes on disk per cache directory: scanned on the first write, then kept up to date
+_sizes: Dict[Path, int] = {}
+# Evict down to this share of the limit, so a full cache isn't rescanned on every write
+EVICT_TO = 0.9
+
+
+class CacheMissError(Exception):
+    """Replay mode asked for a completion that was never recorded"""
+
+    def __init__(self, key: str, model: str):
+        self.key = key
+        super().__init__(f"No recorded LLM response for {model} (key {key[:12]}) in replay mode")
+
+
+def begin_llm_cache_run():
+    """Start counting request occurrences from scratch; call once per run"""
+    with _occurrences_lock:
+        _occurrences.clear()
+
+
+@dataclass(frozen=True)
+class LLMCache:
+    """Content-addressed completion cache on disk, one JSON file per response"""
+
+    mode: str = DEFAULT_CACHE_MODE
+    directory: Path = DEFAULT_CACHE_DIR
+    max_mb: float = 200.0  # Least recently used entries are evicted above this size
+
+    @classmethod
+    def from_config(cls, config: Optional[RunnableConfig] = None) -> "LLMCache":
+        params = (config or {}).get("configurable", {})
+        mode = params.get("llm_cache_mode") or cls.mode
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode '{mode}'. Choose one of: {CACHE_MODES}")
+        directory = params.get("llm_cache_dir")
+        return cls(
+            mode=mode,
+            directory=Path(directory) if directory else cls.directory,
+            max_mb=float(params.get("llm_cache_max_mb", cls.max_mb)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @staticmethod
+    def request_hash(
+        model: str,
+        messages: List[Dict[str, str]],
+        params: Dict[str, Any],
+        base_url: Optional[str] = None,
+    ) -> str:
+        # Two endpoints serving the same model name are different models
+        payload = json.dumps(
+            {"model": model, "base_url": base_url, "messages": messages, "params": params},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def next_key(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        params: Dict[str, Any],
+        base_url: Optional[str] = None,
+        stream: Optional[str] = None,
+    ) -> str:
+        """
+        Key of this request: the content hash, the stream it belongs to, and how many times
+        it was already asked in that stream
+        """
+        digest = self.request_hash(model, messages, params, base_url)
+        with _occurrences_lock:
+            occurrence = _occurrences[(digest, stream)]
+            _occurrences[(digest, stream)] += 1
+        return f"{digest}-{stream}-{occurrence}" if stream else f"{digest}-{occurrence}"
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        if self.mode not in ("read_write", "replay"):
+            return None
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            run_metrics.incr("llm.cache.miss")
+            return None
+
+        if self.mode == "read_write":
+            # Bump mtime: it is the recency the LRU eviction goes by
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        run_metrics.incr("llm.cache.hit")
+        return entry.get("response")
+
+    def put(self, key: str, model: str, response: str):
+        if self.mode not in ("read_write", "record"):
+            return
+        path = self._path(key)
+        entry = {"key": key, "model": model, "created_at": time.time(), "response": response}
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write-then-rename so a concurrent reader never sees half an entry
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp, path)
+            written = path.stat().st_size
+        except OSError as e:
+            logger.warning(f"⚠️ Failed to cache LLM response: {str(e)}")
+            return
+        run_metrics.incr("llm.cache.stored")
+        self._track(written)
+
+    def _track(self, written: int):
+        """Count the new entry against the size limit; only scan the directory to evict"""
+        if self.mode == "record":
+            return  # Recordings are fixtures: never drop part of one
+        limit = int(self.max_mb * 1024 * 1024)
+        with _evict_lock:
+            total = _sizes.get(self.directory)
+            # The first scan already includes the entry just written
+            total = self._evict() if total is None else total + written
+            if total > limit:
+                total = self._evict(int(limit * EVICT_TO))
+            _sizes[self.directory] = total
+
+    def _evict(self, limit: Optional[int] = None) -> int:
+        """Drop least recently used entries until the cache fits `limit`; returns its size"""
+        entries = []
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if limit is None:
+            return total
+        for _, size, path in sorted(entries, key=lambda e: e[0]):
+            if total <= limit:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            run_metrics.incr("llm.cache.evicted")
+        return total
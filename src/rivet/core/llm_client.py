@@ -0,0 +1,229 @@
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import httpx
+import openai
+from langchain_core.runnables import RunnableConfig
+from openai import AsyncOpenAI
+
+from rivet.utils.metrics import run_metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+@dataclass(frozen=True)
+class LLMClientSettings:
+    """Connection pool, timeout and retry knobs shared by every LLM request"""
+
+    timeout: float = 300.0  # Seconds to wait for a whole completion
+    connect_timeout: float = 10.0
+    max_connections: int = 10
+    max_keepalive_connections: int = 5
+    max_retries: int = 4
+    backoff_base: float = 1.0  # Seconds before the first retry, doubled on every attempt
+    backoff_max: float = 60.0  # Cap for both our backoff and a server's Retry-After
+
+    @classmethod
+    def from_config(cls, config: Optional[RunnableConfig] = None) -> "LLMClientSettings":
+        params = (config or {}).get("configurable", {})
+        return cls(
+            timeout=float(params.get("llm_timeout", cls.timeout)),
+            connect_timeout=float(params.get("llm_connect_timeout", cls.connect_timeout)),
+            max_connections=int(params.get("llm_max_connections", cls.max_connections)),
+            max_keepalive_connections=int(
+                params.get("llm_max_keepalive_connections", cls.max_keepalive_connections)
+            ),
+            max_retries=int(params.get("llm_max_retries", cls.max_retries)),
+            backoff_base=float(params.get("llm_backoff_base", cls.backoff_base)),
+            backoff_max=float(params.get("llm_backoff_max", cls.backoff_max)),
+        )
+
+
+# Graph nodes that call the LLM; each one can be routed to its own model via `llm_nodes`
+LLM_NODES = ("slice", "generate_sdk", "generate_tests", "fix_sdk", "fix_tests")
+
+
+@dataclass(frozen=True)
+class NodeLLMSettings:
+    """Model, endpoint and generation parameters for one graph node"""
+
+    model: Optional[str] = None
+    base_url: Optional[str] = None
+    api_key: Optional[str] = None
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    timeout: Optional[float] = None  # Seconds for one request, overrides llm_timeout
+
+    @classmethod
+    def from_config(
+        cls, config: Optional[RunnableConfig] = None, node: Optional[str] = None
+    ) -> "NodeLLMSettings":
+        """
+        Settings for `node`: its entry in `llm_nodes` (e.g. {"slice": {"model": "...",
+        "temperature": 0}}) layered over the run-wide llm_* settings.
+        """
+        params = (config or {}).get("configurable", {})
+        override = ((params.get("llm_nodes") or {}).get(node) or {}) if node else {}
+        if node and node not in LLM_NODES:
+            logger.debug(f"🔀 Unknown LLM node '{node}', using run-wide settings")
+
+        def pick(key: str, global_key: str):
+            value = override.get(key)
+            return value if value is not None else params.get(global_key)
+
+        temperature = pick("temperature", "llm_temperature")
+        max_tokens = pick("max_tokens", "llm_max_tokens")
+        timeout = pick("timeout", "llm_request_timeout")
+        return cls(
+            model=pick("model", "llm_name"),
+            base_url=pick("base_url", "llm_base_url"),
+            api_key=pick("api_key", "llm_api_key"),
+            temperature=float(temperature) if temperature is not None else None,
+            max_tokens=int(max_tokens) if max_tokens is not None else None,
+            timeout=float(timeout) if timeout is not None else None,
+        )
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        """Generation parameters sent with the request (and part of its cache key)"""
+        params: Dict[str, Any] = {}
+        if self.temperature is not None:
+            params["temperature"] = self.temperature
+        if self.max_tokens is not None:
+            params["max_tokens"] = self.max_tokens
+        return params
+
+
+def estimate_cost(
+    config: Optional[RunnableConfig], model: str, prompt_tokens: int, completion_tokens: int
+) -> Optional[float]:
+    """
+    USD cost of a completion from `llm_pricing` ({model: {"input_per_mtok": ...,
+    "output_per_mtok": ...}}, prices per million tokens). None if the model has no price.
+    """
+    params = (config or {}).get("configurable", {})
+    price = (params.get("llm_pricing") or {}).get(model)
+    if not price:
+        return None
+    return (
+        prompt_tokens * float(price.get("input_per_mtok", 0))
+        + completion_tokens * float(price.get("output_per_mtok", 0))
+    ) / 1_000_000
+
+
+_clients: Dict[Tuple[str, str], Tuple[AsyncOpenAI, LLMClientSettings]] = {}
+_clients_lock = threading.Lock()
+
+
+def _build_client(base_url: str, api_key: str, settings: LLMClientSettings) -> AsyncOpenAI:
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.max_connections,
+            max_keepalive_connections=settings.max_keepalive_connections,
+        ),
+        timeout=httpx.Timeout(settings.timeout, connect=settings.connect_timeout),
+    )
+    # Retries are ours (see with_retries), so the SDK's own are off
+    return AsyncOpenAI(base_url=base_url, api_key=api_key, max_retries=0, http_client=http_client)
+
+
+def get_llm_client(
+    base_url: str, api_key: str, settings: Optional[LLMClientSettings] = None
+) -> AsyncOpenAI:
+    """Process-wide client per (base_url, api_key), so requests reuse pooled connections"""
+    settings = settings or LLMClientSettings()
+    key = (base_url, api_key)
+    with _clients_lock:
+        entry = _clients.get(key)
+        if entry is not None and entry[1] == settings:
+            return entry[0]
+        if entry is not None:
+            # The old client may still serve an in-flight request, so it is not closed here
+            logger.debug("🔌 LLM client settings changed, replacing pooled client")
+        client = _build_client(base_url, api_key, settings)
+        _clients[key] = (client, settings)
+        return client
+
+
+async def close_llm_clients():
+    """Close every pooled LLM client. Call once the run is over."""
+    with _clients_lock:
+        clients = [client for client, _ in _clients.values()]
+        _clients.clear()
+    for client in clients:
+        try:
+            await client.close()
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to close LLM client: {str(e)}")
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait, from Retry-After / retry-after-ms"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            when = email.utils.parsedate_to_datetime(value)
+            return max(when.timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+async def with_retries(
+    call: Callable[[], Awaitable[T]], settings: LLMClientSettings, node: Optional[str] = None
+) -> T:
+    """
+    Run `call`, retrying rate limits, 5xx and connection errors with capped exponential
+    backoff (full jitter). A server-sent Retry-After takes precedence over our own delay.
+    Retries are counted in `llm.retries`, and per graph node when `node` is given.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            if attempt >= settings.max_retries or not _is_retryable(e):
+                raise
+
+            delay = _retry_after(e)
+            if delay is None:
+                delay = random.uniform(0, settings.backoff_base * 2**attempt)
+            delay = min(delay, settings.backoff_max)
+            attempt += 1
+
+            run_metrics.incr("llm.retries")
+            if node:
+                run_metrics.incr(f"llm.node.{node}.retries")
+            status = getattr(e, "status_code", type(e).__name__)
+            logger.warning(
+                f"⚠️ LLM request failed ({status}), retry {attempt}/{settings.max_retries} "
+                f"in {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
@@ -0,0 +1,196 @@
+import asyncio
+import itertools
+import logging
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+from rivet.utils.metrics import run_metrics
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first. Fixes unblock a run that is already deep in its loop; speculative
+# work (extra candidates) only ever uses capacity nobody else is waiting for.
+PRIORITIES = {"fix": 0, "normal": 1, "speculative": 2}
+NODE_PRIORITIES = {"fix_sdk": "fix", "fix_tests": "fix"}
+DEFAULT_PRIORITY = "normal"
+
+
+def node_priority(node: Optional[str]) -> str:
+    return NODE_PRIORITIES.get(node or "", DEFAULT_PRIORITY)
+
+
+@dataclass(frozen=True)
+class SchedulerSettings:
+    """Provider rate limits the scheduler keeps us under. None (the default) means no limit."""
+
+    rpm: Optional[float] = None  # Requests per minute
+    tpm: Optional[float] = None  # Estimated tokens per minute (prompt + completion)
+
+    @classmethod
+    def from_config(cls, config: Optional[RunnableConfig] = None) -> "SchedulerSettings":
+        params = (config or {}).get("configurable", {})
+        rpm, tpm = params.get("llm_rpm"), params.get("llm_tpm")
+        return cls(
+            rpm=float(rpm) if rpm else None,
+            tpm=float(tpm) if tpm else None,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.rpm or self.tpm)
+
+
+class TokenBucket:
+    """Holds up to `per_minute` units, refilled continuously. The level may go negative
+    when a request turns out bigger than estimated; later requests then wait it off."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)"""
+        self._refill()
+        # Anything bigger than the bucket would never fit: admit it once the bucket is full
+        missing = min(amount, self.capacity) - self.level
+        return max(missing / self.rate, 0.0)
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+
+@dataclass
+class _Waiter:
+    run: str
+    priority: int
+    tokens: float
+    seq: int
+    future: asyncio.Future
+    enqueued: float = field(default_factory=time.monotonic)
+
+
+class LLMScheduler:
+    """
+    Admits LLM requests under request/minute and token/minute budgets. Waiting requests go
+    by priority class, then by fair share: among runs of the same priority, the run that
+    was granted the fewest tokens so far goes next, so one busy run can't starve the others.
+    """
+
+    def __init__(self, settings: SchedulerSettings):
+        self.settings = settings
+        self._requests = TokenBucket(settings.rpm) if settings.rpm else None
+        self._tokens = TokenBucket(settings.tpm) if settings.tpm else None
+        self._waiting: List[_Waiter] = []
+        self._served: Dict[str, float] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        return len(self._waiting)
+
+    async def acquire(self, run: str, priority: str, tokens: float):
+        """Wait until a request of about `tokens` tokens from `run` may be sent"""
+        if not self.settings.enabled:
+            return
+        waiter = _Waiter(
+            run=run,
+            priority=PRIORITIES.get(priority, PRIORITIES[DEFAULT_PRIORITY]),
+            tokens=tokens,
+            seq=next(self._seq),
+            future=asyncio.get_running_loop().create_future(),
+        )
+        if run not in self._served:
+            # A newcomer starts level with the runs already queued rather than at zero,
+            # otherwise it would get the whole budget until it caught up with them
+            active = [self._served[w.run] for w in self._waiting if w.run in self._served]
+            self._served[run] = min(active, default=0.0)
+        self._waiting.append(waiter)
+        run_metrics.peak("llm.queue.max_depth", len(self._waiting))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._waiting:
+                self._waiting.remove(waiter)
+            raise
+
+        waited = time.monotonic() - waiter.enqueued
+        run_metrics.observe("llm.queue.wait", waited)
+        run_metrics.observe(f"llm.queue.wait.{priority}", waited)
+        if waited >= 1:
+            logger.debug(f"🚦 LLM request from {run} waited {waited:.1f}s for rate limits")
+
+    def settle(self, estimated: float, actual: float):
+        """Correct the token budget once a request's real usage is known"""
+        if self._tokens is not None and actual:
+            self._tokens.take(actual - estimated)
+
+    def _next(self) -> _Waiter:
+        return min(
+            self._waiting,
+            key=lambda w: (w.priority, self._served.get(w.run, 0.0), w.seq),
+        )
+
+    def _wait_time(self, waiter: _Waiter) -> float:
+        wait = 0.0
+        if self._requests is not None:
+            wait = max(wait, self._requests.wait_time(1))
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.wait_time(waiter.tokens))
+        return wait
+
+    async def _dispatch(self):
+        while self._waiting:
+            waiter = self._next()
+            wait = self._wait_time(waiter)
+            if wait > 0:
+                # Woken early by a new arrival, which may outrank the current head
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._waiting.remove(waiter)
+            if waiter.future.done():
+                continue  # Cancelled while queued
+            if self._requests is not None:
+                self._requests.take(1)
+            if self._tokens is not None:
+                self._tokens.take(waiter.tokens)
+            self._served[waiter.run] = self._served.get(waiter.run, 0.0) + waiter.tokens
+            waiter.future.set_result(None)
+
+
+# One scheduler per event loop: its futures and events belong to that loop
+_schedulers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, LLMScheduler]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_llm_scheduler(settings: SchedulerSettings) -> LLMScheduler:
+    """Process-wide scheduler, shared by every run on the current event loop"""
+    loop = asyncio.get_running_loop()
+    scheduler = _schedulers.get(loop)
+    if scheduler is None or scheduler.settings != settings:
+        # Requests already queued on the old scheduler are still served by it
+        scheduler = LLMScheduler(settings)
+        _schedulers[loop] = scheduler
+    return scheduler
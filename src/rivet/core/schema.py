@@ -1,4 +1,4 @@
-from typing import Dict, Literal, Optional
+from typing import Dict, List, Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -8,6 +8,53 @@ class Message(BaseModel):
     content: str
 
 
+class TestFrame(BaseModel):
+    path: str
+    line: int
+    function: Optional[str] = None
+
+
+class TestCaseResult(BaseModel):
+    node_id: str  # e.g. "test_client.py::TestPets::test_get_pet[1]"
+    outcome: Literal["passed", "failed", "error", "skipped"]
+    duration: float = 0.0
+    exception_type: Optional[str] = None
+    message: Optional[str] = None
+    frames: List[TestFrame] = Field(default_factory=list)
+    traceback: str = ""
+
+    @property
+    def is_collection_error(self) -> bool:
+        return self.outcome == "error" and "::" not in self.node_id
+
+
+class TestRunReport(BaseModel):
+    exit_code: int
+    duration: float = 0.0
+    cases: List[TestCaseResult] = Field(default_factory=list)
+    timed_out: bool = False  # Killed by the sandbox's wall-clock limit
+    # Pytest output: raw from the sandbox, condensed once the agent has saved it to disk
+    logs: str = Field(default="", repr=False)
+
+    @property
+    def passed(self) -> bool:
+        return self.exit_code == 0
+
+    @property
+    def failures(self) -> List[TestCaseResult]:
+        return [c for c in self.cases if c.outcome in ("failed", "error")]
+
+    @property
+    def failing_node_ids(self) -> List[str]:
+        return [c.node_id for c in self.failures if not c.is_collection_error]
+
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for case in self.cases:
+            counts[case.outcome] = counts.get(case.outcome, 0) + 1
+        return counts
+
+
 class AgentState(BaseModel):
     url: str
     requirement: Optional[str] = None
@@ -30,8 +77,13 @@ class AgentState(BaseModel):
         "sdk_fixed",
         "tests_fixed",
     ] = "idle"
+    # Condensed failure log; the complete one is on disk at `error_log_path`
     error: Optional[str] = None
+    error_log_path: Optional[str] = None
     error_analysis: Dict = Field(default_factory=dict)
+    test_report: Optional[TestRunReport] = None
+    # Wall time of the last full-suite run, to estimate what failing-first re-runs save
+    full_suite_duration: float = 0.0
 
     sdk_code: Optional[str] = ""
     test_code: Optional[str] = ""
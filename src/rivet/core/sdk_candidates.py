@@ -0,0 +1,171 @@
+import asyncio
+import copy
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig
+
+from rivet.core.inference import (
+    CHARS_PER_TOKEN,
+    DEFAULT_COMPLETION_ESTIMATE,
+    direct_chat_completion,
+)
+from rivet.core.llm_client import NodeLLMSettings, estimate_cost
+from rivet.utils.code_cleaner import CodeStreamGuard, clean_code
+from rivet.utils.metrics import run_metrics
+
+logger = logging.getLogger(__name__)
+
+NODE = "generate_sdk"
+# Temperatures tried by candidates 2..n when no explicit variants are configured
+DEFAULT_TEMPERATURES = (0.2, 0.5, 0.8, 1.0)
+
+# Returns why a candidate is unusable, or None if it can go forward
+CandidateCheck = Callable[[str], Awaitable[Optional[str]]]
+
+
+@dataclass(frozen=True)
+class CandidateSettings:
+    """Speculative SDK generation: race `count` completions, keep the first valid one"""
+
+    count: int = 1  # 1 disables speculation
+    variants: Tuple[Dict[str, Any], ...] = field(default_factory=tuple)
+    max_cost_usd: Optional[float] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[RunnableConfig] = None) -> "CandidateSettings":
+        params = (config or {}).get("configurable", {})
+        max_cost = params.get("sdk_candidates_max_cost_usd")
+        return cls(
+            count=max(int(params.get("sdk_candidates") or cls.count), 1),
+            variants=tuple(params.get("sdk_candidate_variants") or ()),
+            max_cost_usd=float(max_cost) if max_cost is not None else None,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.count > 1
+
+    def variant(self, index: int) -> Dict[str, Any]:
+        """Model/temperature overrides of candidate `index`; the first runs as configured"""
+        if index < len(self.variants):
+            return dict(self.variants[index])
+        if index == 0:
+            return {}
+        return {"temperature": DEFAULT_TEMPERATURES[(index - 1) % len(DEFAULT_TEMPERATURES)]}
+
+
+def _candidate_config(
+    config: RunnableConfig, index: int, variant: Dict[str, Any]
+) -> RunnableConfig:
+    if index == 0 and not variant:
+        return config
+    candidate = copy.copy(config)
+    params = dict(config.get("configurable", {}))
+    if variant:
+        nodes = dict(params.get("llm_nodes") or {})
+        nodes[NODE] = {**(nodes.get(NODE) or {}), **variant}
+        params["llm_nodes"] = nodes
+    if index > 0:
+        # Candidates may send identical requests at once: each replays its own answers
+        params["llm_cache_stream"] = f"candidate{index}"
+    candidate["configurable"] = params
+    return candidate
+
+
+def _worst_case_cost(config: RunnableConfig, prompt_chars: int) -> Optional[float]:
+    route = NodeLLMSettings.from_config(config, NODE)
+    return estimate_cost(
+        config,
+        route.model,
+        prompt_chars // CHARS_PER_TOKEN,
+        route.max_tokens or DEFAULT_COMPLETION_ESTIMATE,
+    )
+
+
+def _affordable(
+    settings: CandidateSettings, configs: List[RunnableConfig], prompt_chars: int
+) -> List[RunnableConfig]:
+    """Drop candidates whose worst-case cost would push the total over the ceiling"""
+    if settings.max_cost_usd is None:
+        return configs
+    kept, budget = [], settings.max_cost_usd
+    for index, candidate in enumerate(configs):
+        cost = _worst_case_cost(candidate, prompt_chars)
+        if cost is None:
+            kept.append(candidate)  # No price configured: nothing to hold it against
+            continue
+        if index > 0 and cost > budget:
+            continue
+        kept.append(candidate)
+        budget -= cost
+    return kept
+
+
+async def generate_sdk_candidates(
+    config: RunnableConfig,
+    sys_msg_content: str,
+    usr_msg_content: str,
+    check: CandidateCheck,
+) -> Optional[str]:
+    """
+    Request several SDK completions at once (varying temperature or model) and return the
+    first one that passes `check`, cancelling the rest. The first candidate always runs and
+    streams to the TUI; the others are speculative and only run within the cost ceiling.
+    If none passes, the first non-empty candidate is returned for the usual fix loop.
+    """
+    settings = CandidateSettings.from_config(config)
+    configs = [_candidate_config(config, i, settings.variant(i)) for i in range(settings.count)]
+    configs = _affordable(settings, configs, len(sys_msg_content) + len(usr_msg_content))
+    if len(configs) < settings.count:
+        logger.info(f"💸 Cost ceiling allows {len(configs)} of {settings.count} SDK candidates")
+
+    async def run(index: int, candidate: RunnableConfig) -> Tuple[int, str]:
+        raw = await direct_chat_completion(
+            config=candidate,
+            sys_msg_content=sys_msg_content,
+            usr_msg_content=usr_msg_content,
+            stream_title="Generating SDK Code" if index == 0 else None,
+            guard=CodeStreamGuard,
+            node=NODE,
+            priority=None if index == 0 else "speculative",
+        )
+        return index, clean_code(raw)
+
+    logger.info(f"🏁 Generating {len(configs)} SDK candidates concurrently...")
+    run_metrics.incr("sdk.candidates.launched", len(configs))
+    tasks = [asyncio.create_task(run(i, c)) for i, c in enumerate(configs)]
+    fallback: Optional[str] = None
+    errors: List[Exception] = []
+    try:
+        for finished in asyncio.as_completed(tasks):
+            try:
+                index, code = await finished
+            except Exception as e:
+                logger.warning(f"⚠️ SDK candidate failed: {str(e)}")
+                errors.append(e)
+                continue
+            if not code:
+                continue
+
+            problem = await check(code)
+            if problem is None:
+                logger.info(f"✅ SDK candidate {index + 1}/{len(configs)} passed validation")
+                run_metrics.incr("sdk.candidates.accepted")
+                return code
+
+            logger.warning(f"⚠️ SDK candidate {index + 1} rejected: {problem}")
+            run_metrics.incr("sdk.candidates.rejected")
+            if fallback is None or index == 0:
+                fallback = code
+        if fallback is None and errors:
+            raise errors[0]
+        return fallback
+    finally:
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            run_metrics.incr("sdk.candidates.cancelled", len(pending))
+            await asyncio.gather(*pending, return_exceptions=True)
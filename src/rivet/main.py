@@ -1,19 +1,27 @@
 import asyncio
 import logging
 import os
+import time
+from typing import Any, Dict
 
 import typer
 from rich.console import Console
 from rich.live import Live
 from rich.prompt import Prompt
 
-from rivet.cli.render import update_on_event
+from rivet.cli.render import render_run_summary, update_on_event, update_on_output
 from rivet.cli.ui import create_layout
-from rivet.core.agent import build_graph
+from rivet.core.agent import DEFAULT_FIX_MODE, FIX_MODES, build_graph
+from rivet.core.llm_cache import CACHE_MODES, DEFAULT_CACHE_MODE, begin_llm_cache_run
+from rivet.core.llm_client import close_llm_clients
 from rivet.core.schema import AgentState
+from rivet.tools.sandbox import SANDBOX_BACKENDS, prewarm_sandbox, shutdown_sandbox
+from rivet.tools.slicer import DEFAULT_SLICE_MODE, SLICE_MODES
 from rivet.tools.url_processor import check_url_validity
-from rivet.utils.config import CREDENTIALS_FILE, get_llm_credentials
+from rivet.utils.config import CREDENTIALS_FILE, get_llm_credentials, get_llm_routing
 from rivet.utils.logging import setup_logging
+from rivet.utils.metrics import run_metrics
+from rivet.utils.run_report import build_run_report, write_run_report
 
 app = typer.Typer(no_args_is_help=True)
 console = Console()
@@ -28,15 +36,98 @@ def generate(
     ),
     output: str = typer.Option("./output", help="Save directory"),
     verbose: bool = typer.Option(False, "--verbose", "-v", help="Show debug logs in console"),
+    sandbox: str = typer.Option(
+        "docker", "--sandbox", help=f"Sandbox backend for running tests {SANDBOX_BACKENDS}"
+    ),
+    pool_size: int = typer.Option(
+        2, "--pool-size", help="Number of warm sandbox containers to keep ready"
+    ),
+    wheelhouse: str = typer.Option(
+        None, "--wheelhouse", help="Local wheel directory used to build the sandbox image offline"
+    ),
+    workers: int = typer.Option(
+        1, "--workers", help="Run the tests in this many parallel shards (capped by CPU cores)"
+    ),
+    timeout: float = typer.Option(
+        300, "--timeout", help="Seconds a sandboxed test run may take before it is killed"
+    ),
+    llm_cache: str = typer.Option(
+        DEFAULT_CACHE_MODE, "--llm-cache", help=f"LLM response cache mode {CACHE_MODES}"
+    ),
+    llm_cache_dir: str = typer.Option(
+        None, "--llm-cache-dir", help="Directory of the LLM cache (e.g. a recorded run to replay)"
+    ),
+    llm_rpm: float = typer.Option(
+        None, "--llm-rpm", help="Provider limit on LLM requests per minute (default: none)"
+    ),
+    llm_tpm: float = typer.Option(
+        None, "--llm-tpm", help="Provider limit on LLM tokens per minute (default: none)"
+    ),
+    sdk_candidates: int = typer.Option(
+        1,
+        "--sdk-candidates",
+        help="Generate this many SDK candidates at once, keep the first valid",
+    ),
+    sdk_candidates_max_cost: float = typer.Option(
+        None, "--sdk-candidates-max-cost", help="USD ceiling for one round of SDK candidates"
+    ),
+    fix_mode: str = typer.Option(
+        DEFAULT_FIX_MODE, "--fix-mode", help=f"How fixes are returned by the LLM {FIX_MODES}"
+    ),
+    slice_mode: str = typer.Option(
+        DEFAULT_SLICE_MODE, "--slice-mode", help=f"How endpoints are picked for --req {SLICE_MODES}"
+    ),
+    slice_cache: bool = typer.Option(
+        True, "--slice-cache/--no-slice-cache", help="Reuse earlier slices of the same spec"
+    ),
 ):
     log_path = setup_logging(verbose)
     logger.info(f"🚀 Rivet started. Logs: {log_path}")
 
     os.makedirs(output, exist_ok=True)
-    asyncio.run(async_generate(url, requirement, output))
+    if sandbox not in SANDBOX_BACKENDS:
+        raise typer.BadParameter(
+            f"Choose one of: {', '.join(SANDBOX_BACKENDS)}", param_hint="--sandbox"
+        )
+
+    if llm_cache not in CACHE_MODES:
+        raise typer.BadParameter(
+            f"Choose one of: {', '.join(CACHE_MODES)}", param_hint="--llm-cache"
+        )
+
+    if fix_mode not in FIX_MODES:
+        raise typer.BadParameter(f"Choose one of: {', '.join(FIX_MODES)}", param_hint="--fix-mode")
+
+    if slice_mode not in SLICE_MODES:
+        raise typer.BadParameter(
+            f"Choose one of: {', '.join(SLICE_MODES)}", param_hint="--slice-mode"
+        )
+
+    run_options = {
+        "sandbox_backend": sandbox,
+        "sandbox_pool_size": pool_size,
+        "sandbox_wheelhouse": wheelhouse,
+        "sandbox_workers": workers,
+        "sandbox_timeout": timeout,
+        "llm_cache_mode": llm_cache,
+        "llm_cache_dir": llm_cache_dir,
+        "llm_rpm": llm_rpm,
+        "llm_tpm": llm_tpm,
+        "sdk_candidates": sdk_candidates,
+        "sdk_candidates_max_cost_usd": sdk_candidates_max_cost,
+        "fix_mode": fix_mode,
+        "slice_mode": slice_mode,
+        "slice_cache": slice_cache,
+    }
+    asyncio.run(async_generate(url, requirement, output, run_options))
 
 
-async def async_generate(url: str, requirement: str, output: str):
+async def async_generate(
+    url: str,
+    requirement: str,
+    output: str,
+    run_options: Dict[str, Any] | None = None,
+):
     llm_base_url, llm_api_key, llm_name = get_llm_credentials()
     console.print(
         f"[dim]💡 LLM configuration stored at {CREDENTIALS_FILE}. Check that file to change the configurations.[/dim]"
@@ -70,8 +161,10 @@ async def async_generate(url: str, requirement: str, output: str):
             "llm_api_key": llm_api_key,
             "llm_base_url": llm_base_url,
             "llm_name": llm_name,
+            **get_llm_routing(),
             "user_id": "local_user",
             "output_dir": output,
+            **(run_options or {}),
         },
     }
 
@@ -82,9 +175,45 @@ async def async_generate(url: str, requirement: str, output: str):
 
     logger.info(f"Starting the agent with state: {initial_state.model_dump_json(indent=2)}")
 
-    with Live(layout, refresh_per_second=4, console=console):
-        async for event in graph.astream(initial_state, config=run_config):
-            update_on_event(layout, event)
+    run_metrics.reset()
+    begin_llm_cache_run()
+
+    started = time.monotonic()
+    # Boot the sandbox containers while the SDK is still being generated
+    prewarm_sandbox(run_config)
+
+    final_status = None
+    try:
+        with Live(layout, refresh_per_second=4, console=console):
+            async for mode, event in graph.astream(
+                initial_state, config=run_config, stream_mode=["updates", "custom"]
+            ):
+                if mode == "custom":
+                    update_on_output(layout, event)
+                    continue
+                update_on_event(layout, event)
+                for update in event.values():
+                    if isinstance(update, dict) and update.get("status"):
+                        final_status = update["status"]
+    finally:
+        await close_llm_clients()
+        sandbox_stats = shutdown_sandbox()
+        for backend, stats in sandbox_stats.items():
+            if stats:
+                logger.info(f"🧪 Sandbox ({backend}) stats: {stats}")
+                summary = ", ".join(f"{k}={v:g}" for k, v in stats.items())
+                console.print(f"[dim]🧪 Sandbox ({backend}): {summary}[/dim]")
+
+        report = build_run_report(
+            final_status, time.monotonic() - started, sandbox_stats, run_config
+        )
+        console.print(render_run_summary(report))
+        saved = report["tests"]["time_saved_s"]
+        if saved:
+            console.print(f"[dim]🎯 Failing-first re-runs saved ~{saved:.1f}s of test time[/dim]")
+        path = write_run_report(output, report)
+        if path:
+            console.print(f"[dim]📊 Run report saved to {path}[/dim]")
 
     console.print(f"[bold green]Done! SDK saved to: {output}[/bold green]")
 
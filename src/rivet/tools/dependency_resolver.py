@@ -0,0 +1,110 @@
+import ast
+import logging
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
+
+from rivet.tools.sandbox_image import normalize_packages
+
+logger = logging.getLogger(__name__)
+
+# Top-level import names whose PyPI distribution is called something else. Any other
+# import is installed under its own name; it is unresolvable only if that install fails.
+IMPORT_TO_DIST: Dict[str, str] = {
+    "attr": "attrs",
+    "bs4": "beautifulsoup4",
+    "Crypto": "pycryptodome",
+    "cv2": "opencv-python",
+    "dateutil": "python-dateutil",
+    "dns": "dnspython",
+    "dotenv": "python-dotenv",
+    "jose": "python-jose",
+    "jwt": "pyjwt",
+    "magic": "python-magic",
+    "multipart": "python-multipart",
+    "OpenSSL": "pyopenssl",
+    "PIL": "pillow",
+    "serial": "pyserial",
+    "sklearn": "scikit-learn",
+    "yaml": "pyyaml",
+}
+
+# Files the sandbox writes itself, importable without installing anything
+LOCAL_MODULES = {"client", "test_client", "conftest"}
+
+
+class UnresolvedImportError(Exception):
+    """Raised before pytest runs when generated code imports something we cannot install"""
+
+    def __init__(self, modules: Dict[str, List[str]], details: str = ""):
+        self.modules = modules  # Module name -> files importing it
+        self.details = details
+        names = ", ".join(f"'{m}' ({', '.join(files)})" for m, files in sorted(modules.items()))
+        super().__init__(f"Cannot install imported modules: {names}")
+
+
+@dataclass
+class DependencyPlan:
+    distributions: Set[str] = field(default_factory=set)
+    # Distribution -> module names that need it, to map install failures back to imports
+    providers: Dict[str, Set[str]] = field(default_factory=dict)
+    imported_by: Dict[str, List[str]] = field(default_factory=dict)
+
+
+def _is_optional_import(node: ast.AST, parents: Dict[ast.AST, ast.AST]) -> bool:
+    """`try: import x / except ImportError:` is a soft dependency, never a hard requirement"""
+    current = node
+    while current in parents:
+        parent = parents[current]
+        if isinstance(parent, ast.Try) and current in parent.body:
+            for handler in parent.handlers:
+                names = []
+                if isinstance(handler.type, ast.Name):
+                    names = [handler.type.id]
+                elif isinstance(handler.type, ast.Tuple):
+                    names = [e.id for e in handler.type.elts if isinstance(e, ast.Name)]
+                if handler.type is None or {"ImportError", "ModuleNotFoundError"} & set(names):
+                    return True
+        current = parent
+    return False
+
+
+def scan_imports(source: str) -> Set[str]:
+    """Top-level module names imported anywhere in `source` (relative imports excluded)"""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        # Leave it to pytest/validate_sdk to report; there is nothing to install for it
+        return set()
+
+    parents = {child: node for node in ast.walk(tree) for child in ast.iter_child_nodes(node)}
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names = [node.module]
+        else:
+            continue
+
+        if _is_optional_import(node, parents):
+            continue
+        modules.update(name.split(".")[0] for name in names)
+    return modules
+
+
+def resolve_dependencies(files: Dict[str, str]) -> DependencyPlan:
+    plan = DependencyPlan()
+    for filename, source in files.items():
+        for module in scan_imports(source):
+            if module in sys.stdlib_module_names or module in LOCAL_MODULES:
+                continue
+            plan.imported_by.setdefault(module, []).append(filename)
+
+    for module, importers in plan.imported_by.items():
+        dist = normalize_packages([IMPORT_TO_DIST.get(module, module)])[0]
+        plan.distributions.add(dist)
+        plan.providers.setdefault(dist, set()).add(module)
+
+    logger.debug(f"📦 Sandbox dependencies: {sorted(plan.distributions)}")
+    return plan
@@ -0,0 +1,63 @@
+import logging
+from typing import Optional
+
+from langchain_core.runnables import RunnableConfig
+
+from rivet.tools.sandbox import get_sandbox_backend
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHECK_TIMEOUT = 15.0
+MODULE_NAME = "client"
+
+# Imports the module and reports why it failed. A dependency that just isn't installed in
+# the sandbox yet says nothing about the SDK (test runs install it), so it passes. Sockets
+# are disabled first: nothing a module does at import time should need the network.
+_IMPORT_SHIM = f"""
+import importlib, os, socket, sys, traceback
+
+def _offline(*args, **kwargs):
+    raise OSError("network access is disabled during the import check")
+
+socket.socket.connect = socket.socket.connect_ex = socket.socket.sendto = _offline
+socket.create_connection = socket.getaddrinfo = _offline
+sys.path.insert(0, os.getcwd())
+try:
+    importlib.import_module("{MODULE_NAME}")
+except ModuleNotFoundError as e:
+    if e.name and e.name.split(".")[0] != "{MODULE_NAME}":
+        sys.exit(0)
+    traceback.print_exc(limit=-1)
+    sys.exit(1)
+except BaseException:
+    traceback.print_exc(limit=-1)
+    sys.exit(1)
+"""
+
+
+def check_import(
+    sdk_code: str,
+    config: Optional[RunnableConfig] = None,
+    timeout: float = IMPORT_CHECK_TIMEOUT,
+) -> Optional[str]:
+    """
+    Import the SDK in the configured sandbox backend, without network access, to catch
+    what a syntax check can't: NameErrors in class bodies, bad decorators, undefined base
+    classes. Returns the last line of the error, or None if the module imports (or the
+    sandbox is unavailable, in which case the test run will find out).
+    """
+    try:
+        backend = get_sandbox_backend(config)
+        result = backend.run_python(
+            {f"{MODULE_NAME}.py": sdk_code}, ["-I", "-c", _IMPORT_SHIM], timeout
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ Import check could not run: {str(e)}")
+        return None
+
+    if result.timed_out:
+        return f"Importing the SDK did not finish within {timeout:.0f}s"
+    if result.exit_code == 0:
+        return None
+    lines = [line for line in result.output.strip().splitlines() if line.strip()]
+    return lines[-1] if lines else f"Import failed with exit code {result.exit_code}"
@@ -1,69 +1,165 @@
 import asyncio
-import io
-import tarfile
+import dataclasses
+import logging
+import threading
 import time
-from typing import Dict, Tuple
+from typing import Dict, List, Optional
 
-import docker
+from langchain_core.runnables import RunnableConfig
 
+from rivet.core.schema import TestRunReport
+from rivet.tools.dependency_resolver import UnresolvedImportError, resolve_dependencies
+from rivet.tools.sandbox_base import (
+    DependencyInstallError,
+    ExecResult,
+    OutputCallback,
+    SandboxBackend,
+    SandboxLimits,
+)
+from rivet.tools.sandbox_docker import DockerSandbox
+from rivet.tools.sandbox_pool import PoolSettings
+from rivet.tools.sandbox_subprocess import SubprocessSandbox, VenvSettings
+from rivet.tools.test_report import merge_reports, parse_junit_report
+from rivet.tools.test_sharding import (
+    collect_units,
+    effective_workers,
+    plan_shards,
+    unit_durations,
+)
+from rivet.utils.metrics import run_metrics
 
-def _create_tar_stream(file_map: Dict[str, str]) -> io.BytesIO:
-    stream = io.BytesIO()
-    with tarfile.open(fileobj=stream, mode="w") as tar:
-        for filename, content in file_map.items():
-            encoded = content.encode("utf-8")
-            info = tarfile.TarInfo(name=filename)
-            info.size = len(encoded)
-            info.mtime = time.time()
-            info.mode = 0o644
-            tar.addfile(info, io.BytesIO(encoded))
-    stream.seek(0)
-    return stream
+logger = logging.getLogger(__name__)
 
+DEFAULT_BACKEND = "docker"
+SANDBOX_BACKENDS = ("docker", "subprocess")
 
-def _run_sync_test(sdk_code: str, test_code: str) -> Tuple[int, str]:
-    client = docker.from_env()
-    container = None
+_backends: Dict[str, SandboxBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def _build_backend(name: str, config: Optional[RunnableConfig]) -> SandboxBackend:
+    limits = SandboxLimits.from_config(config)
+    if name == "docker":
+        settings = PoolSettings.from_config(config)
+        # Every shard leases its own container, so keep enough of them warm
+        workers = effective_workers((config or {}).get("configurable", {}).get("sandbox_workers"))
+        if workers > settings.size:
+            settings = dataclasses.replace(settings, size=workers)
+        return DockerSandbox(settings, limits)
+    if name == "subprocess":
+        return SubprocessSandbox(VenvSettings.from_config(config), limits)
+    raise ValueError(f"Unknown sandbox backend '{name}'. Choose one of: {SANDBOX_BACKENDS}")
+
+
+def get_sandbox_backend(config: Optional[RunnableConfig] = None) -> SandboxBackend:
+    name = (config or {}).get("configurable", {}).get("sandbox_backend") or DEFAULT_BACKEND
+    candidate = _build_backend(name, config)
+
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is not None and (
+            backend.settings == candidate.settings and backend.limits == candidate.limits
+        ):
+            return backend
+        if backend is not None:
+            backend.close()
+        _backends[name] = candidate
+        return candidate
+
+
+def prewarm_sandbox(config: Optional[RunnableConfig] = None):
+    """Start preparing the sandbox while the LLM is still writing the SDK"""
     try:
-        container = client.containers.run(
-            "python:3.11-slim",
-            command="tail -f /dev/null",
-            detach=True,
-            working_dir="/app",
-        )
+        get_sandbox_backend(config).warm()
+    except Exception as e:
+        logger.warning(f"⚠️ Could not pre-warm the sandbox: {str(e)}")
+
+
+def shutdown_sandbox() -> Dict[str, Dict[str, float]]:
+    """Close every backend used in this process and return their stats keyed by name"""
+    with _backends_lock:
+        backends = dict(_backends)
+        _backends.clear()
+    return {name: backend.close() for name, backend in backends.items()}
 
-        files = {
-            "client.py": sdk_code,
-            "test_client.py": test_code,
+
+def _run_sync_test(
+    backend: SandboxBackend,
+    sdk_code: str,
+    test_code: str,
+    node_ids: Optional[List[str]] = None,
+    on_output: Optional[OutputCallback] = None,
+) -> ExecResult:
+    files = {
+        "client.py": sdk_code,
+        "test_client.py": test_code,
+    }
+
+    plan = resolve_dependencies(files)
+    try:
+        return backend.run(files, plan.distributions, node_ids, on_output)
+    except DependencyInstallError as e:
+        # Not booting pytest just to watch it die on the import
+        modules = {
+            module: plan.imported_by[module]
+            for package in e.unavailable
+            for module in plan.providers.get(package, {package})
+            if module in plan.imported_by
         }
-        tar_stream = _create_tar_stream(files)
-        container.put_archive("/app", tar_stream)
+        raise UnresolvedImportError(modules or {p: [] for p in e.unavailable}, e.output) from e
 
-        # NOTE: For installing dependencies, we'll later set it up
-        # to scan imports and install. Keeping it simple for now.
-        install_res = container.exec_run(
-            "pip install requests pydantic pytest httpx pytest-asyncio"
-        )
-        if install_res.exit_code != 0:
-            return 1, f"Dependency installation failed:\n{install_res.output.decode()}"
 
-        test_res = container.exec_run(
-            "python -m pytest test_client.py -v -p asyncio --asyncio-mode=auto"
-        )
-        return test_res.exit_code, test_res.output.decode("utf-8")
+def _to_report(result: ExecResult) -> TestRunReport:
+    return parse_junit_report(
+        result.junit_xml, result.exit_code, result.output, result.duration, result.timed_out
+    )
 
-    except Exception as e:
-        return 1, f"Docker Infrastructure Error: {str(e)}"
 
-    finally:
-        if container:
-            try:
-                container.stop(timeout=1)
-                container.remove()
-            except Exception:
-                pass
+async def run_safe_test(
+    sdk_code: str,
+    test_code: str,
+    config: Optional[RunnableConfig] = None,
+    node_ids: Optional[List[str]] = None,
+    previous: Optional[TestRunReport] = None,
+    on_output: Optional[OutputCallback] = None,
+) -> TestRunReport:
+    """
+    Run the generated tests in the configured sandbox backend and return per-test results.
+    `node_ids` restricts the run to those tests; by default the whole suite runs.
+    With `sandbox_workers` > 1 the tests are sharded over that many parallel sandbox runs,
+    balanced with the per-test durations of the `previous` report, and merged back into one.
+    `on_output` gets pytest's output line by line while it runs (called from worker threads).
+    Raises UnresolvedImportError, without running pytest, if an import cannot be installed.
+    """
+    try:
+        backend = get_sandbox_backend(config)
+    except ValueError as e:
+        return TestRunReport(exit_code=1, logs=f"Sandbox Configuration Error: {str(e)}")
 
+    workers = effective_workers((config or {}).get("configurable", {}).get("sandbox_workers"))
+    shards = []
+    if workers > 1:
+        shards = plan_shards(
+            node_ids or collect_units(test_code), workers, unit_durations(previous)
+        )
 
-async def run_safe_test(sdk_code: str, test_code: str) -> Tuple[bool, str]:
-    exit_code, logs = await asyncio.to_thread(_run_sync_test, sdk_code, test_code)
-    return (exit_code == 0), logs
+    started = time.monotonic()
+    if len(shards) < 2:
+        result = await asyncio.to_thread(
+            _run_sync_test, backend, sdk_code, test_code, node_ids, on_output
+        )
+        run_metrics.observe("sandbox.run", time.monotonic() - started)
+        return _to_report(result)
+
+    logger.info(f"🔀 Running tests in {len(shards)} parallel shards...")
+    results = await asyncio.gather(
+        *(
+            asyncio.to_thread(_run_sync_test, backend, sdk_code, test_code, shard, on_output)
+            for shard in shards
+        )
+    )
+    run_metrics.incr("tests.sharded_runs")
+    for result in results:
+        run_metrics.observe("tests.shard", result.duration)
+    run_metrics.observe("sandbox.run", time.monotonic() - started)
+    return merge_reports([_to_report(r) for r in results], time.monotonic() - started)
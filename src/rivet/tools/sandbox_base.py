@@ -0,0 +1,191 @@
+import codecs
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AbstractSet, Any, Callable, Dict, List, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+from rivet.tools.sandbox_image import normalize_packages
+from rivet.tools.test_report import REPORT_FILE
+from rivet.utils.errors import ErrorAnalyzer
+
+DEFAULT_PACKAGES = ("requests", "pydantic", "pytest", "httpx", "pytest-asyncio")
+
+TEST_FILE = "test_client.py"
+
+PLUGIN_MODULE = "rivet_sandbox_plugin"
+PLUGIN_SOURCE = Path(__file__).with_name("sandbox_plugin.py").read_text(encoding="utf-8")
+
+# Failures that break every test after them, e.g. a lazy import of a missing module
+FATAL_EXCEPTIONS = tuple(ErrorAnalyzer.SDK_FATAL_PATTERNS)
+
+TIMEOUT_EXIT_CODE = 124  # Same code coreutils `timeout` uses
+KILL_GRACE_SECONDS = 5  # Between the polite SIGTERM and the SIGKILL on timeout
+# How pip names a requirement it can't find on the index or in the wheelhouse
+PIP_NOT_FOUND_RE = re.compile(
+    r"(?:No matching distribution found for|versions? that satisfies the requirement) "
+    r"([A-Za-z0-9][A-Za-z0-9._-]*)"
+)
+
+PYTEST_OPTIONS: List[str] = [
+    "-v",
+    "-p",
+    "asyncio",
+    "--asyncio-mode=auto",
+    # One line of source per frame (`client.py:42: in get_pet`) instead of whole functions.
+    # Library frames (httpx, pydantic) are still printed; condense_log collapses them.
+    "--tb=short",
+    f"--junitxml={REPORT_FILE}",
+]
+
+
+# Receives each line of output while the tests are still running
+OutputCallback = Callable[[str], None]
+
+
+def pytest_args(targets: Optional[List[str]] = None, fail_fast: bool = False) -> List[str]:
+    """`python` arguments running pytest on `targets` (node IDs), or on the whole test file"""
+    args = ["-m", "pytest", *(targets or [TEST_FILE]), *PYTEST_OPTIONS, "-p", PLUGIN_MODULE]
+    if fail_fast:
+        args.append(f"--rivet-fail-fast={','.join(FATAL_EXCEPTIONS)}")
+    return args
+
+
+def sandbox_files(files: Dict[str, str]) -> Dict[str, str]:
+    """The generated files plus what the sandbox itself needs next to them"""
+    return {**files, f"{PLUGIN_MODULE}.py": PLUGIN_SOURCE}
+
+
+class OutputStream:
+    """Collects raw output chunks and hands complete lines to a callback as they arrive"""
+
+    def __init__(self, on_output: Optional[OutputCallback] = None):
+        self.on_output = on_output
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._parts: List[str] = []
+        self._pending = ""
+
+    def feed(self, data: bytes):
+        self._emit(self._decoder.decode(data))
+
+    def close(self) -> str:
+        """Flush what is left and return the whole output"""
+        self._emit(self._decoder.decode(b"", final=True))
+        if self._pending and self.on_output:
+            self.on_output(self._pending)
+        self._pending = ""
+        return "".join(self._parts)
+
+    def _emit(self, text: str):
+        if not text:
+            return
+        self._parts.append(text)
+        if self.on_output is None:
+            return
+        *lines, self._pending = (self._pending + text).split("\n")
+        for line in lines:
+            self.on_output(line.rstrip("\r"))
+
+
+class DependencyInstallError(Exception):
+    """Installing the distributions a run needs failed inside the sandbox"""
+
+    def __init__(self, packages: List[str], output: str):
+        self.packages = packages
+        self.output = output
+        super().__init__(f"Failed to install {', '.join(packages)}:\n{output}")
+
+    @property
+    def unavailable(self) -> List[str]:
+        """The packages pip couldn't find, when it says so; all of them otherwise"""
+        named = set(normalize_packages(PIP_NOT_FOUND_RE.findall(self.output)))
+        return [p for p in self.packages if p in named] or self.packages
+
+
+@dataclass
+class ExecResult:
+    exit_code: int
+    output: str
+    junit_xml: Optional[str] = None  # pytest's JUnit report, if it got far enough to write one
+    duration: float = 0.0
+    timed_out: bool = False
+
+
+def timeout_message(seconds: float) -> str:
+    return f"\nSandbox timed out after {seconds:.0f}s"
+
+
+@dataclass(frozen=True)
+class SandboxLimits:
+    """Resource caps applied to every sandboxed pytest run"""
+
+    timeout: float = 300.0  # Wall-clock seconds before the run is killed
+    install_timeout: float = 300.0  # Wall-clock seconds allowed for a pip install
+    cpu_seconds: int = 120
+    cpus: float = 1.0  # CPU quota (cores) for container backends
+    memory_mb: int = 1024
+    file_size_mb: int = 64
+    pids_limit: int = 256  # Fork-bomb guard for container backends
+    network: bool = False  # Let tests reach the network (mocks are expected instead)
+    fail_fast: bool = True  # Stop at the first failure in FATAL_EXCEPTIONS
+
+    @classmethod
+    def from_config(cls, config: Optional[RunnableConfig] = None) -> "SandboxLimits":
+        params = (config or {}).get("configurable", {})
+        return cls(
+            timeout=float(params.get("sandbox_timeout", cls.timeout)),
+            install_timeout=float(params.get("sandbox_install_timeout", cls.install_timeout)),
+            cpu_seconds=int(params.get("sandbox_cpu_seconds", cls.cpu_seconds)),
+            cpus=float(params.get("sandbox_cpus", cls.cpus)),
+            memory_mb=int(params.get("sandbox_memory_mb", cls.memory_mb)),
+            file_size_mb=int(params.get("sandbox_file_size_mb", cls.file_size_mb)),
+            pids_limit=int(params.get("sandbox_pids_limit", cls.pids_limit)),
+            network=bool(params.get("sandbox_network", cls.network)),
+            fail_fast=bool(params.get("sandbox_fail_fast", cls.fail_fast)),
+        )
+
+
+class SandboxBackend(ABC):
+    """A place where the generated SDK and its tests can be executed in isolation"""
+
+    name: str
+    settings: Any
+    limits: SandboxLimits
+
+    @abstractmethod
+    def run(
+        self,
+        files: Dict[str, str],
+        packages: AbstractSet[str] = frozenset(),
+        targets: Optional[List[str]] = None,
+        on_output: Optional[OutputCallback] = None,
+    ) -> ExecResult:
+        """
+        Write `files` into a clean working dir, make sure `packages` are installed
+        and run pytest on `targets` (node IDs), or on the whole suite when not given.
+        pytest's output is passed line by line to `on_output` while it runs.
+        Raises DependencyInstallError if a missing package cannot be installed.
+        """
+
+    @abstractmethod
+    def run_python(
+        self,
+        files: Dict[str, str],
+        args: List[str],
+        timeout: float,
+        on_output: Optional[OutputCallback] = None,
+    ) -> ExecResult:
+        """
+        Write `files` into a clean working dir and run `python *args` there, with the same
+        isolation as the tests and never with network access. Nothing is installed.
+        Raises if the sandbox itself is unavailable.
+        """
+
+    def warm(self):
+        """Prepare anything slow (images, venvs, containers) ahead of the first run"""
+
+    def close(self) -> Dict[str, float]:
+        """Release held resources and return backend stats for the run summary"""
+        return {}
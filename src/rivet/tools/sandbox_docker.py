@@ -0,0 +1,263 @@
+import hashlib
+import io
+import logging
+import tarfile
+import threading
+import time
+from typing import AbstractSet, Dict, List, Optional, Tuple
+
+import docker
+
+from rivet.tools.sandbox_base import (
+    KILL_GRACE_SECONDS,
+    TIMEOUT_EXIT_CODE,
+    DependencyInstallError,
+    ExecResult,
+    OutputCallback,
+    OutputStream,
+    SandboxBackend,
+    SandboxLimits,
+    pytest_args,
+    sandbox_files,
+    timeout_message,
+)
+from rivet.tools.sandbox_image import normalize_packages
+from rivet.tools.sandbox_pool import WORKDIR, PooledContainer, PoolSettings, SandboxPool
+from rivet.tools.test_report import REPORT_FILE
+from rivet.utils.metrics import run_metrics
+
+logger = logging.getLogger(__name__)
+
+OOM_EXIT_CODE = 137  # SIGKILL, which is what the kernel OOM killer sends
+
+
+def _create_tar_stream(file_map: Dict[str, str]) -> io.BytesIO:
+    stream = io.BytesIO()
+    with tarfile.open(fileobj=stream, mode="w") as tar:
+        for filename, content in file_map.items():
+            encoded = content.encode("utf-8")
+            info = tarfile.TarInfo(name=filename)
+            info.size = len(encoded)
+            info.mtime = time.time()
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(encoded))
+    stream.seek(0)
+    return stream
+
+
+def _push_changed_files(pooled: PooledContainer, file_map: Dict[str, str]):
+    hashes = {
+        name: hashlib.sha256(content.encode("utf-8")).hexdigest()
+        for name, content in file_map.items()
+    }
+    changed = {
+        name: file_map[name] for name, h in hashes.items() if pooled.file_hashes.get(name) != h
+    }
+    if not changed:
+        return
+
+    pooled.container.put_archive(WORKDIR, _create_tar_stream(changed))
+    pooled.file_hashes.update({name: hashes[name] for name in changed})
+    logger.debug(f"📦 Pushed {sorted(changed)} to sandbox {pooled.container.short_id}")
+
+
+def _read_file(pooled: PooledContainer, path: str) -> Optional[str]:
+    try:
+        chunks, _ = pooled.container.get_archive(path)
+    except docker.errors.NotFound:
+        return None
+
+    stream = io.BytesIO(b"".join(chunks))
+    with tarfile.open(fileobj=stream, mode="r") as tar:
+        member = tar.next()
+        extracted = tar.extractfile(member) if member else None
+        return extracted.read().decode("utf-8", errors="replace") if extracted else None
+
+
+def _exec(
+    pooled: PooledContainer,
+    cmd: List[str],
+    timeout: float,
+    on_output: Optional[OutputCallback] = None,
+) -> Tuple[int, str, bool]:
+    """
+    Streaming exec with a deadline: `timeout` inside the container stops the command, and a
+    host-side guard kills the whole container if even that does not return.
+    Output lines go to `on_output` as they arrive. Returns (code, output, timed_out).
+    """
+    expired = threading.Event()
+
+    def _kill():
+        expired.set()
+        logger.warning(f"⚠️ Sandbox {pooled.container.short_id} unresponsive, killing it")
+        try:
+            pooled.container.kill()
+        except Exception:
+            pass
+
+    guard = threading.Timer(timeout + 2 * KILL_GRACE_SECONDS, _kill)
+    guard.daemon = True
+    guard.start()
+    wrapped = ["timeout", "-k", str(KILL_GRACE_SECONDS), f"{timeout:.0f}", *cmd]
+    # exec_run buffers everything until the command exits, so use the low-level API
+    api = pooled.container.client.api
+    stream = OutputStream(on_output)
+    try:
+        exec_id = api.exec_create(pooled.container.id, wrapped)["Id"]
+        for chunk in api.exec_start(exec_id, stream=True):
+            stream.feed(chunk)
+        exit_code = api.exec_inspect(exec_id)["ExitCode"]
+    except Exception:
+        if expired.is_set():
+            return TIMEOUT_EXIT_CODE, stream.close(), True
+        raise
+    finally:
+        guard.cancel()
+
+    output = stream.close()
+    if expired.is_set() or exit_code == TIMEOUT_EXIT_CODE:
+        return TIMEOUT_EXIT_CODE, output, True
+    return exit_code, output, False
+
+
+def _install_missing(
+    pool: SandboxPool, pooled: PooledContainer, packages: AbstractSet[str], limits: SandboxLimits
+):
+    missing = sorted(set(normalize_packages(packages)) - pooled.installed)
+    if not missing:
+        return
+
+    # The image sets PIP_NO_INDEX/PIP_FIND_LINKS when it was built from a wheelhouse
+    pool.set_network(pooled, True)
+    exit_code, output, timed_out = _exec(
+        pooled, ["pip", "install", "--quiet", "--no-cache-dir", *missing], limits.install_timeout
+    )
+    if timed_out:
+        raise RuntimeError(f"Installing {missing} took longer than {limits.install_timeout:.0f}s")
+    if exit_code != 0:
+        raise DependencyInstallError(missing, output)
+
+    pooled.installed.update(missing)
+    run_metrics.incr("sandbox.deps.installed", len(missing))
+    logger.debug(f"📦 Installed {missing} in sandbox {pooled.container.short_id}")
+
+
+class DockerSandbox(SandboxBackend):
+    """Runs pytest inside pooled containers of the prebuilt sandbox image"""
+
+    name = "docker"
+
+    def __init__(self, settings: PoolSettings, limits: SandboxLimits):
+        self.settings = settings
+        self.limits = limits
+        self._pool = None
+
+    @property
+    def pool(self) -> SandboxPool:
+        # docker.from_env() is deferred so merely selecting the backend never fails
+        if self._pool is None:
+            self._pool = SandboxPool(self.settings, self.limits)
+        return self._pool
+
+    def run(
+        self,
+        files: Dict[str, str],
+        packages: AbstractSet[str] = frozenset(),
+        targets: Optional[List[str]] = None,
+        on_output: Optional[OutputCallback] = None,
+    ) -> ExecResult:
+        try:
+            pool = self.pool
+            pooled = pool.acquire()
+        except Exception as e:
+            return ExecResult(1, f"Docker Infrastructure Error: {str(e)}")
+
+        healthy = True
+        try:
+            pool.reset(pooled)
+            _install_missing(pool, pooled, packages, self.limits)
+            _push_changed_files(pooled, sandbox_files(files))
+            if not self.limits.network:
+                pool.set_network(pooled, False)
+
+            started = time.monotonic()
+            exit_code, output, timed_out = _exec(
+                pooled,
+                ["python", *pytest_args(targets, self.limits.fail_fast)],
+                self.limits.timeout,
+                on_output,
+            )
+            duration = time.monotonic() - started
+
+            if timed_out:
+                # Whatever the tests spawned may still be running: never reuse this container
+                healthy = False
+                run_metrics.incr("sandbox.timeouts")
+                return ExecResult(
+                    TIMEOUT_EXIT_CODE,
+                    output + timeout_message(self.limits.timeout),
+                    duration=duration,
+                    timed_out=True,
+                )
+
+            if exit_code == OOM_EXIT_CODE:
+                output += (
+                    f"\nSandbox process was killed, most likely for exceeding the "
+                    f"{self.limits.memory_mb} MB memory limit"
+                )
+            return ExecResult(
+                exit_code=exit_code,
+                output=output,
+                junit_xml=_read_file(pooled, f"{WORKDIR}/{REPORT_FILE}"),
+                duration=duration,
+            )
+
+        except DependencyInstallError:
+            raise
+
+        except Exception as e:
+            healthy = False
+            return ExecResult(1, f"Docker Infrastructure Error: {str(e)}")
+
+        finally:
+            pool.release(pooled, healthy=healthy)
+
+    def run_python(
+        self,
+        files: Dict[str, str],
+        args: List[str],
+        timeout: float,
+        on_output: Optional[OutputCallback] = None,
+    ) -> ExecResult:
+        pool = self.pool
+        pooled = pool.acquire()
+        healthy = True
+        try:
+            pool.reset(pooled)
+            _push_changed_files(pooled, files)
+            pool.set_network(pooled, False)
+
+            started = time.monotonic()
+            exit_code, output, timed_out = _exec(pooled, ["python", *args], timeout, on_output)
+            healthy = not timed_out
+            if timed_out:
+                output += timeout_message(timeout)
+            return ExecResult(
+                exit_code, output, duration=time.monotonic() - started, timed_out=timed_out
+            )
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            pool.release(pooled, healthy=healthy)
+
+    def warm(self):
+        self.pool.warm()
+
+    def close(self) -> Dict[str, float]:
+        if self._pool is None:
+            return {}
+        stats = self._pool.stats()
+        self._pool.shutdown()
+        self._pool = None
+        return stats
@@ -0,0 +1,164 @@
+import hashlib
+import io
+import json
+import logging
+import re
+import tarfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import docker
+import platformdirs
+
+logger = logging.getLogger(__name__)
+
+IMAGE_REPO = "rivet-sandbox"
+DEFAULT_WHEELHOUSE = Path(platformdirs.user_cache_dir("rivet")) / "wheelhouse"
+IMAGE_WHEELHOUSE = "/wheels"
+# `python:3.11-slim`, `docker.io/library/python:3.12` -> the interpreter the image ships
+BASE_PYTHON_RE = re.compile(r"(?:^|/)python:(\d+)\.(\d+)")
+
+_build_lock = threading.Lock()
+
+
+def normalize_packages(packages: Iterable[str]) -> List[str]:
+    # PEP 503 normalization, so "Pytest_Asyncio" and "pytest-asyncio" hash the same
+    return sorted({re.sub(r"[-_.]+", "-", p.strip()).lower() for p in packages if p.strip()})
+
+
+def resolve_wheelhouse(wheelhouse: Optional[str] = None) -> Optional[Path]:
+    """Explicit wheelhouse first, then the default cache dir. None means install from PyPI."""
+    path = Path(wheelhouse).expanduser() if wheelhouse else DEFAULT_WHEELHOUSE
+    if path.is_dir() and any(path.glob("*.whl")):
+        return path
+    if wheelhouse:
+        logger.warning(f"⚠️ Wheelhouse {path} has no wheels, falling back to PyPI")
+    return None
+
+
+def image_tag(base_image: str, packages: Iterable[str], wheelhouse: Optional[Path] = None) -> str:
+    key = {
+        "base_image": base_image,
+        "packages": normalize_packages(packages),
+        # The wheels decide which versions end up installed, so they are part of the key
+        "wheels": sorted(p.name for p in wheelhouse.glob("*.whl")) if wheelhouse else None,
+    }
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+    return f"{IMAGE_REPO}:{digest[:16]}"
+
+
+def _wheel_supports(wheel: str, version: Tuple[int, int]) -> bool:
+    """Whether a wheel's filename tags can install on CPython `version` under Linux"""
+    parts = wheel[: -len(".whl")].split("-")
+    if len(parts) < 5:
+        return True  # Not a tagged name; let pip decide
+    python_tags, abi_tags, platform_tags = (tag.split(".") for tag in parts[-3:])
+    if not any(p == "any" or p.startswith(("linux", "manylinux")) for p in platform_tags):
+        return False
+    for tag in python_tags:
+        match = re.fullmatch(r"(py|cp)(\d)(\d*)", tag)
+        if not match or int(match.group(2)) != version[0]:
+            continue
+        minor = int(match.group(3)) if match.group(3) else None
+        if minor is None and match.group(1) == "py":
+            return True
+        if minor == version[1] or (
+            "abi3" in abi_tags and minor is not None and minor <= version[1]
+        ):
+            return True
+    return False
+
+
+def _check_wheelhouse(base_image: str, wheelhouse: Path):
+    """Fail before the build if a package only has wheels the base image can't install"""
+    match = BASE_PYTHON_RE.search(base_image)
+    if not match:
+        return  # Unknown interpreter; the build will tell
+    version = (int(match.group(1)), int(match.group(2)))
+    usable: Dict[str, bool] = {}
+    for wheel in wheelhouse.glob("*.whl"):
+        name = normalize_packages([wheel.name.split("-")[0]])[0]
+        usable[name] = usable.get(name, False) or _wheel_supports(wheel.name, version)
+    unusable = sorted(name for name, ok in usable.items() if not ok)
+    if unusable:
+        raise RuntimeError(
+            f"Wheelhouse {wheelhouse} has no Python {version[0]}.{version[1]} Linux wheels for "
+            f"{', '.join(unusable)} (the sandbox runs {base_image}). Download them with "
+            f"`pip download --python-version {version[0]}.{version[1]} "
+            f"--platform manylinux2014_x86_64 --only-binary=:all: -d {wheelhouse} ...`"
+        )
+
+
+def _dockerfile(base_image: str, packages: List[str], wheelhouse: Optional[Path]) -> str:
+    lines = [
+        f"FROM {base_image}",
+        "ENV PIP_DISABLE_PIP_VERSION_CHECK=1 PYTHONDONTWRITEBYTECODE=1",
+    ]
+    if wheelhouse:
+        # Kept inside the image so later installs can stay offline too
+        lines += [
+            f"COPY wheelhouse {IMAGE_WHEELHOUSE}",
+            f"ENV PIP_NO_INDEX=1 PIP_FIND_LINKS={IMAGE_WHEELHOUSE}",
+        ]
+    lines += [
+        f"RUN pip install --no-cache-dir {' '.join(packages)}",
+        "WORKDIR /app",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def _build_context(dockerfile: str, wheelhouse: Optional[Path]) -> io.BytesIO:
+    stream = io.BytesIO()
+    with tarfile.open(fileobj=stream, mode="w") as tar:
+        encoded = dockerfile.encode("utf-8")
+        info = tarfile.TarInfo(name="Dockerfile")
+        info.size = len(encoded)
+        info.mtime = time.time()
+        tar.addfile(info, io.BytesIO(encoded))
+
+        if wheelhouse:
+            for wheel in sorted(wheelhouse.glob("*.whl")):
+                tar.add(wheel, arcname=f"wheelhouse/{wheel.name}")
+    stream.seek(0)
+    return stream
+
+
+def ensure_sandbox_image(
+    client: "docker.DockerClient",
+    base_image: str,
+    packages: Iterable[str],
+    wheelhouse: Optional[str] = None,
+) -> str:
+    """
+    Return the tag of a local image with `packages` preinstalled, building it on first use.
+    Builds from a local wheelhouse need no network access at all, provided `base_image` is
+    already pulled and the wheels match its Python version.
+    """
+    packages = normalize_packages(packages)
+    wheel_dir = resolve_wheelhouse(wheelhouse)
+    tag = image_tag(base_image, packages, wheel_dir)
+
+    with _build_lock:
+        try:
+            client.images.get(tag)
+            logger.debug(f"🐳 Using cached sandbox image {tag}")
+            return tag
+        except docker.errors.ImageNotFound:
+            pass
+
+        if wheel_dir:
+            _check_wheelhouse(base_image, wheel_dir)
+        source = f"wheelhouse {wheel_dir}" if wheel_dir else "PyPI"
+        logger.info(f"🏗️ Building sandbox image {tag} from {source} (one-time)...")
+        started = time.monotonic()
+        client.images.build(
+            fileobj=_build_context(_dockerfile(base_image, packages, wheel_dir), wheel_dir),
+            custom_context=True,
+            tag=tag,
+            rm=True,
+            labels={"rivet.packages": ",".join(packages)},
+        )
+        logger.info(f"✅ Sandbox image {tag} built in {time.monotonic() - started:.1f}s")
+        return tag
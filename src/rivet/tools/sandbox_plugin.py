@@ -0,0 +1,37 @@
+"""
+pytest plugin shipped into the sandbox next to the generated files (never imported by Rivet).
+
+With `--rivet-fail-fast=SyntaxError,ImportError,...` the session stops at the first test
+failing with one of those exceptions: they break every other test too, so running the
+rest of the suite only delays the fix. The JUnit report is still written.
+"""
+
+import pytest
+
+_session = None
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--rivet-fail-fast",
+        default="",
+        help="Comma separated exception names that stop the session on first failure",
+    )
+
+
+def pytest_sessionstart(session):
+    global _session
+    _session = session
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_runtest_logreport(report):
+    if not report.failed or _session is None:
+        return
+
+    fatal = {name for name in _session.config.getoption("rivet_fail_fast").split(",") if name}
+    crash = getattr(report.longrepr, "reprcrash", None)
+    message = getattr(crash, "message", "") or ""
+    exception = message.split(":", 1)[0].split(".")[-1].strip()
+    if exception in fatal:
+        _session.shouldstop = f"rivet fail-fast: {exception} in {report.nodeid}"
@@ -0,0 +1,259 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+import docker
+from langchain_core.runnables import RunnableConfig
+
+from rivet.tools.sandbox_base import DEFAULT_PACKAGES, SandboxLimits
+from rivet.tools.sandbox_image import ensure_sandbox_image, normalize_packages
+from rivet.utils.metrics import run_metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IMAGE = "python:3.11-slim"
+POOL_LABEL = "rivet.sandbox"
+WORKDIR = "/app"
+NETWORK = "bridge"  # Docker's default network, which new containers join
+
+
+@dataclass
+class PoolSettings:
+    """Tuning knobs for the warm container pool"""
+
+    size: int = 2  # Warm containers kept ready at any time
+    idle_timeout: float = 300.0  # Seconds an unused container may live
+    health_check_interval: float = 30.0  # Seconds between liveness probes
+    image: str = DEFAULT_IMAGE  # Base image the sandbox image is built from
+    packages: Tuple[str, ...] = DEFAULT_PACKAGES
+    wheelhouse: Optional[str] = None  # Local directory of wheels for offline builds
+
+    @classmethod
+    def from_config(cls, config: Optional[RunnableConfig] = None) -> "PoolSettings":
+        params = (config or {}).get("configurable", {})
+        packages = params.get("sandbox_packages") or cls.packages
+        return cls(
+            size=max(0, int(params.get("sandbox_pool_size", cls.size))),
+            idle_timeout=float(params.get("sandbox_idle_timeout", cls.idle_timeout)),
+            health_check_interval=float(
+                params.get("sandbox_health_check_interval", cls.health_check_interval)
+            ),
+            image=params.get("sandbox_image", cls.image),
+            packages=tuple(packages),
+            wheelhouse=params.get("sandbox_wheelhouse"),
+        )
+
+
+@dataclass
+class PooledContainer:
+    container: "docker.models.containers.Container"
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    last_checked: float = field(default_factory=time.monotonic)
+    # sha256 of every file currently sitting in /app, so callers only push what changed
+    file_hashes: Dict[str, str] = field(default_factory=dict)
+    # Normalized distributions installed in this container (image packages + on-demand ones)
+    installed: Set[str] = field(default_factory=set)
+    networked: bool = True
+
+
+class SandboxPool:
+    """
+    Keeps pre-warmed containers of the prebuilt sandbox image, so runs skip the install step.
+    Containers are handed out one run at a time and returned to the pool afterwards.
+    """
+
+    def __init__(self, settings: PoolSettings, limits: Optional[SandboxLimits] = None):
+        self.settings = settings
+        self.limits = limits or SandboxLimits()
+        self._client = docker.from_env()
+        self._image: Optional[str] = None
+        self._idle: List[PooledContainer] = []
+        self._lock = threading.Lock()
+        self._leased = 0
+        self._warming = 0
+        self._closed = False
+
+    # Lifecycle
+
+    def acquire(self) -> PooledContainer:
+        self._evict_idle()
+
+        while True:
+            with self._lock:
+                pooled = self._idle.pop() if self._idle else None
+                if pooled is not None:
+                    self._leased += 1
+            if pooled is None:
+                break
+            if self._is_healthy(pooled):
+                run_metrics.incr("sandbox.pool.hit")
+                return pooled
+            self._discard(pooled)
+
+        run_metrics.incr("sandbox.pool.miss")
+        pooled = self._create()
+        with self._lock:
+            self._leased += 1
+        return pooled
+
+    def release(self, pooled: PooledContainer, healthy: bool = True):
+        pooled.last_used = time.monotonic()
+        with self._lock:
+            self._leased -= 1
+            keep = healthy and not self._closed and self._managed() < self.settings.size
+            if keep:
+                self._idle.append(pooled)
+        if not keep:
+            self._destroy(pooled)
+        self.warm()
+
+    def warm(self):
+        """Top the pool up to `size` containers in the background"""
+        with self._lock:
+            missing = self.settings.size - self._managed()
+            if self._closed or missing <= 0:
+                return
+            self._warming += missing
+
+        for _ in range(missing):
+            threading.Thread(target=self._warm_one, daemon=True).start()
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._destroy(pooled)
+        try:
+            self._client.close()
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            idle = len(self._idle)
+        hits = run_metrics.get("sandbox.pool.hit")
+        misses = run_metrics.get("sandbox.pool.miss")
+        total = hits + misses
+        return {
+            "idle": idle,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+            "evictions": run_metrics.get("sandbox.pool.evicted"),
+            "unhealthy": run_metrics.get("sandbox.pool.unhealthy"),
+        }
+
+    # Container handling
+
+    def reset(self, pooled: PooledContainer):
+        """Wipe everything in /app except the tracked source files (pytest cache, artifacts...)"""
+        keep = " ".join(f"! -name {name}" for name in pooled.file_hashes)
+        res = pooled.container.exec_run(
+            ["sh", "-c", f"find {WORKDIR} -mindepth 1 -maxdepth 1 {keep} -exec rm -rf {{}} +"]
+        )
+        if res.exit_code != 0:
+            raise RuntimeError(f"Failed to reset sandbox: {res.output.decode(errors='replace')}")
+
+    def set_network(self, pooled: PooledContainer, connected: bool):
+        """Attach or detach the container from the network (installs need it, tests don't)"""
+        if pooled.networked == connected:
+            return
+        network = self._client.networks.get(NETWORK)
+        if connected:
+            network.connect(pooled.container)
+        else:
+            network.disconnect(pooled.container)
+        pooled.networked = connected
+
+    def _create(self) -> PooledContainer:
+        if self._image is None:
+            self._image = ensure_sandbox_image(
+                self._client,
+                self.settings.image,
+                self.settings.packages,
+                self.settings.wheelhouse,
+            )
+
+        started = time.monotonic()
+        container = self._client.containers.run(
+            self._image,
+            command="tail -f /dev/null",
+            detach=True,
+            working_dir=WORKDIR,
+            labels={POOL_LABEL: "pool"},
+            mem_limit=f"{self.limits.memory_mb}m",
+            memswap_limit=f"{self.limits.memory_mb}m",  # Same as mem_limit: no swap on top
+            nano_cpus=int(self.limits.cpus * 1e9),
+            pids_limit=self.limits.pids_limit,
+        )
+
+        run_metrics.observe("sandbox.pool.boot", time.monotonic() - started)
+        logger.debug(f"🐳 Sandbox container {container.short_id} warmed up")
+        return PooledContainer(
+            container=container, installed=set(normalize_packages(self.settings.packages))
+        )
+
+    def _warm_one(self):
+        try:
+            pooled = self._create()
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to pre-warm sandbox container: {str(e)}")
+            with self._lock:
+                self._warming -= 1
+            return
+
+        with self._lock:
+            self._warming -= 1
+            keep = not self._closed and self._managed() < self.settings.size
+            if keep:
+                self._idle.append(pooled)
+        if not keep:
+            self._destroy(pooled)
+
+    def _managed(self) -> int:
+        # Caller must hold the lock
+        return len(self._idle) + self._leased + self._warming
+
+    def _discard(self, pooled: PooledContainer):
+        with self._lock:
+            self._leased -= 1
+        self._destroy(pooled)
+
+    def _is_healthy(self, pooled: PooledContainer) -> bool:
+        now = time.monotonic()
+        if now - pooled.last_checked < self.settings.health_check_interval:
+            return True
+        try:
+            pooled.container.reload()
+            healthy = (
+                pooled.container.status == "running"
+                and pooled.container.exec_run("true").exit_code == 0
+            )
+        except Exception:
+            healthy = False
+
+        pooled.last_checked = now
+        if not healthy:
+            run_metrics.incr("sandbox.pool.unhealthy")
+            logger.debug(f"🩺 Sandbox container {pooled.container.short_id} failed health check")
+        return healthy
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [p for p in self._idle if now - p.last_used > self.settings.idle_timeout]
+            self._idle = [p for p in self._idle if p not in expired]
+        for pooled in expired:
+            run_metrics.incr("sandbox.pool.evicted")
+            self._destroy(pooled)
+
+    @staticmethod
+    def _destroy(pooled: PooledContainer):
+        try:
+            pooled.container.remove(force=True)
+        except Exception:
+            pass
@@ -0,0 +1,353 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AbstractSet, Dict, List, Optional, Set, Tuple
+
+import platformdirs
+from langchain_core.runnables import RunnableConfig
+
+from rivet.tools.sandbox_base import (
+    DEFAULT_PACKAGES,
+    TIMEOUT_EXIT_CODE,
+    DependencyInstallError,
+    ExecResult,
+    OutputCallback,
+    OutputStream,
+    SandboxBackend,
+    SandboxLimits,
+    pytest_args,
+    sandbox_files,
+    timeout_message,
+)
+from rivet.tools.sandbox_image import normalize_packages, resolve_wheelhouse
+from rivet.tools.test_report import REPORT_FILE
+from rivet.utils.metrics import run_metrics
+
+logger = logging.getLogger(__name__)
+
+VENV_ROOT = Path(platformdirs.user_cache_dir("rivet")) / "venvs"
+READY_MARKER = ".rivet-ready"
+INSTALLED_FILE = "rivet-installed.json"
+# Nothing listens on the discard port, so requests that honour proxy env vars fail fast
+# instead of hanging on the real network. Mocking libraries intercept before the proxy.
+BLACKHOLE_PROXY = "http://127.0.0.1:9"
+
+# Applies the rlimits inside the child and then becomes pytest. Doing it in a shim rather
+# than `preexec_fn` keeps process creation safe while other threads are running.
+_RLIMIT_SHIM = """
+import os, sys
+try:
+    import resource
+except ImportError:
+    resource = None
+cpu, mem, fsize = (int(v) for v in sys.argv[1:4])
+if resource is not None:
+    for limit, value in (
+        (resource.RLIMIT_CPU, cpu),
+        (resource.RLIMIT_AS, mem),
+        (resource.RLIMIT_FSIZE, fsize),
+    ):
+        if value > 0:
+            resource.setrlimit(limit, (value, value))
+os.execv(sys.executable, [sys.executable, *sys.argv[4:]])
+"""
+
+
+@dataclass(frozen=True)
+class VenvSettings:
+    packages: Tuple[str, ...] = DEFAULT_PACKAGES
+    wheelhouse: Optional[str] = None
+    python: str = sys.executable  # Interpreter the venv is created from
+
+    @classmethod
+    def from_config(cls, config: Optional[RunnableConfig] = None) -> "VenvSettings":
+        params = (config or {}).get("configurable", {})
+        return cls(
+            packages=tuple(params.get("sandbox_packages") or cls.packages),
+            wheelhouse=params.get("sandbox_wheelhouse"),
+            python=params.get("sandbox_python", cls.python),
+        )
+
+
+class SubprocessSandbox(SandboxBackend):
+    """
+    Runs pytest as a local subprocess inside a cached virtualenv.
+    No Docker needed: isolation comes from rlimits, a wall-clock timeout and a throwaway temp dir.
+    """
+
+    name = "subprocess"
+
+    def __init__(self, settings: VenvSettings, limits: SandboxLimits):
+        self.settings = settings
+        self.limits = limits
+        self._venv: Optional[Path] = None
+        self._installed: Set[str] = set()
+        self._lock = threading.Lock()
+
+    # Virtualenv cache
+
+    @property
+    def venv_python(self) -> Path:
+        venv = self._ensure_venv()
+        if os.name == "nt":
+            return venv / "Scripts" / "python.exe"
+        return venv / "bin" / "python"
+
+    def _venv_key(self, wheelhouse: Optional[Path]) -> str:
+        key = {
+            "python": self.settings.python,
+            "version": subprocess.run(
+                [self.settings.python, "-c", "import sys; print(sys.version)"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip(),
+            "packages": normalize_packages(self.settings.packages),
+            "wheels": sorted(p.name for p in wheelhouse.glob("*.whl")) if wheelhouse else None,
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def _ensure_venv(self) -> Path:
+        with self._lock:
+            if self._venv is not None:
+                return self._venv
+
+            wheelhouse = resolve_wheelhouse(self.settings.wheelhouse)
+            venv = VENV_ROOT / self._venv_key(wheelhouse)
+            if (venv / READY_MARKER).exists():
+                run_metrics.incr("sandbox.venv.hit")
+            else:
+                run_metrics.incr("sandbox.venv.miss")
+                self._build_venv(venv, wheelhouse)
+
+            self._venv = venv
+            self._installed = self._load_installed(venv)
+            return venv
+
+    def _load_installed(self, venv: Path) -> Set[str]:
+        try:
+            return set(json.loads((venv / INSTALLED_FILE).read_text()))
+        except (OSError, ValueError):
+            return set(normalize_packages(self.settings.packages))
+
+    def _pip_install(self, python: Path, packages: List[str]) -> subprocess.CompletedProcess:
+        install = [str(python), "-m", "pip", "install", "--quiet", "--no-cache-dir"]
+        wheelhouse = resolve_wheelhouse(self.settings.wheelhouse)
+        if wheelhouse:
+            install += ["--no-index", "--find-links", str(wheelhouse)]
+        return subprocess.run(
+            install + packages,
+            capture_output=True,
+            text=True,
+            timeout=self.limits.install_timeout,
+        )
+
+    def _install_missing(self, packages: AbstractSet[str]):
+        python = self.venv_python
+        with self._lock:
+            missing = sorted(set(normalize_packages(packages)) - self._installed)
+            if not missing:
+                return
+
+            res = self._pip_install(python, missing)
+            if res.returncode != 0:
+                raise DependencyInstallError(missing, f"{res.stdout}{res.stderr}")
+
+            self._installed.update(missing)
+            (self._venv / INSTALLED_FILE).write_text(json.dumps(sorted(self._installed)))
+            run_metrics.incr("sandbox.deps.installed", len(missing))
+            logger.debug(f"📦 Installed {missing} in sandbox virtualenv {self._venv.name}")
+
+    def _build_venv(self, venv: Path, wheelhouse: Optional[Path]):
+        source = f"wheelhouse {wheelhouse}" if wheelhouse else "PyPI"
+        logger.info(f"🏗️ Creating sandbox virtualenv {venv.name} from {source} (one-time)...")
+        started = time.monotonic()
+
+        # Build next to the final location and rename, so a crash never leaves a half venv behind
+        VENV_ROOT.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix=f"{venv.name}-", dir=VENV_ROOT))
+        try:
+            subprocess.run([self.settings.python, "-m", "venv", str(staging)], check=True)
+            python = staging / ("Scripts/python.exe" if os.name == "nt" else "bin/python")
+            packages = normalize_packages(self.settings.packages)
+            res = self._pip_install(python, packages)
+            if res.returncode != 0:
+                raise RuntimeError(f"Dependency installation failed:\n{res.stdout}{res.stderr}")
+
+            (staging / INSTALLED_FILE).write_text(json.dumps(packages))
+            (staging / READY_MARKER).touch()
+            try:
+                staging.rename(venv)
+            except OSError:
+                if (venv / READY_MARKER).exists():
+                    # Another rivet process built it first and may be running from it already
+                    shutil.rmtree(staging, ignore_errors=True)
+                    logger.info(f"✅ Sandbox virtualenv {venv.name} was built by another process")
+                    return
+                # Venvs are only renamed into place complete, so nothing runs from this leftover
+                stale = staging.with_name(f"{staging.name}-stale")
+                venv.rename(stale)
+                shutil.rmtree(stale, ignore_errors=True)
+                staging.rename(venv)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        logger.info(f"✅ Sandbox virtualenv ready in {time.monotonic() - started:.1f}s")
+
+    # Execution
+
+    def _command(self, args: List[str]) -> List[str]:
+        mb = 1024 * 1024
+        return [
+            str(self.venv_python),
+            "-c",
+            _RLIMIT_SHIM,
+            str(self.limits.cpu_seconds),
+            str(self.limits.memory_mb * mb),
+            str(self.limits.file_size_mb * mb),
+            *args,
+        ]
+
+    def _env(self, workdir: str, network: bool = False) -> Dict[str, str]:
+        # Minimal environment: nothing from the host (tokens, proxies...) leaks into the tests
+        env = {
+            "PATH": os.environ.get("PATH", ""),
+            "HOME": workdir,
+            "TMPDIR": workdir,
+            "PYTHONDONTWRITEBYTECODE": "1",
+            "PYTHONUNBUFFERED": "1",
+        }
+        if not network:
+            # Best effort only: a subprocess cannot get its own network namespace unprivileged
+            for var in ("HTTP_PROXY", "HTTPS_PROXY", "ALL_PROXY", "http_proxy", "https_proxy"):
+                env[var] = BLACKHOLE_PROXY
+            env["NO_PROXY"] = env["no_proxy"] = ""
+        return env
+
+    def run(
+        self,
+        files: Dict[str, str],
+        packages: AbstractSet[str] = frozenset(),
+        targets: Optional[List[str]] = None,
+        on_output: Optional[OutputCallback] = None,
+    ) -> ExecResult:
+        try:
+            command = self._command(pytest_args(targets, self.limits.fail_fast))
+        except Exception as e:
+            return ExecResult(1, f"Sandbox Infrastructure Error: {str(e)}")
+
+        try:
+            self._install_missing(packages)
+        except subprocess.TimeoutExpired:
+            return ExecResult(
+                1,
+                f"Sandbox Infrastructure Error: installing {sorted(packages)} took longer "
+                f"than {self.limits.install_timeout:.0f}s",
+            )
+
+        result = self._execute(
+            sandbox_files(files), command, self.limits.timeout, self.limits.network, on_output
+        )
+        if result.timed_out:
+            run_metrics.incr("sandbox.timeouts")
+        return result
+
+    def run_python(
+        self,
+        files: Dict[str, str],
+        args: List[str],
+        timeout: float,
+        on_output: Optional[OutputCallback] = None,
+    ) -> ExecResult:
+        return self._execute(files, self._command(args), timeout, False, on_output)
+
+    def _execute(
+        self,
+        files: Dict[str, str],
+        command: List[str],
+        timeout: float,
+        network: bool,
+        on_output: Optional[OutputCallback] = None,
+    ) -> ExecResult:
+        with tempfile.TemporaryDirectory(prefix="rivet-sandbox-") as workdir:
+            for filename, content in files.items():
+                Path(workdir, filename).write_text(content, encoding="utf-8")
+
+            started = time.monotonic()
+            proc = subprocess.Popen(
+                command,
+                cwd=workdir,
+                env=self._env(workdir, network),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+            stream = OutputStream(on_output)
+            reader = threading.Thread(target=self._pump, args=(proc, stream), daemon=True)
+            reader.start()
+
+            timed_out = False
+            try:
+                exit_code = proc.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self._kill(proc)
+                proc.wait()
+                exit_code, timed_out = TIMEOUT_EXIT_CODE, True
+
+            reader.join()
+            logs = stream.close()
+            if timed_out:
+                logs += timeout_message(timeout)
+
+            report = Path(workdir, REPORT_FILE)
+            return ExecResult(
+                exit_code=exit_code,
+                output=logs,
+                junit_xml=report.read_text(encoding="utf-8") if report.exists() else None,
+                duration=time.monotonic() - started,
+                timed_out=timed_out,
+            )
+
+    @staticmethod
+    def _pump(proc: subprocess.Popen, stream: OutputStream):
+        # read1 returns as soon as anything is available, so lines show up while pytest runs
+        for chunk in iter(lambda: proc.stdout.read1(65536), b""):
+            stream.feed(chunk)
+        proc.stdout.close()
+
+    @staticmethod
+    def _kill(proc: subprocess.Popen):
+        # pytest may have spawned children of its own, so take down the whole session
+        try:
+            if os.name == "nt":
+                proc.kill()
+            else:
+                os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def warm(self):
+        threading.Thread(target=self._warm, daemon=True).start()
+
+    def _warm(self):
+        try:
+            self._ensure_venv()
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to prepare sandbox virtualenv: {str(e)}")
+
+    def close(self) -> Dict[str, float]:
+        return {
+            "venv_hits": run_metrics.get("sandbox.venv.hit"),
+            "venv_misses": run_metrics.get("sandbox.venv.miss"),
+        }
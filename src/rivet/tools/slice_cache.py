@@ -0,0 +1,164 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import platformdirs
+from langchain_core.runnables import RunnableConfig
+
+from rivet.utils.metrics import run_metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLICE_CACHE_DIR = Path(platformdirs.user_cache_dir("rivet")) / "slices"
+# Entries without a known source (the spec wasn't fetched from a URL) share this prefix
+NO_SOURCE = "nosource"
+
+
+def _canonical(value: Any) -> Any:
+    # YAML specs have int keys (`200:` next to `default:`) that sort_keys can't compare
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return value
+
+
+def spec_hash(spec: Dict) -> str:
+    """Hash of the spec's content, independent of key order and formatting"""
+    canonical = json.dumps(
+        _canonical(spec),
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,  # YAML dates
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def normalize_requirement(requirement: str) -> str:
+    """`  Users CRUD! ` and `users crud` are the same request"""
+    return " ".join(re.findall(r"\w+", requirement.lower()))
+
+
+def _digest(value: str, length: int = 16) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:length]
+
+
+@dataclass(frozen=True)
+class SliceCache:
+    """
+    Sliced specs on disk, one JSON file per (spec, requirement, slicer settings), named
+    `<source>-<spec hash>-<request>.json` so that entries of an older version of the same
+    spec can be found and dropped without reading them
+    """
+
+    enabled: bool = True
+    directory: Path = DEFAULT_SLICE_CACHE_DIR
+    max_entries: int = 500  # Least recently used entries are evicted above this count
+
+    @classmethod
+    def from_config(cls, config: Optional[RunnableConfig] = None) -> "SliceCache":
+        params = (config or {}).get("configurable", {})
+        directory = params.get("slice_cache_dir")
+        return cls(
+            enabled=bool(params.get("slice_cache", cls.enabled)),
+            directory=Path(directory) if directory else cls.directory,
+            max_entries=int(params.get("slice_cache_max_entries") or cls.max_entries),
+        )
+
+    @staticmethod
+    def key(
+        source: Optional[str], spec_digest: str, requirement: str, settings: Dict[str, Any]
+    ) -> str:
+        request = json.dumps(
+            {"requirement": normalize_requirement(requirement), "settings": settings},
+            sort_keys=True,
+        )
+        prefix = _digest(source) if source else NO_SOURCE
+        return f"{prefix}-{spec_digest[:16]}-{_digest(request)}"
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+            spec = entry["spec"]
+        except (OSError, ValueError, TypeError, KeyError):
+            run_metrics.incr("slice.cache.miss")
+            return None
+        try:
+            os.utime(path)  # Recency for the LRU eviction
+        except OSError:
+            pass
+        run_metrics.incr("slice.cache.hit")
+        return spec
+
+    def put(self, key: str, requirement: str, sliced: Dict):
+        if not self.enabled:
+            return
+        entry = {
+            "key": key,
+            "requirement": normalize_requirement(requirement),
+            "created_at": time.time(),
+            "spec": sliced,
+        }
+        path = self._path(key)
+        try:
+            # Serialized first: a spec JSON can't hold (YAML dates) is simply not cached
+            data = json.dumps(entry, ensure_ascii=False)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write-then-rename so a concurrent reader never sees half an entry
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except OSError:
+                Path(tmp).unlink(missing_ok=True)
+                raise
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"⚠️ Failed to cache sliced spec: {str(e)}")
+            return
+        run_metrics.incr("slice.cache.stored")
+        self._invalidate(key)
+        self._evict()
+
+    def _invalidate(self, key: str):
+        """Drop the entries of other versions of this source's spec: they can't hit again"""
+        source, spec_digest, _ = key.split("-")
+        if source == NO_SOURCE:
+            return  # Unrelated specs, not versions of one: LRU eviction takes care of them
+        for path in self.directory.glob(f"{source}-*.json"):
+            if path.stem.split("-")[1] == spec_digest:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            run_metrics.incr("slice.cache.invalidated")
+
+    def _evict(self):
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except OSError:
+                continue
+        excess = len(entries) - self.max_entries
+        for _, path in sorted(entries, key=lambda e: e[0])[: max(excess, 0)]:
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            run_metrics.incr("slice.cache.evicted")
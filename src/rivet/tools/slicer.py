@@ -1,126 +1,312 @@
 import json
 import logging
-from typing import Any, Dict, List, Optional, Set
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
 
 from langchain_core.runnables import RunnableConfig
 from rich.console import Console
 
-from rivet.core.inference import direct_chat_completion
+from rivet.core.inference import CHARS_PER_TOKEN, direct_chat_completion
+from rivet.core.llm_client import NodeLLMSettings
+from rivet.tools.slice_cache import SliceCache, spec_hash
+from rivet.tools.spec_index import Operation, get_spec_index
+from rivet.tools.spec_search import get_retriever, search_operations
+from rivet.utils.metrics import run_metrics
 
 console = Console()
 logger = logging.getLogger(__name__)
 
+# llm: the model picks from every endpoint; local: BM25 ranking only, no LLM call;
+# hybrid: BM25 shortlists the endpoints, the model picks from the shortlist
+SLICE_MODES = ("llm", "local", "hybrid")
+DEFAULT_SLICE_MODE = "llm"
+MENU_METHODS = ("get", "post", "put", "delete", "patch")
+
+
+@dataclass(frozen=True)
+class SliceSettings:
+    """How endpoints are picked for a requirement"""
+
+    mode: str = DEFAULT_SLICE_MODE
+    top_k: int = 15  # local: most operations a slice takes
+    min_score: float = 0.5  # local: drop matches under this fraction of the best score
+    prefilter_k: int = 60  # hybrid: operations shown to the LLM
+    # Budget of each menu shown to the LLM; bigger specs are sliced in two stages
+    menu_tokens: int = 8000
+
+    @classmethod
+    def from_config(cls, config: Optional[RunnableConfig] = None) -> "SliceSettings":
+        params = (config or {}).get("configurable", {})
+        mode = params.get("slice_mode") or cls.mode
+        if mode not in SLICE_MODES:
+            raise ValueError(f"Unknown slice mode '{mode}', expected one of {SLICE_MODES}")
+        return cls(
+            mode=mode,
+            top_k=int(params.get("slice_top_k") or cls.top_k),
+            min_score=float(params.get("slice_min_score", cls.min_score)),
+            prefilter_k=int(params.get("slice_prefilter_k") or cls.prefilter_k),
+            menu_tokens=int(params.get("slice_menu_tokens") or cls.menu_tokens),
+        )
 
-def _extract_refs(obj: Any, refs: Set[str]):
-    if isinstance(obj, Dict):
-        for k, v in obj.items():
-            if k == "$ref" and isinstance(v, str):
-                refs.add(v)
-            else:
-                _extract_refs(v, refs)
-    elif isinstance(obj, List):
-        for item in obj:
-            _extract_refs(item, refs)
-
-
-def _resolve_dependencies(full_spec: Dict, target_paths: List[str]) -> Dict:
-    mini_spec = {
-        "openapi": full_spec.get("openapi", "3.0.0"),
-        "info": full_spec.get("info", {}),
-        "servers": full_spec.get("servers", []),
-        "paths": {},
-        "components": {
-            "schemas": {},
-            "securitySchemes": full_spec.get("components", {}).get("securitySchemes", {}),
-            "parameters": {},
-        },
-    }
 
-    ref_queue = set()
-    for path in target_paths:
-        if path in full_spec.get("paths", {}):
-            path_item = full_spec["paths"][path]
-            mini_spec["paths"][path] = path_item
-            _extract_refs(path_item, ref_queue)
-
-    processed_refs = set()
-    while ref_queue:
-        ref = ref_queue.pop()
-        if ref in processed_refs or not ref.startswith("#/"):
-            continue
-        processed_refs.add(ref)
-
-        parts = ref.lstrip("#/").split("/")
-
-        curr = full_spec
-        valid = True
-        for part in parts:
-            if isinstance(curr, dict) and part in curr:
-                curr = curr[part]
-            else:
-                valid = False
-                break
-
-        if valid:
-            category, name = parts[1], parts[2]
-            if category not in mini_spec["components"]:
-                mini_spec["components"][category] = {}
-
-            mini_spec["components"][category][name] = curr
-            _extract_refs(curr, ref_queue)
+def _spec_tokens(spec: Dict) -> int:
+    # The SDK prompt carries the spec as compact JSON
+    return len(json.dumps(spec)) // CHARS_PER_TOKEN
+
+
+def _resolve_dependencies(full_spec: Dict, targets: List[str]) -> Dict:
+    index = get_spec_index(full_spec)
+    operations = index.select(targets)
+    mini_spec = index.slice_operations(operations)
+
+    # What taking whole path items would have cost, for the run report
+    tokens = _spec_tokens(mini_spec)
+    path_tokens = _spec_tokens(index.slice_paths(dict.fromkeys(path for path, _ in operations)))
+    run_metrics.incr("slice.operations", len(operations))
+    run_metrics.incr("slice.prompt_tokens", tokens)
+    run_metrics.incr("slice.prompt_tokens_saved", path_tokens - tokens)
+    logger.info(
+        f"✂️ Sliced {len(operations)} operations: ~{tokens:,} spec tokens "
+        f"(~{path_tokens - tokens:,} fewer than whole path items)"
+    )
 
     logger.info("✅ Spec sliced successfully!")
     console.print("[green]✅ Spec sliced successfully![/green]")
     return mini_spec
 
 
-def _get_api_menu(full_spec: Dict) -> str:
+def _menu_operations(full_spec: Dict) -> List[Operation]:
+    return [op for op in get_spec_index(full_spec).operation_refs if op[1] in MENU_METHODS]
+
+
+def _menu_lines(full_spec: Dict, operations: List[Operation]) -> List[str]:
+    paths = full_spec.get("paths", {})
+    lines = []
+    for path, method in operations:
+        details = paths[path].get(method) or {}
+        summary = details.get("summary") or details.get("description") or ""
+        summary = summary.replace("\n", " ")[:80]
+        lines.append(f"{method.upper()} {path} : {summary}")
+    return lines
+
+
+def _get_api_menu(full_spec: Dict, operations: Optional[List[Operation]] = None) -> str:
+    """`METHOD /path : summary` per operation; all of them unless `operations` is given"""
+    if operations is None:
+        operations = _menu_operations(full_spec)
+    return "\n".join(_menu_lines(full_spec, operations))
+
+
+def _fit(lines: List[str], max_tokens: int, what: str) -> str:
+    """The first `lines` that fit in `max_tokens`, with a note on how many were left out"""
+    budget = max_tokens * CHARS_PER_TOKEN
+    kept, used = [], 0
+    for line in lines:
+        if used + len(line) + 1 > budget:
+            break
+        kept.append(line)
+        used += len(line) + 1
+    if len(kept) < len(lines):
+        kept.append(f"({len(lines) - len(kept)} less relevant {what} omitted)")
+    return "\n".join(kept)
+
+
+def _group_name(full_spec: Dict, operation: Operation) -> str:
+    """First tag of the operation, or the first literal segment of its path"""
+    path, method = operation
+    tags = (full_spec["paths"][path].get(method) or {}).get("tags") or []
+    if tags and isinstance(tags[0], str):
+        return tags[0]
+    segments = [s for s in path.split("/") if s and not s.startswith("{")]
+    return f"/{segments[0]}" if segments else "/"
+
+
+def _group_operations(full_spec: Dict, operations: List[Operation]) -> Dict[str, List[Operation]]:
+    groups: Dict[str, List[Operation]] = {}
+    for operation in operations:
+        groups.setdefault(_group_name(full_spec, operation), []).append(operation)
+    return groups
+
+
+def _group_menu(full_spec: Dict, groups: Dict[str, List[Operation]], requirement: str) -> List[str]:
+    """One line per group, most relevant first: name, operation count and a few example paths"""
+    retriever = get_retriever(full_spec)
+    ranking = retriever.ranking(requirement)
+
+    def relevance(name: str) -> float:
+        # A group is as relevant as its best operation
+        return max(ranking[retriever.positions[op]] for op in groups[name])
+
     lines = []
-    for path, methods in full_spec.get("paths", {}).items():
-        for method, details in methods.items():
-            if method.lower() in ["get", "post", "put", "delete", "patch"]:
-                summary = details.get("summary") or details.get("description") or ""
-                summary = summary.replace("\n", " ")[:80]
-                lines.append(f"{method.upper()} {path} : {summary}")
-    # return "\n".join(lines[:500]) # Limit to 500 endpoints to save tokens
-    return "\n".join(lines)
+    for name in sorted(groups, key=relevance, reverse=True):
+        examples = list(dict.fromkeys(path for path, _ in groups[name]))[:3]
+        lines.append(f"{name} ({len(groups[name])} operations): {', '.join(examples)}")
+    return lines
+
+
+async def _ask_for_list(config: RunnableConfig, prompt: str) -> Optional[List]:
+    response = await direct_chat_completion(
+        config=config,
+        sys_msg_content="You are an API Architect. Return JSON string list only.",
+        usr_msg_content=prompt,
+        node="slice",
+    )
+    try:
+        clean_json = response.replace("```json", "").replace("```", "").strip()
+        selection = json.loads(clean_json)
+        if not isinstance(selection, list):
+            raise ValueError("expected a JSON list")
+    except Exception as e:
+        logger.error(f"⚠️ Slicing failed. Using full spec. Error: {str(e)}")
+        console.print(f"[yellow]⚠️ Slicing failed. Using full spec. Error: {str(e)}[/yellow]")
+        return None
+    return selection
+
+
+async def _select_groups(
+    full_spec: Dict,
+    config: RunnableConfig,
+    requirement: str,
+    operations: List[Operation],
+    settings: "SliceSettings",
+) -> Optional[List[Operation]]:
+    """
+    First stage for specs whose menu doesn't fit the budget: pick tags (or path prefixes),
+    then the operations are picked from inside those groups only
+    """
+    groups = _group_operations(full_spec, operations)
+    group_menu = _fit(_group_menu(full_spec, groups, requirement), settings.menu_tokens, "groups")
+    prompt = f"""
+    The API has {len(operations)} endpoints, grouped by tag or path prefix.
+
+    AVAILABLE GROUPS:
+    {group_menu}
+
+    USER REQUIREMENT: "{requirement}"
+
+    TASK: Return a JSON list of the group names (strings) whose endpoints the requirement needs.
+    - Select every group that could contain a needed endpoint, but no others.
+    - Return strictly JSON. Example: ["pets", "/store"]
+    """
+    selection = await _ask_for_list(config, prompt)
+    if selection is None:
+        return None
+    chosen = [op for name in selection if isinstance(name, str) for op in groups.get(name, [])]
+    logger.info(f"🗂️ Selected {len(chosen)} operations in {len(selection)} groups")
+    run_metrics.incr("slice.group_stages")
+    return chosen
 
 
 async def slice_spec(
     full_spec: Dict,
     config: RunnableConfig,
     requirement: Optional[str] = None,
+    source: Optional[str] = None,
 ) -> dict:
+    """
+    Mini spec with the operations `requirement` needs. Results are cached on disk per spec
+    content, requirement, slicer settings and slicing model; `source` (the spec's URL) lets
+    a new version of the spec invalidate the slices of the old one.
+    """
     if not requirement or requirement == "full_sdk":
         return full_spec
 
-    api_menu = _get_api_menu(full_spec)
+    settings = SliceSettings.from_config(config)
+    cache = SliceCache.from_config(config)
+    key = None
+    cached = None
+    if cache.enabled:
+        # The cache only saves an LLM call: if it can't be used, slice without it
+        try:
+            key = cache.key(source, spec_hash(full_spec), requirement, _cache_settings(config))
+            cached = cache.get(key)
+        except Exception as e:
+            logger.warning(f"⚠️ Slice cache unavailable, slicing without it: {str(e)}")
+            key = None
+        if cached is not None:
+            logger.info(f"♻️ Reusing the cached slice for '{requirement}'")
+            console.print("[green]✅ Spec sliced successfully! (cached)[/green]")
+            return cached
+
+    sliced = await _slice(full_spec, config, requirement, settings)
+    if sliced is None:
+        return full_spec
+    if key is not None and sliced["paths"]:
+        try:
+            cache.put(key, requirement, sliced)
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to cache sliced spec: {str(e)}")
+    return sliced
+
+
+def _cache_settings(config: RunnableConfig) -> Dict:
+    """Everything besides the spec and requirement that decides what a slice contains"""
+    route = NodeLLMSettings.from_config(config, "slice")
+    return {
+        **asdict(SliceSettings.from_config(config)),
+        "model": route.model,
+        "base_url": route.base_url,
+    }
+
+
+async def _slice(
+    full_spec: Dict, config: RunnableConfig, requirement: str, settings: "SliceSettings"
+) -> Optional[Dict]:
+    """The slice, or None when no selection could be made and the full spec should be used"""
+    if settings.mode == "local":
+        return _local_slice(full_spec, requirement, settings)
+
+    candidates = None
+    if settings.mode == "hybrid":
+        started = time.perf_counter()
+        candidates = search_operations(full_spec, requirement, settings.prefilter_k) or None
+        elapsed = (time.perf_counter() - started) * 1000
+        if candidates:
+            logger.info(
+                f"🔎 Pre-selected {len(candidates)} candidate operations in {elapsed:.0f}ms"
+            )
+
+    if candidates is None:
+        operations = _menu_operations(full_spec)
+        menu_chars = sum(len(line) + 1 for line in _menu_lines(full_spec, operations))
+        if menu_chars > settings.menu_tokens * CHARS_PER_TOKEN:
+            candidates = await _select_groups(full_spec, config, requirement, operations, settings)
+            if not candidates:
+                return None
+        else:
+            candidates = operations
+
+    # Most relevant first, so what doesn't fit the budget is what matters least
+    if len(candidates) > 1:
+        candidates = get_retriever(full_spec).rank(requirement, candidates)
+    api_menu = _fit(_menu_lines(full_spec, candidates), settings.menu_tokens, "endpoints")
     prompt = f"""
     AVAILABLE ENDPOINTS:
     {api_menu}
 
     USER REQUIREMENT: "{requirement}"
 
-    TASK: Return a JSON list of paths (strings) that match the requirement.
-    - If user wants "Get and Delete Posts", select BOTH the GET and DELETE paths.
-    - Return strictly JSON. Example: ["/posts", "/posts/{{id}}"]
+    TASK: Return a JSON list of the operations (strings, "METHOD /path") that match the requirement.
+    - Select only the methods the requirement needs, not every method on a path.
+    - If user wants "Get and Delete Posts", select BOTH the GET and DELETE operations.
+    - Return strictly JSON. Example: ["GET /posts", "DELETE /posts/{{id}}"]
     """
 
-    response = await direct_chat_completion(
-        config=config,
-        sys_msg_content="You are an API Architect. Return JSON string list only.",
-        usr_msg_content=prompt,
-    )
-
-    try:
-        clean_json = response.replace("```json", "").replace("```", "").strip()
-        target_paths = json.loads(clean_json)
-        if not isinstance(target_paths, list):
-            raise ValueError
+    targets = await _ask_for_list(config, prompt)
+    if targets is None:
+        return None
+    return _resolve_dependencies(full_spec, targets)
 
-    except Exception as e:
-        logger.error(f"⚠️ Slicing failed. Using full spec. Error: {str(e)}")
-        console.print(f"[yellow]⚠️ Slicing failed. Using full spec. Error: {str(e)}[/yellow]")
-        return full_spec
 
-    return _resolve_dependencies(full_spec, target_paths)
+def _local_slice(full_spec: Dict, requirement: str, settings: "SliceSettings") -> Optional[Dict]:
+    """Slice by BM25 ranking alone: no LLM call, same result for the same spec and requirement"""
+    started = time.perf_counter()
+    operations = search_operations(full_spec, requirement, settings.top_k, settings.min_score)
+    elapsed = (time.perf_counter() - started) * 1000
+    if not operations:
+        logger.error("⚠️ No operation matches the requirement. Using full spec.")
+        console.print("[yellow]⚠️ No operation matches the requirement. Using full spec.[/yellow]")
+        return None
+    logger.info(f"🔎 Ranked {len(operations)} matching operations in {elapsed:.0f}ms")
+    return _resolve_dependencies(full_spec, [f"{m.upper()} {p}" for p, m in operations])
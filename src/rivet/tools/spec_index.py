@@ -0,0 +1,239 @@
+import copy
+import re
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+HTTP_METHODS = ("get", "put", "post", "delete", "options", "head", "patch", "trace")
+MAX_CACHED_INDEXES = 8
+
+Operation = Tuple[str, str]  # (path, method)
+# Swagger 2.0 keeps at the top level what OpenAPI 3 keeps under `components`
+SWAGGER2_SECTIONS = ("definitions", "parameters", "responses")
+# Swagger 2.0 fields every slice keeps whole
+SWAGGER2_FIELDS = (
+    "swagger",
+    "info",
+    "host",
+    "basePath",
+    "schemes",
+    "consumes",
+    "produces",
+    "securityDefinitions",
+    "security",
+)
+# `DELETE /posts/{id}` as listed in the slice menu
+OPERATION_RE = re.compile(rf"^\s*({'|'.join(HTTP_METHODS)})\s+(/\S*)\s*$", re.IGNORECASE)
+
+
+def _extract_refs(obj: Any, refs: Set[str]):
+    if isinstance(obj, Dict):
+        for k, v in obj.items():
+            if k == "$ref" and isinstance(v, str):
+                refs.add(v)
+            else:
+                _extract_refs(v, refs)
+    elif isinstance(obj, List):
+        for item in obj:
+            _extract_refs(item, refs)
+
+
+def _component_key(ref: str) -> Optional[str]:
+    """
+    `#/components/schemas/Pet/properties/id` -> `#/components/schemas/Pet`, and Swagger 2.0's
+    `#/definitions/Pet/properties/id` -> `#/definitions/Pet`; None for any other ref
+    """
+    parts = ref[2:].split("/") if ref.startswith("#/") else []
+    if len(parts) >= 3 and parts[0] == "components":
+        return "#/" + "/".join(parts[:3])
+    if len(parts) >= 2 and parts[0] in SWAGGER2_SECTIONS:
+        return "#/" + "/".join(parts[:2])
+    return None
+
+
+def _unescape(part: str) -> str:
+    return part.replace("~1", "/").replace("~0", "~")
+
+
+class SpecIndex:
+    """
+    $ref dependency graph of one OpenAPI spec, built once: the refs each operation and each
+    path item uses directly, the refs each component uses, and memoized transitive closures.
+    Slicing against it costs as much as the slice, not the spec.
+    """
+
+    def __init__(self, spec: Dict):
+        self.spec = spec
+        self.path_refs: Dict[str, Set[str]] = {}  # Path-level parameters, servers, ...
+        self.operation_refs: Dict[Operation, Set[str]] = {}
+        self.path_operations: Dict[str, List[Operation]] = {}
+        self.operation_ids: Dict[str, Operation] = {}
+        self.edges: Dict[str, Set[str]] = {}  # Component -> components it references
+        self._closures: Dict[str, FrozenSet[str]] = {}
+
+        for path, item in (spec.get("paths") or {}).items():
+            if not isinstance(item, dict):
+                continue
+            shared: Set[str] = set()
+            for key, value in item.items():
+                if key.lower() in HTTP_METHODS and isinstance(value, dict):
+                    refs: Set[str] = set()
+                    _extract_refs(value, refs)
+                    self.operation_refs[(path, key.lower())] = self._components(refs)
+                    self.path_operations.setdefault(path, []).append((path, key.lower()))
+                    if isinstance(value.get("operationId"), str):
+                        self.operation_ids[value["operationId"]] = (path, key.lower())
+                else:
+                    _extract_refs(value, shared)
+            self.path_refs[path] = self._components(shared)
+
+        sections = [
+            (f"#/components/{category}", entries)
+            for category, entries in (spec.get("components") or {}).items()
+        ]
+        sections += [(f"#/{section}", spec.get(section)) for section in SWAGGER2_SECTIONS]
+        for prefix, entries in sections:
+            if not isinstance(entries, dict):
+                continue
+            for name, value in entries.items():
+                refs: Set[str] = set()
+                _extract_refs(value, refs)
+                key = f"{prefix}/{name}"
+                self.edges[key] = self._components(refs) - {key}
+
+    @staticmethod
+    def _components(refs: Iterable[str]) -> Set[str]:
+        keys = {_component_key(ref) for ref in refs}
+        keys.discard(None)
+        return keys
+
+    def closure(self, ref: str) -> FrozenSet[str]:
+        """`ref` and every component it reaches, computed once per component"""
+        cached = self._closures.get(ref)
+        if cached is not None:
+            return cached
+        reached: Set[str] = set()
+        stack = [ref]
+        while stack:
+            current = stack.pop()
+            if current in reached:
+                continue
+            done = self._closures.get(current)
+            if done is not None:
+                reached |= done
+                continue
+            reached.add(current)
+            stack.extend(self.edges.get(current, ()))
+        closure = frozenset(reached)
+        self._closures[ref] = closure
+        return closure
+
+    def dependencies(self, refs: Iterable[str]) -> Set[str]:
+        reached: Set[str] = set()
+        for ref in refs:
+            if ref not in reached:
+                reached |= self.closure(ref)
+        return reached
+
+    def resolve(self, key: str) -> Optional[Any]:
+        node: Any = self.spec
+        for part in key[2:].split("/"):
+            part = _unescape(part)
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def select(self, targets: Iterable[str]) -> List[Operation]:
+        """
+        Operations named by `METHOD /path` or operationId. A bare path selects all of its
+        operations. Unknown entries are skipped.
+        """
+        selected: Dict[Operation, None] = {}  # Ordered set
+        for target in targets:
+            if not isinstance(target, str):
+                continue
+            match = OPERATION_RE.match(target)
+            if match:
+                operation = (match.group(2), match.group(1).lower())
+                if operation in self.operation_refs:
+                    selected[operation] = None
+            elif target.strip() in self.path_operations:
+                selected.update(dict.fromkeys(self.path_operations[target.strip()]))
+            elif target.strip() in self.operation_ids:
+                selected[self.operation_ids[target.strip()]] = None
+        return list(selected)
+
+    def slice_operations(self, operations: Iterable[Operation]) -> Dict:
+        """
+        Mini spec with only the given operations, the path-level fields of their path items
+        (shared parameters, servers) and every component those depend on
+        """
+        paths = self.spec.get("paths") or {}
+        mini_spec = self._skeleton()
+        refs: Set[str] = set()
+        for path, method in operations:
+            if (path, method) not in self.operation_refs:
+                continue
+            if path not in mini_spec["paths"]:
+                mini_spec["paths"][path] = {
+                    key: value
+                    for key, value in paths[path].items()
+                    if key.lower() not in HTTP_METHODS or not isinstance(value, dict)
+                }
+                refs |= self.path_refs[path]
+            item = mini_spec["paths"][path]
+            item.update({key: value for key, value in paths[path].items() if key.lower() == method})
+            refs |= self.operation_refs[(path, method)]
+        self._add_components(mini_spec, refs)
+        return mini_spec
+
+    def slice_paths(self, target_paths: Iterable[str]) -> Dict:
+        """Mini spec with the given path items whole, every operation included"""
+        operations = [op for path in target_paths for op in self.path_operations.get(path, [])]
+        return self.slice_operations(operations)
+
+    def _skeleton(self) -> Dict:
+        if "swagger" in self.spec:
+            skeleton = {key: self.spec[key] for key in SWAGGER2_FIELDS if key in self.spec}
+            skeleton["paths"] = {}
+            return skeleton
+        components = self.spec.get("components") or {}
+        return {
+            "openapi": self.spec.get("openapi", "3.0.0"),
+            "info": self.spec.get("info", {}),
+            "servers": self.spec.get("servers", []),
+            "paths": {},
+            "components": {
+                "schemas": {},
+                "securitySchemes": copy.copy(components.get("securitySchemes", {})),
+                "parameters": {},
+            },
+        }
+
+    def _add_components(self, mini_spec: Dict, refs: Iterable[str]):
+        for key in sorted(self.dependencies(refs)):
+            value = self.resolve(key)
+            if value is None:
+                continue
+            *section, name = key[2:].split("/")
+            target = mini_spec
+            for part in section:
+                target = target.setdefault(part, {})
+            target[_unescape(name)] = value
+
+
+_indexes: "OrderedDict[int, Tuple[Dict, SpecIndex]]" = OrderedDict()
+
+
+def get_spec_index(spec: Dict) -> SpecIndex:
+    """The index of `spec`, built on first use and shared by every later slice of it"""
+    key = id(spec)
+    cached = _indexes.get(key)
+    if cached is not None and cached[0] is spec:
+        _indexes.move_to_end(key)
+        return cached[1]
+    index = SpecIndex(spec)
+    _indexes[key] = (spec, index)  # Holding the spec keeps its id from being reused
+    while len(_indexes) > MAX_CACHED_INDEXES:
+        _indexes.popitem(last=False)
+    return index
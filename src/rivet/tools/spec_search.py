@@ -0,0 +1,163 @@
+import math
+import re
+import weakref
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from rivet.tools.spec_index import Operation, SpecIndex, get_spec_index
+
+# Okapi BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Field weights: identifiers and tags describe an operation better than free text
+FIELD_WEIGHTS = {"operation_id": 3, "path": 3, "tags": 2, "summary": 2, "description": 1}
+MAX_DESCRIPTION_CHARS = 500
+
+# What a requirement says vs. the HTTP method that does it
+METHOD_WORDS = {
+    "get": "get list fetch read retrieve find search show view",
+    "post": "create add new submit send make",
+    "put": "update replace edit modify change set",
+    "patch": "update edit modify change partial",
+    "delete": "delete remove destroy cancel",
+}
+
+STOPWORDS = frozenset(
+    "a an and the of to in for on by with from at as is are be or all any this that it its "
+    "me my i we our you your please just only some need want api apis endpoint endpoints "
+    "operation operations sdk client".split()
+)
+WORD_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case words, with camelCase, snake_case and /path/{segments} split apart"""
+    tokens = []
+    for word in WORD_RE.findall(text or ""):
+        word = word.lower()
+        if word in STOPWORDS or len(word) < 2:
+            continue
+        # Crude plural folding, enough to match "users" with /user/{id}
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def _document(path: str, method: str, details: Dict) -> List[str]:
+    fields = {
+        "operation_id": details.get("operationId") or "",
+        "path": path,
+        "tags": " ".join(t for t in details.get("tags") or [] if isinstance(t, str)),
+        "summary": details.get("summary") or "",
+        "description": (details.get("description") or "")[:MAX_DESCRIPTION_CHARS],
+    }
+    tokens = tokenize(METHOD_WORDS.get(method, method))
+    for field, text in fields.items():
+        tokens.extend(tokenize(text) * FIELD_WEIGHTS[field])
+    return tokens
+
+
+class OperationRetriever:
+    """
+    BM25 over the operations of a spec (operationId, path segments, tags, summary and
+    description), for picking endpoints without an LLM call. Postings are stored per term
+    as numpy arrays of precomputed BM25 weights, so a query is a few vectorized adds.
+    """
+
+    def __init__(self, index: SpecIndex):
+        paths = index.spec.get("paths") or {}
+        self.operations: List[Operation] = list(index.operation_refs)
+        self.positions: Dict[Operation, int] = {op: i for i, op in enumerate(self.operations)}
+        documents = [_document(p, m, paths[p].get(m) or {}) for p, m in self.operations]
+
+        lengths = np.array([len(doc) for doc in documents], dtype=np.float64)
+        average = lengths.mean() if len(lengths) and lengths.mean() > 0 else 1.0
+        norms = K1 * (1 - B + B * lengths / average)
+
+        counts: Dict[str, Dict[int, int]] = {}
+        for doc_id, doc in enumerate(documents):
+            for token in doc:
+                postings = counts.setdefault(token, {})
+                postings[doc_id] = postings.get(doc_id, 0) + 1
+
+        total = len(documents)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for token, postings in counts.items():
+            doc_ids = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            tf = np.fromiter(postings.values(), dtype=np.float64, count=len(postings))
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            weights = idf * tf * (K1 + 1) / (tf + norms[doc_ids])
+            self.postings[token] = (doc_ids, weights)
+
+    def scores(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """BM25 score of every operation, and how many distinct query terms each matches"""
+        scores = np.zeros(len(self.operations), dtype=np.float64)
+        matched = np.zeros(len(self.operations), dtype=np.int64)
+        for token in set(tokenize(query)):
+            if token in self.postings:
+                doc_ids, weights = self.postings[token]
+                scores[doc_ids] += weights
+                matched[doc_ids] += 1
+        return scores, matched
+
+    def search(
+        self, query: str, top_k: int = 10, min_ratio: float = 0.0
+    ) -> List[Tuple[Operation, float]]:
+        """
+        Best `top_k` operations for `query`, best first. Operations matching more of the
+        query's terms rank first, then by score: "delete a post" wants DELETE /posts/{id}
+        before any other DELETE. With `min_ratio` set, only operations matching as many
+        terms as the best one and scoring at least that fraction of its score are returned.
+        """
+        scores, matched = self.scores(query)
+        if not len(scores) or top_k <= 0 or not matched.any():
+            return []
+        ranking = _ranking(scores, matched)
+        top_k = min(top_k, int(np.count_nonzero(matched)))
+        top = np.argpartition(-ranking, top_k - 1)[:top_k]
+        top = top[np.argsort(-ranking[top], kind="stable")]
+        best = top[0]
+        if min_ratio > 0:
+            keep = (matched[top] == matched[best]) & (scores[top] >= scores[best] * min_ratio)
+            top = top[keep]
+        return [(self.operations[i], float(scores[i])) for i in top]
+
+    def ranking(self, query: str) -> np.ndarray:
+        """Relevance of every operation to `query`, comparable across operations"""
+        return _ranking(*self.scores(query))
+
+    def rank(self, query: str, operations: Iterable[Operation]) -> List[Operation]:
+        """`operations` reordered most relevant first; unmatched ones keep their order"""
+        operations = list(operations)
+        ranking = self.ranking(query)
+        positions = np.array([self.positions.get(op, -1) for op in operations], dtype=np.int64)
+        keys = np.where(positions >= 0, ranking[positions], 0.0)
+        return [operations[i] for i in np.argsort(-keys, kind="stable")]
+
+
+def _ranking(scores: np.ndarray, matched: np.ndarray) -> np.ndarray:
+    # Integer term counts dominate, BM25 scores break ties between equal counts
+    return matched * (scores.max(initial=0.0) + 1.0) + scores
+
+
+_retrievers: "weakref.WeakKeyDictionary[SpecIndex, OperationRetriever]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_retriever(spec: Dict) -> OperationRetriever:
+    """The BM25 index of `spec`, built once and kept as long as its SpecIndex is cached"""
+    index = get_spec_index(spec)
+    retriever = _retrievers.get(index)
+    if retriever is None:
+        retriever = _retrievers[index] = OperationRetriever(index)
+    return retriever
+
+
+def search_operations(
+    spec: Dict, query: str, top_k: int = 10, min_ratio: float = 0.0
+) -> List[Operation]:
+    return [op for op, _ in get_retriever(spec).search(query, top_k, min_ratio)]
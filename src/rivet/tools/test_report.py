@@ -0,0 +1,203 @@
+import logging
+import re
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional
+
+from rivet.core.schema import TestCaseResult, TestFrame, TestRunReport
+from rivet.utils.errors import condense_traceback, traceback_signature
+
+logger = logging.getLogger(__name__)
+
+REPORT_FILE = "rivet-report.xml"
+
+# pytest exit codes with no test results behind them
+PYTEST_USAGE_ERROR = 4
+PYTEST_NO_TESTS = 5
+
+# --tb=native frames: File "/app/client.py", line 42, in get_pet
+NATIVE_FRAME_RE = re.compile(r'File "([^"]+)", line (\d+)(?:, in (\S+))?')
+# Short/collection frames: client.py:42: in get_pet  |  /app/client.py:42: KeyError
+SHORT_FRAME_RE = re.compile(r"^(?:E\s+)?(\S+\.py):(\d+):(?: in (\S+))?", re.MULTILINE)
+ERROR_LINE_RE = re.compile(r"^E\s+(.+)$", re.MULTILINE)
+# What a repeated traceback is replaced with, as in the condensed log
+SAME_ERROR_RE = re.compile(r"^\(same error as (.+)\)$")
+EXCEPTION_RE = re.compile(
+    r"^(?:E\s+)?([A-Za-z_][\w.]*(?:Error|Exception|Exit|Warning))\b:?", re.MULTILINE
+)
+
+
+def _node_id(classname: str, name: str) -> str:
+    if not classname:
+        # Collection errors carry the module path in `name`
+        return name if name.endswith(".py") else f"{name.replace('.', '/')}.py"
+    # classname is "test_client" or "test_client.TestPets"; the file is always top level here
+    module, *classes = classname.split(".")
+    return "::".join([f"{module}.py", *classes, name])
+
+
+def _parse_frames(traceback: str) -> List[TestFrame]:
+    # Both styles can show up in one traceback (e.g. a SyntaxError embedded in a short one),
+    # so merge them in the order they appear
+    matches = sorted(
+        [*NATIVE_FRAME_RE.finditer(traceback), *SHORT_FRAME_RE.finditer(traceback)],
+        key=lambda m: m.start(),
+    )
+    return [
+        TestFrame(path=m.group(1), line=int(m.group(2)), function=m.group(3) or None)
+        for m in matches
+    ]
+
+
+def _parse_exception(message: str, traceback: str) -> Optional[str]:
+    if message and message.startswith("assert "):
+        # Rewritten assertions only carry the introspected expression
+        return "AssertionError"
+
+    head = re.match(r"([A-Za-z_][\w.]*)(?::|$)", message.strip()) if message else None
+    if head and not head.group(1)[0].islower():
+        return head.group(1).split(".")[-1]
+
+    # The raised exception is the last one mentioned in the traceback
+    found = EXCEPTION_RE.findall(traceback)
+    if found:
+        return found[-1].split(".")[-1]
+    return None
+
+
+def _parse_case(testcase: ET.Element) -> TestCaseResult:
+    outcome, problem = "passed", None
+    for tag, result in (("failure", "failed"), ("error", "error"), ("skipped", "skipped")):
+        problem = testcase.find(tag)
+        if problem is not None:
+            outcome = result
+            break
+
+    message = traceback = ""
+    if problem is not None:
+        message = problem.get("message", "")
+        traceback = problem.text or ""
+
+    # Collection errors only say "collection failure"; the real error is the last `E` line
+    error_lines = ERROR_LINE_RE.findall(traceback)
+    if error_lines and (not message or message == "collection failure"):
+        message = error_lines[-1].strip()
+
+    return TestCaseResult(
+        node_id=_node_id(testcase.get("classname", ""), testcase.get("name", "")),
+        outcome=outcome,
+        duration=float(testcase.get("time") or 0.0),
+        exception_type=_parse_exception(message, traceback) if outcome != "skipped" else None,
+        message=message or None,
+        frames=_parse_frames(traceback),
+        traceback=traceback,
+    )
+
+
+def parse_junit_report(
+    junit_xml: Optional[str],
+    exit_code: int,
+    logs: str,
+    duration: float = 0.0,
+    timed_out: bool = False,
+) -> TestRunReport:
+    """Turn pytest's JUnit XML into a TestRunReport. Missing or broken XML yields no cases."""
+    cases: List[TestCaseResult] = []
+    if junit_xml:
+        try:
+            root = ET.fromstring(junit_xml)
+            cases = [_parse_case(tc) for tc in root.iter("testcase")]
+        except ET.ParseError as e:
+            logger.warning(f"⚠️ Could not parse pytest JUnit report: {str(e)}")
+
+    return TestRunReport(
+        exit_code=exit_code, duration=duration, cases=cases, logs=logs, timed_out=timed_out
+    )
+
+
+def merge_reports(reports: List[TestRunReport], duration: float) -> TestRunReport:
+    """
+    Combine the reports of shards run side by side. `duration` is the wall time of the whole
+    batch. Shards that collected nothing don't count; any other failure code wins.
+    """
+    codes = [r.exit_code for r in reports]
+    failed = [c for c in codes if c not in (0, PYTEST_NO_TESTS)]
+    if failed:
+        exit_code = max(failed)
+    elif 0 in codes:
+        exit_code = 0
+    else:
+        exit_code = PYTEST_NO_TESTS
+
+    logs = "\n".join(
+        f"===== shard {i + 1}/{len(reports)} (exit {r.exit_code}, {r.duration:.1f}s) =====\n{r.logs}"
+        for i, r in enumerate(reports)
+    )
+    return TestRunReport(
+        exit_code=exit_code,
+        duration=duration,
+        cases=[case for r in reports for case in r.cases],
+        logs=logs,
+        timed_out=any(r.timed_out for r in reports),
+    )
+
+
+def condense_tracebacks(cases: List[TestCaseResult]) -> List[TestCaseResult]:
+    """
+    The cases with library frames collapsed out of their tracebacks, and a traceback that
+    repeats an earlier case's replaced by that case's name
+    """
+    condensed: List[TestCaseResult] = []
+    seen: Dict[tuple, str] = {}
+    for case in cases:
+        traceback = condense_traceback(case.traceback)
+        signature = () if SAME_ERROR_RE.match(traceback) else traceback_signature(traceback)
+        if signature and signature in seen:
+            traceback = f"(same error as {seen[signature]})"
+        elif signature:
+            seen[signature] = case.node_id
+        condensed.append(case.model_copy(update={"traceback": traceback}))
+    return condensed
+
+
+def summarize_failures(report: TestRunReport, max_cases: int = 3, max_chars: int = 1200) -> str:
+    """Compact, prompt-sized description of what failed, instead of the raw pytest output"""
+    failures = report.failures
+    if not failures:
+        return report.logs[-2000:] if report.logs else "No failures reported"
+
+    # Collection errors first: nothing else ran when one of those happens
+    failures = sorted(failures, key=lambda c: not c.is_collection_error)
+    counts = report.counts()
+    lines = [
+        f"{len(failures)} failing of {len(report.cases)} tests "
+        f"({', '.join(f'{v} {k}' for k, v in sorted(counts.items()))})"
+    ]
+
+    # Failures with the same error, keyed by the first of them
+    groups: Dict[str, List[TestCaseResult]] = {}
+    for case in condense_tracebacks(failures):
+        same = SAME_ERROR_RE.match(case.traceback)
+        first = same.group(1) if same and same.group(1) in groups else case.node_id
+        groups.setdefault(first, []).append(case)
+
+    for case, *repeats in list(groups.values())[:max_cases]:
+        lines.append("")
+        lines.append(f"--- {case.node_id} [{case.outcome}]")
+        message = case.message or ""
+        if case.exception_type and not message.startswith(case.exception_type):
+            message = f"{case.exception_type}: {message}"
+        lines.append(message.strip())
+        traceback = case.traceback.strip()
+        if len(traceback) > max_chars:
+            traceback = "...\n" + traceback[-max_chars:]
+        lines.append(traceback)
+        if repeats:
+            lines.append(f"Same error in {len(repeats)} more tests:")
+            lines.extend(f"  {repeat.node_id}" for repeat in repeats)
+
+    remaining = [case for cases in list(groups.values())[max_cases:] for case in cases]
+    if remaining:
+        lines.append("")
+        lines.append(f"... and {len(remaining)} more failing tests:")
+        lines.extend(f"  {case.node_id}" for case in remaining)
+    return "\n".join(lines)
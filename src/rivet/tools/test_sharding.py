@@ -0,0 +1,74 @@
+import ast
+import heapq
+import os
+import re
+from typing import Dict, List, Optional
+
+from rivet.core.schema import TestRunReport
+from rivet.tools.sandbox_base import TEST_FILE
+
+PARAM_RE = re.compile(r"\[.*\]$")
+
+
+def effective_workers(configured: int) -> int:
+    """Requested shard count, capped by the host's cores"""
+    return max(1, min(int(configured or 1), os.cpu_count() or 1))
+
+
+def collect_units(test_code: str) -> List[str]:
+    """
+    Shardable node IDs of the suite: top-level test functions and Test* classes.
+    Read from the AST so sharding never costs an extra `pytest --collect-only` round trip;
+    parametrized cases stay together with their function. Empty if the file does not parse.
+    """
+    try:
+        tree = ast.parse(test_code)
+    except SyntaxError:
+        return []
+
+    units = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            if node.name.startswith("test"):
+                units.append(f"{TEST_FILE}::{node.name}")
+        elif isinstance(node, ast.ClassDef) and node.name.startswith("Test"):
+            units.append(f"{TEST_FILE}::{node.name}")
+    return units
+
+
+def unit_durations(report: Optional[TestRunReport]) -> Dict[str, float]:
+    """Time spent per shard unit, adding up parametrized cases and class members"""
+    durations: Dict[str, float] = {}
+    if report is None:
+        return durations
+    for case in report.cases:
+        # test_client.py::TestPets::test_get[1] -> test_client.py::TestPets, as collect_units
+        unit = "::".join(PARAM_RE.sub("", case.node_id).split("::")[:2])
+        durations[unit] = durations.get(unit, 0.0) + case.duration
+    return durations
+
+
+def plan_shards(
+    units: List[str], workers: int, durations: Optional[Dict[str, float]] = None
+) -> List[List[str]]:
+    """
+    Spread `units` over at most `workers` shards, longest first onto the least loaded shard.
+    Units without a known duration count as the average of the known ones (or 1s).
+    """
+    durations = durations or {}
+    known = [durations[u] for u in units if u in durations]
+    default = sum(known) / len(known) if known else 1.0
+
+    shards: List[List[str]] = [[] for _ in range(min(workers, len(units)))]
+    if not shards:
+        return []
+    heap = [(0.0, i) for i in range(len(shards))]
+    ordered = sorted(units, key=lambda u: durations.get(u, default), reverse=True)
+    for unit in ordered:
+        load, i = heapq.heappop(heap)
+        shards[i].append(unit)
+        heapq.heappush(heap, (load + durations.get(unit, default), i))
+
+    # Keep each shard in file order so output stays readable
+    position = {unit: i for i, unit in enumerate(units)}
+    return [sorted(shard, key=position.__getitem__) for shard in shards if shard]
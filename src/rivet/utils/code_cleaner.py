@@ -1,4 +1,5 @@
 import re
+from typing import List, Optional
 
 
 def clean_code(code: str):
@@ -17,3 +18,86 @@ def clean_code(code: str):
         code = code[: -len("```")]
 
     return code.strip()
+
+
+# A line that can open a Python file, or the fence around one
+CODE_START_RE = re.compile(r"^(```|import |from \S+ import|class |def |async def |@|#|\"\"\"|''')")
+
+
+class CodeStreamGuard:
+    """
+    Watches a code completion while it streams and reports when it is clearly going wrong,
+    so the request can be cancelled instead of paid for in full.
+    """
+
+    PROSE_LIMIT = 400  # Characters allowed before the first line that looks like code
+    REPEAT_MIN_LINES = 30  # A repeated block must cover at least this many lines...
+    REPEAT_MIN_TIMES = 3  # ...and show up at least this many times in a row
+    REPEAT_MAX_BLOCK = 12  # Longest block (in lines) checked for repetition
+
+    def __init__(self):
+        self._pending = ""
+        self._in_code = False
+        self._prose = 0
+        self._lines: List[str] = []
+        self._window = max(self.REPEAT_MIN_LINES, self.REPEAT_MAX_BLOCK * self.REPEAT_MIN_TIMES)
+
+    def feed(self, delta: str) -> Optional[str]:
+        """Add streamed text; returns why the completion should be aborted, if it should"""
+        *lines, self._pending = (self._pending + delta).split("\n")
+        for line in lines:
+            problem = self._check_line(line)
+            if problem:
+                return problem
+        if not self._in_code and self._prose + len(self._pending) > self.PROSE_LIMIT:
+            return self._prose_problem()
+        return None
+
+    def _prose_problem(self) -> str:
+        return f"over {self.PROSE_LIMIT} characters of prose before any code"
+
+    def _check_line(self, line: str) -> Optional[str]:
+        stripped = line.strip()
+        if not self._in_code:
+            if CODE_START_RE.match(stripped):
+                self._in_code = True
+                return None
+            self._prose += len(line) + 1
+            return self._prose_problem() if self._prose > self.PROSE_LIMIT else None
+
+        if not stripped:
+            return None
+        self._lines.append(stripped)
+        if len(self._lines) > self._window:
+            del self._lines[0]
+        return self._check_repetition()
+
+    def _check_repetition(self) -> Optional[str]:
+        for size in range(1, self.REPEAT_MAX_BLOCK + 1):
+            times = max(self.REPEAT_MIN_TIMES, -(-self.REPEAT_MIN_LINES // size))
+            span = size * times
+            if span > len(self._lines):
+                continue
+            tail = self._lines[-span:]
+            block = tail[:size]
+            if tail == block * times:
+                return f"the same {size}-line block repeated {times} times in a row"
+        return None
+
+
+def merge_continuation(text: str, continuation: str, max_overlap: int = 300) -> str:
+    """
+    Append a continuation of a truncated completion to it. Models often reopen a code fence
+    or repeat the last few characters they wrote, so drop both before joining.
+    """
+    fence = re.match(r"\s*```(?:python)?[ \t]*\n", continuation)
+    if fence:
+        continuation = continuation[fence.end() :]
+
+    for size in range(min(max_overlap, len(text), len(continuation)), 0, -1):
+        if text.endswith(continuation[:size]):
+            # Only trust overlaps long enough not to be a coincidence (e.g. a single space)
+            if size >= 8:
+                continuation = continuation[size:]
+            break
+    return text + continuation
@@ -0,0 +1,211 @@
+import ast
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from rivet.core.inference import CHARS_PER_TOKEN
+
+DEFAULT_CONTEXT_TOKENS = 2000
+MAX_REFERENCE_DEPTH = 2  # Helpers of helpers are included, their helpers are not
+IDENTIFIER_RE = re.compile(r"'([A-Za-z_][A-Za-z0-9_]*)'")
+
+DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+@dataclass
+class _Definition:
+    name: str
+    node: ast.stmt
+    start: int  # 1-based, decorators included
+    end: int
+
+
+def _span(node: ast.stmt) -> Tuple[int, int]:
+    decorators = getattr(node, "decorator_list", [])
+    return min([node.lineno] + [d.lineno for d in decorators]), node.end_lineno
+
+
+def _top_level(tree: ast.Module) -> Dict[str, _Definition]:
+    """Module-level functions, classes and assigned names (constants, type aliases)"""
+    index: Dict[str, _Definition] = {}
+    for node in tree.body:
+        names: List[str] = []
+        if isinstance(node, DEFINITIONS):
+            names = [node.name]
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names = [t.id for t in targets if isinstance(t, ast.Name)]
+        for name in names:
+            index[name] = _Definition(name, node, *_span(node))
+    return index
+
+
+def _references(node: ast.AST) -> Set[str]:
+    """Names and attribute names used inside `node`"""
+    names = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name):
+            names.add(child.id)
+        elif isinstance(child, ast.Attribute):
+            names.add(child.attr)
+    return names
+
+
+def _enclosing(tree: ast.Module, line: int) -> List[ast.stmt]:
+    """Chain of definitions around `line`, outermost first (e.g. [class, method])"""
+    chain: List[ast.stmt] = []
+    body = tree.body
+    while True:
+        node = next(
+            (n for n in body if isinstance(n, DEFINITIONS) and _span(n)[0] <= line <= n.end_lineno),
+            None,
+        )
+        if node is None:
+            return chain
+        chain.append(node)
+        body = node.body
+
+
+def _class_skeleton(node: ast.ClassDef) -> Set[int]:
+    """Header, docstring and field lines of a class: everything but its methods' bodies"""
+    lines = set(range(_span(node)[0], node.body[0].lineno))
+    for child in node.body:
+        if not isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            lines.update(range(child.lineno, child.end_lineno + 1))
+    return lines
+
+
+def build_code_context(
+    source: str,
+    lines: Iterable[int] = (),
+    names: Iterable[str] = (),
+    max_tokens: int = DEFAULT_CONTEXT_TOKENS,
+) -> Optional[str]:
+    """
+    Excerpt of `source` for a fix prompt: the imports, the definitions enclosing `lines`
+    (a method comes with its class's header, fields and __init__), the definitions named
+    in `names`, then the module-level helpers and models they reference, nearest first,
+    while they fit in `max_tokens`. Omitted stretches are marked with a comment.
+    Returns None when the whole file fits the budget or can't be parsed: send it all then.
+    """
+    budget = max_tokens * CHARS_PER_TOKEN
+    if len(source) <= budget:
+        return None
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return None
+
+    source_lines = source.split("\n")
+    index = _top_level(tree)
+    methods: Dict[str, List[ast.stmt]] = {}
+    for definition in index.values():
+        if isinstance(definition.node, ast.ClassDef):
+            for child in definition.node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    methods.setdefault(child.name, []).append(child)
+
+    keep: Set[int] = set()
+    used = 0
+
+    def add(span_lines: Iterable[int], required: bool = False) -> bool:
+        nonlocal used
+        new = [n for n in span_lines if n not in keep]
+        cost = sum(len(source_lines[n - 1]) + 1 for n in new)
+        if not required and used + cost > budget:
+            return False
+        keep.update(new)
+        used += cost
+        return True
+
+    # Imports always: half of all fixes are a missing or wrong one
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            add(range(node.lineno, node.end_lineno + 1), required=True)
+
+    # Seeds: what the failure points at
+    seeds: List[ast.stmt] = []
+    for line in sorted(set(lines)):
+        chain = _enclosing(tree, line)
+        if not chain:
+            continue
+        outer = chain[0]
+        if isinstance(outer, ast.ClassDef) and len(chain) > 1:
+            method = chain[1]
+            add(_class_skeleton(outer), required=True)
+            init = next((m for m in outer.body if getattr(m, "name", "") == "__init__"), None)
+            for node in (init, method):
+                if node is not None:
+                    add(range(_span(node)[0], node.end_lineno + 1), required=True)
+                    seeds.append(node)
+        else:
+            add(range(_span(outer)[0], outer.end_lineno + 1), required=True)
+            seeds.append(outer)
+    for name in names:
+        if name in index:
+            definition = index[name]
+            if add(range(definition.start, definition.end + 1)):
+                seeds.append(definition.node)
+    if not seeds:
+        return None
+
+    # Then what the seeds use, breadth first: models, helpers, constants, sibling methods
+    queue = deque((seed, 0) for seed in seeds)
+    seen = {id(seed) for seed in seeds}
+    while queue:
+        node, depth = queue.popleft()
+        if depth >= MAX_REFERENCE_DEPTH:
+            continue
+        for name in sorted(_references(node)):
+            targets = [index[name].node] if name in index else methods.get(name, [])
+            for target in targets:
+                if id(target) in seen:
+                    continue
+                seen.add(id(target))
+                start, end = _span(target)
+                if add(range(start, end + 1)):
+                    queue.append((target, depth + 1))
+
+    # Classes whose methods are included need their headers to keep the excerpt readable
+    for definition in index.values():
+        node = definition.node
+        if isinstance(node, ast.ClassDef) and any(
+            definition.start <= n <= definition.end for n in keep
+        ):
+            add(_class_skeleton(node), required=True)
+
+    out: List[str] = []
+    omitted = 0
+    for number, text in enumerate(source_lines, start=1):
+        if number in keep:
+            if omitted:
+                out.append(f"# ... {omitted} lines omitted ...")
+                omitted = 0
+            out.append(text)
+        elif text.strip():
+            omitted += 1
+        elif not omitted and out and out[-1]:
+            out.append("")  # Keep the blank line that separated two kept definitions
+    if omitted:
+        out.append(f"# ... {omitted} lines omitted ...")
+    return "\n".join(out)
+
+
+def names_in_message(message: Optional[str]) -> List[str]:
+    """Quoted identifiers in an error message, e.g. NameError: name 'Pet' is not defined"""
+    return IDENTIFIER_RE.findall(message or "")
+
+
+def referenced_names(source: str, lines: Iterable[int]) -> List[str]:
+    """Names used by the definitions around `lines` (e.g. failing tests) in `source`"""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return []
+    names: Set[str] = set()
+    for line in set(lines):
+        chain = _enclosing(tree, line)
+        if chain:
+            names |= _references(chain[-1])
+    return sorted(names)
@@ -0,0 +1,185 @@
+import ast
+import re
+import textwrap
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# `### REPLACE Client.get_user` / `### ADD_IMPORTS`, each followed by a fenced code block
+BLOCK_RE = re.compile(
+    r"^###\s*(REPLACE\s+(?P<target>[\w.]+)|ADD_IMPORTS)\s*$\s*```(?:python)?\s*\n(?P<code>.*?)```",
+    re.MULTILINE | re.DOTALL,
+)
+HUNK_RE = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@")
+DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+class PatchError(Exception):
+    """A patch could not be applied cleanly; the caller should ask for the whole file"""
+
+
+@dataclass
+class Replacement:
+    target: str  # `name` for a top-level function/class, `Class.method` for a method
+    code: str
+
+
+def _find_definition(tree: ast.Module, target: str) -> Tuple[Optional[ast.AST], Optional[ast.AST]]:
+    """(definition, its parent) for a dotted name; definition is None if only the parent exists"""
+    parent: ast.AST = tree
+    node: Optional[ast.AST] = None
+    parts = target.split(".")
+    for depth, part in enumerate(parts):
+        body = getattr(parent, "body", [])
+        node = next(
+            (n for n in body if isinstance(n, DEFINITIONS) and n.name == part),
+            None,
+        )
+        if node is None:
+            if depth < len(parts) - 1:
+                raise PatchError(f"'{'.'.join(parts[: depth + 1])}' not found in the file")
+            return None, parent
+        if depth < len(parts) - 1:
+            parent = node
+    return node, parent
+
+
+def _indent_of(lines: List[str], lineno: int) -> str:
+    line = lines[lineno - 1]
+    return line[: len(line) - len(line.lstrip())]
+
+
+def _reindent(code: str, indent: str) -> List[str]:
+    return [indent + line if line.strip() else "" for line in textwrap.dedent(code).split("\n")]
+
+
+def _replace(source: str, replacement: Replacement) -> str:
+    code = textwrap.dedent(replacement.code).strip("\n")
+    try:
+        new_nodes = ast.parse(code).body
+    except SyntaxError as e:
+        raise PatchError(f"replacement for {replacement.target} is not valid Python: {e}") from e
+    name = replacement.target.split(".")[-1]
+    if not any(isinstance(n, DEFINITIONS) and n.name == name for n in new_nodes):
+        raise PatchError(f"replacement for {replacement.target} does not define '{name}'")
+
+    lines = source.split("\n")
+    node, parent = _find_definition(ast.parse(source), replacement.target)
+    if node is not None:
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        indent = _indent_of(lines, node.lineno)
+        return "\n".join(lines[: start - 1] + _reindent(code, indent) + lines[node.end_lineno :])
+
+    # A definition that doesn't exist yet goes at the end of its class (or of the module)
+    if isinstance(parent, ast.ClassDef):
+        indent = _indent_of(lines, parent.body[0].lineno)
+        end = parent.end_lineno
+        return "\n".join(lines[:end] + [""] + _reindent(code, indent) + lines[end:])
+    return source.rstrip("\n") + "\n\n\n" + code + "\n"
+
+
+def _add_imports(source: str, code: str) -> str:
+    tree = ast.parse(source)
+    lines = source.split("\n")
+    present = {line.strip() for line in lines}
+    new = [
+        line.strip()
+        for line in textwrap.dedent(code).split("\n")
+        if line.strip() and line.strip() not in present
+    ]
+    if not new:
+        return source
+    imports = [n for n in tree.body if isinstance(n, (ast.Import, ast.ImportFrom))]
+    if imports:
+        at = imports[-1].end_lineno
+    elif (
+        tree.body
+        and isinstance(tree.body[0], ast.Expr)
+        and isinstance(getattr(tree.body[0], "value", None), ast.Constant)
+    ):
+        at = tree.body[0].end_lineno  # After the module docstring
+    else:
+        at = 0
+    return "\n".join(lines[:at] + new + lines[at:])
+
+
+def _find_block(lines: List[str], block: List[str], hint: int) -> int:
+    """Index where `block` occurs in `lines`, preferring the occurrence closest to `hint`"""
+    if not block:
+        return hint
+    for normalize in (lambda s: s, lambda s: s.rstrip(), lambda s: s.strip()):
+        wanted = [normalize(line) for line in block]
+        starts = [
+            i
+            for i in range(len(lines) - len(block) + 1)
+            if [normalize(line) for line in lines[i : i + len(block)]] == wanted
+        ]
+        if starts:
+            return min(starts, key=lambda i: abs(i - hint))
+    raise PatchError(f"hunk context not found: {block[0].strip()!r}")
+
+
+def apply_unified_diff(source: str, diff: str) -> str:
+    """Apply a unified diff by content: line numbers are only a hint, context must match"""
+    lines = source.split("\n")
+    hunks: List[Tuple[int, List[str], List[str]]] = []
+    current = None
+    for line in diff.split("\n"):
+        header = HUNK_RE.match(line)
+        if header:
+            current = (int(header.group(1)) - 1, [], [])
+            hunks.append(current)
+        elif current is None or line.startswith(("---", "+++")):
+            continue
+        elif line.startswith("-"):
+            current[1].append(line[1:])
+        elif line.startswith("+"):
+            current[2].append(line[1:])
+        elif line.startswith(" ") or line == "":
+            current[1].append(line[1:])
+            current[2].append(line[1:])
+    if not hunks:
+        raise PatchError("no diff hunks found")
+
+    offset = 0
+    for hint, old, new in hunks:
+        # A blank line at the very end of a hunk is usually the reply's own trailing newline
+        while old and new and old[-1] == "" and new[-1] == "":
+            old, new = old[:-1], new[:-1]
+        at = _find_block(lines, old, hint + offset)
+        lines[at : at + len(old)] = new
+        offset += len(new) - len(old)
+    return "\n".join(lines)
+
+
+def apply_patch(source: str, response: str) -> str:
+    """
+    Apply a patch-mode reply to `source`: `### REPLACE <name>` / `### ADD_IMPORTS` blocks
+    (matched against the AST, so line numbers don't matter) or a unified diff. The result
+    must compile, otherwise PatchError is raised.
+    """
+    blocks = list(BLOCK_RE.finditer(response))
+    if blocks:
+        patched = source
+        try:
+            for block in blocks:
+                if block.group("target"):
+                    target = Replacement(block.group("target"), block.group("code"))
+                    patched = _replace(patched, target)
+                else:
+                    patched = _add_imports(patched, block.group("code"))
+        except SyntaxError as e:
+            # Named replacements need a parseable file; a broken one only takes a diff
+            raise PatchError(f"file does not parse, cannot match definitions: {e.msg}") from e
+    elif re.search(r"^@@ -\d+", response, re.MULTILINE):
+        diff = re.search(r"```(?:diff|patch)?\s*\n(.*?)```", response, re.DOTALL)
+        patched = apply_unified_diff(source, diff.group(1) if diff else response)
+    else:
+        raise PatchError("reply contains no REPLACE blocks or diff hunks")
+
+    if patched.strip() == source.strip():
+        raise PatchError("patch did not change anything")
+    try:
+        compile(patched, "<patched>", "exec")
+    except SyntaxError as e:
+        raise PatchError(f"patched file does not compile: {e.msg} at line {e.lineno}") from e
+    return patched
@@ -3,7 +3,7 @@ import logging
 import os
 import stat
 from pathlib import Path
-from typing import Tuple
+from typing import Any, Dict, Tuple
 
 import platformdirs
 from rich.console import Console
@@ -110,6 +110,22 @@ def get_llm_credentials() -> Tuple[str, str, str]:
     return (llm_api_url, llm_api_key, llm_name)
 
 
+def get_llm_routing() -> Dict[str, Any]:
+    """
+    Optional per-node model routing and pricing from the credentials file, e.g.
+    "llm_nodes": {"slice": {"model": "small-model", "temperature": 0}} and
+    "llm_pricing": {"small-model": {"input_per_mtok": 0.15, "output_per_mtok": 0.6}}
+    """
+    routing = {}
+    for entity in ("llm_nodes", "llm_pricing"):
+        value = _load_from_file_fallback(entity)
+        if isinstance(value, dict):
+            routing[entity] = value
+        elif value is not None:
+            logger.warning(f"⚠️ Ignoring '{entity}' in {CREDENTIALS_FILE}: expected an object")
+    return routing
+
+
 """
 def reset_api_key():
     try:
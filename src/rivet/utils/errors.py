@@ -1,8 +1,11 @@
 import logging
+import os
 import re
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Optional
+from typing import Dict, List, Optional
+
+from rivet.core.schema import TestFrame, TestRunReport
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +21,7 @@ class ErrorCategory(Enum):
     TEST_DATA = "test_data"  # Wrong test data structure
     TEST_ASSERTION = "test_assertion"  # Failed assertions
     TEST_LOGIC = "test_logic"  # Test implementation bugs
+    SANDBOX_TIMEOUT = "sandbox_timeout"  # Run killed by the sandbox's wall-clock limit
     UNKNOWN = "unknown"
 
 
@@ -34,6 +38,22 @@ class ErrorAnalysis:
     is_sdk_error: bool  # True = fix SDK, False = fix tests
     severity: str  # "critical", "high", "medium", "low"
     suggested_action: str  # Human-readable fix suggestion
+    failing_tests: List[str] = field(default_factory=list)  # Node IDs, when known
+
+
+# `pytest -v` prints the node ID before running the test and the outcome after it
+VERBOSE_TEST_LINE_RE = re.compile(
+    r"^(\S+\.py::\S+)[ \t]*(PASSED|FAILED|ERROR|SKIPPED|XFAIL|XPASS)?", re.MULTILINE
+)
+
+
+def _is_sdk_file(file_path: Optional[str]) -> bool:
+    # Basename match: "client.py" is also a substring of "test_client.py"
+    return bool(file_path) and os.path.basename(file_path) == "client.py"
+
+
+def _is_test_file(file_path: Optional[str]) -> bool:
+    return bool(file_path) and os.path.basename(file_path) == "test_client.py"
 
 
 class ErrorAnalyzer:
@@ -86,8 +106,10 @@ class ErrorAnalyzer:
         error_type = error_match.group(1)
         error_message = error_match.group(2).strip()
 
-        # Extract file and line info
-        file_match = re.search(r'File "([^"]+)",\s*line\s*(\d+)', logs)
+        # Extract file and line info (native traceback first, then pytest's short format)
+        file_match = re.search(r'File "([^"]+)",\s*line\s*(\d+)', logs) or re.search(
+            r"^(\S*client\.py):(\d+):", logs, re.MULTILINE
+        )
         file_path = file_match.group(1) if file_match else None
         line_number = int(file_match.group(2)) if file_match else None
 
@@ -117,6 +139,67 @@ class ErrorAnalyzer:
             suggested_action=suggested_action,
         )
 
+    @staticmethod
+    def analyze_report(report: TestRunReport) -> Optional[ErrorAnalysis]:
+        """
+        Analyze a structured pytest report.
+        Falls back to log parsing when pytest did not get far enough to write one.
+        """
+        if report.passed:
+            return None
+
+        if report.timed_out:
+            return ErrorAnalyzer.analyze_timeout(report)
+
+        failures = report.failures
+        if not failures:
+            return ErrorAnalyzer.analyze(report.logs)
+
+        # A collection error means nothing ran, so it is always the root cause
+        primary = next((c for c in failures if c.is_collection_error), failures[0])
+        if not primary.exception_type:
+            analysis = ErrorAnalyzer.analyze(primary.traceback or report.logs)
+            if analysis:
+                analysis.failing_tests = report.failing_node_ids
+            return analysis
+
+        error_type = primary.exception_type
+        error_message = (primary.message or "").split("\n")[0]
+        if error_message.startswith(f"{error_type}:"):
+            error_message = error_message[len(error_type) + 1 :]
+        error_message = error_message.strip()
+
+        frame = ErrorAnalyzer._pick_frame(primary.frames)
+        file_path = frame.path if frame else None
+        line_number = frame.line if frame else None
+
+        category = ErrorAnalyzer._categorize_error(
+            error_type, error_message, file_path, primary.traceback
+        )
+
+        return ErrorAnalysis(
+            category=category,
+            error_type=error_type,
+            error_message=error_message,
+            file_path=file_path,
+            line_number=line_number,
+            traceback=primary.traceback,
+            is_sdk_error=category.value.startswith("sdk_"),
+            severity=ErrorAnalyzer._determine_severity(category),
+            suggested_action=ErrorAnalyzer._suggest_action(
+                category, error_type, error_message, file_path
+            ),
+            failing_tests=report.failing_node_ids,
+        )
+
+    @staticmethod
+    def _pick_frame(frames: List[TestFrame]) -> Optional[TestFrame]:
+        """Deepest frame in our own files: where the generated code actually broke"""
+        for frame in reversed(frames):
+            if _is_sdk_file(frame.path) or _is_test_file(frame.path):
+                return frame
+        return frames[-1] if frames else None
+
     @staticmethod
     def _categorize_error(
         error_type: str, error_message: str, file_path: Optional[str], full_logs: str
@@ -136,7 +219,7 @@ class ErrorAnalyzer:
         # 3. Check SDK structure errors (must be in client.py)
         for pattern, category in ErrorAnalyzer.SDK_STRUCTURE_PATTERNS.items():
             if re.search(pattern, error_type):
-                if file_path and "client.py" in file_path:
+                if _is_sdk_file(file_path):
                     return category
                 # If NameError in test, it's a test bug
                 return ErrorCategory.TEST_LOGIC
@@ -161,11 +244,11 @@ class ErrorAnalyzer:
             if "NoneType" in error_message and any(
                 attr in error_message for attr in ["json", "status_code", "text"]
             ):
-                if file_path and "client.py" in file_path:
+                if _is_sdk_file(file_path):
                     return ErrorCategory.SDK_LOGIC
 
             # Accessing wrong attribute on object - check file
-            if file_path and "client.py" in file_path:
+            if _is_sdk_file(file_path):
                 return ErrorCategory.SDK_STRUCTURE
             return ErrorCategory.TEST_LOGIC
 
@@ -173,12 +256,12 @@ class ErrorAnalyzer:
         if error_type == "TypeError":
             # "object async_generator can't be used in 'await' expression"
             if "coroutine" in error_message or "async" in error_message:
-                if file_path and "test_client.py" in file_path:
+                if _is_test_file(file_path):
                     return ErrorCategory.TEST_MOCK
                 return ErrorCategory.SDK_LOGIC
 
             # Type mismatches in SDK
-            if file_path and "client.py" in file_path:
+            if _is_sdk_file(file_path):
                 return ErrorCategory.SDK_LOGIC
             return ErrorCategory.TEST_DATA
 
@@ -193,7 +276,7 @@ class ErrorAnalyzer:
         if error_type == "KeyError":
             # Missing key in response - could be SDK or test
             # If in client.py, SDK didn't handle missing keys
-            if file_path and "client.py" in file_path:
+            if _is_sdk_file(file_path):
                 return ErrorCategory.SDK_LOGIC
             # If in test, wrong mock data structure
             return ErrorCategory.TEST_DATA
@@ -204,7 +287,7 @@ class ErrorAnalyzer:
     def _determine_severity(category: ErrorCategory) -> str:
         """Determine how critical the error is"""
         critical = [ErrorCategory.SDK_SYNTAX, ErrorCategory.SDK_IMPORT]
-        high = [ErrorCategory.SDK_STRUCTURE, ErrorCategory.SDK_LOGIC]
+        high = [ErrorCategory.SDK_STRUCTURE, ErrorCategory.SDK_LOGIC, ErrorCategory.SANDBOX_TIMEOUT]
         medium = [ErrorCategory.TEST_MOCK, ErrorCategory.TEST_DATA]
         low = [ErrorCategory.TEST_ASSERTION, ErrorCategory.TEST_LOGIC]
 
@@ -232,9 +315,76 @@ class ErrorAnalyzer:
             ErrorCategory.TEST_DATA: f"Fix test data structure: {error_message}",
             ErrorCategory.TEST_ASSERTION: f"Fix test assertion: {error_message}",
             ErrorCategory.TEST_LOGIC: f"Fix test implementation: {error_message}",
+            ErrorCategory.SANDBOX_TIMEOUT: (
+                f"{error_message}. Mock every HTTP call (the sandbox has no network access) "
+                "and remove sleeps, polling and unbounded retry loops."
+            ),
         }
         return suggestions.get(category, f"Investigate {error_type}: {error_message}")
 
+    @staticmethod
+    def analyze_unresolved_imports(
+        modules: Dict[str, List[str]], details: str = ""
+    ) -> ErrorAnalysis:
+        """Build an SDK_IMPORT analysis for imports the sandbox could not install"""
+        names = sorted(modules)
+        files = sorted({f for importers in modules.values() for f in importers})
+        error_message = f"No installable package for import(s): {', '.join(names)}" + (
+            f" (imported in {', '.join(files)})" if files else ""
+        )
+        traceback = "\n".join(
+            f"ModuleNotFoundError: No module named '{name}'" for name in names
+        ) + (f"\n\n{details}" if details else "")
+
+        # Only send it to the SDK fixer if the SDK itself imports it
+        is_sdk_error = not files or any("client.py" == f for f in files)
+
+        return ErrorAnalysis(
+            category=ErrorCategory.SDK_IMPORT,
+            error_type="ModuleNotFoundError",
+            error_message=error_message,
+            file_path=files[0] if files else None,
+            line_number=None,
+            traceback=traceback,
+            is_sdk_error=is_sdk_error,
+            severity=ErrorAnalyzer._determine_severity(ErrorCategory.SDK_IMPORT),
+            suggested_action=(
+                f"Remove or replace the import(s) {', '.join(names)}. Only use the standard "
+                "library, httpx, requests and pydantic (plus pytest, pytest_asyncio in tests)."
+            ),
+        )
+
+    @staticmethod
+    def analyze_timeout(report: TestRunReport) -> ErrorAnalysis:
+        """
+        The run was killed, so there is no JUnit report; the verbose output still tells
+        which test was running. Almost always a real network call or an unbounded loop.
+        """
+        running = [m.group(1) for m in VERBOSE_TEST_LINE_RE.finditer(report.logs) if not m.group(2)]
+        hung = running[-1] if running else None
+        error_message = (
+            f"{hung} did not finish within the sandbox time limit"
+            if hung
+            else "The test run did not finish within the sandbox time limit"
+        )
+
+        category = ErrorCategory.SANDBOX_TIMEOUT
+        return ErrorAnalysis(
+            category=category,
+            error_type="Timeout",
+            error_message=error_message,
+            file_path="test_client.py",
+            line_number=None,
+            traceback=report.logs,
+            # Tests are the usual culprit: the sandbox has no network, so unmocked calls hang
+            is_sdk_error=False,
+            severity=ErrorAnalyzer._determine_severity(category),
+            suggested_action=ErrorAnalyzer._suggest_action(
+                category, "Timeout", error_message, hung
+            ),
+            failing_tests=[hung] if hung else [],
+        )
+
     @staticmethod
     def _handle_unknown_error(logs: str) -> ErrorAnalysis:
         """Handle logs that don't match expected patterns"""
@@ -251,8 +401,202 @@ class ErrorAnalyzer:
         )
 
 
+def get_import_error_analysis(modules: Dict[str, List[str]], details: str = "") -> ErrorAnalysis:
+    return ErrorAnalyzer.analyze_unresolved_imports(modules, details)
+
+
+def get_report_analysis(report: TestRunReport) -> Optional[ErrorAnalysis]:
+    return ErrorAnalyzer.analyze_report(report)
+
+
 def get_error_analysis(logs: Optional[str] = None) -> Optional[ErrorAnalysis]:
     """
     Recommended: Use this instead of filter_errors() for structured error info.
     """
     return ErrorAnalyzer.analyze(logs)
+
+
+# LOG CONDENSING
+
+DEFAULT_LOG_CHARS = 4000
+
+# pytest's `===== title =====` banners and `_____ test_name _____` failure headers
+BANNER_RE = re.compile(r"^={3,} ?(.*?) ?={3,}$")
+FAILURE_HEADER_RE = re.compile(r"^_{3,} (.+?) _{3,}$")
+RESULTS_RE = re.compile(r"\b(failed|passed|errors?|no tests ran)\b.* in [\d.]+s")
+KEPT_SECTIONS = ("FAILURES", "ERRORS", "short test summary info")
+
+# A traceback frame, pytest's short format (`path.py:12: in func`) or Python's own
+FRAME_RE = re.compile(
+    r'^\s*(?:File "(?P<file>[^"]+)", line \d+, in \S+|(?P<path>\S+):\d+: in \S+)$'
+)
+LIBRARY_PATH_RE = re.compile(r"site-packages|dist-packages|/lib/python\d|^<frozen ")
+
+# Lines that say nothing about why the run failed
+NOISE_RE = re.compile(
+    r"^\s*(Collecting |Downloading |Using cached |Requirement already satisfied|"
+    r"Installing collected packages|Successfully (installed|uninstalled)|Found existing |"
+    r"Uninstalling |Attempting uninstall|Building wheels? |Created wheel |Stored in directory|"
+    r"Preparing metadata|Getting requirements|Installing build dependencies|"
+    r"\[notice\]|WARNING: Running pip|platform |cachedir: |rootdir: |configfile: |plugins: |"
+    r"asyncio: |collecting \.\.\.|collected \d+ items?)"
+    r"|[━█]{3,}"  # pip progress bars
+)
+PASSING_OUTCOMES = (None, "PASSED", "SKIPPED", "XFAIL", "XPASS")
+
+
+def _drop_noise(lines: List[str]) -> List[str]:
+    kept = []
+    for line in lines:
+        if NOISE_RE.search(line):
+            continue
+        verbose = VERBOSE_TEST_LINE_RE.match(line)
+        if verbose and verbose.group(2) in PASSING_OUTCOMES:
+            continue
+        if not line.strip() and (not kept or not kept[-1].strip()):
+            continue  # One blank line is enough
+        kept.append(line)
+    return kept
+
+
+def _is_library_frame(line: str) -> bool:
+    frame = FRAME_RE.match(line)
+    return bool(frame) and bool(LIBRARY_PATH_RE.search(frame.group("file") or frame.group("path")))
+
+
+def _collapse_library_frames(lines: List[str]) -> List[str]:
+    """Replace runs of httpx/pydantic/asyncio frames (and their source lines) with a count"""
+    out: List[str] = []
+    frames = 0
+    in_library = False
+    for line in lines:
+        if _is_library_frame(line):
+            frames += 1
+            in_library = True
+            continue
+        if in_library and line[:1].isspace() and not FRAME_RE.match(line):
+            continue  # Source line (or ^^^ marker) of a collapsed frame
+        if frames:
+            indent = "  " if line.startswith("  ") else ""
+            out.append(f"{indent}... {frames} library frame{'s' if frames > 1 else ''} ...")
+            frames = 0
+        in_library = False
+        out.append(line)
+    if frames:
+        out.append(f"... {frames} library frame{'s' if frames > 1 else ''} ...")
+    return out
+
+
+def _failure_signature(body: List[str]) -> tuple:
+    """A failure's traceback minus the test's own frame and captured output"""
+    signature = []
+    skipping = False
+    for line in body:
+        if line.startswith("-" * 3) and "Captured" in line:
+            break
+        frame = FRAME_RE.match(line)
+        if frame:
+            path = frame.group("file") or frame.group("path")
+            skipping = _is_test_file(path)
+            if skipping:
+                continue
+        elif skipping and line[:1].isspace():
+            continue
+        else:
+            skipping = False
+        signature.append(line)
+    return tuple(signature)
+
+
+def _dedupe_failures(lines: List[str]) -> List[str]:
+    """Keep the first of several failures with the same traceback, name the rest"""
+    out: List[str] = []
+    seen: Dict[tuple, str] = {}
+    i = 0
+    while i < len(lines):
+        header = FAILURE_HEADER_RE.match(lines[i])
+        if not header:
+            out.append(lines[i])
+            i += 1
+            continue
+        end = i + 1
+        while end < len(lines) and not (
+            FAILURE_HEADER_RE.match(lines[end]) or BANNER_RE.match(lines[end])
+        ):
+            end += 1
+        body = lines[i + 1 : end]
+        signature = _failure_signature(body)
+        if signature and signature in seen:
+            out.append(f"{lines[i]}\n(same error as {seen[signature]})")
+        else:
+            if signature:
+                seen[signature] = header.group(1)
+            out.extend(lines[i:end])
+        i = end
+    return out
+
+
+def _failure_sections(lines: List[str]) -> List[str]:
+    """
+    Only pytest's FAILURES/ERRORS sections, its short summary, the results line and shard
+    headers. Logs without any of those (pip failures, crashes, timeouts) are kept whole.
+    """
+    banners = [(n, BANNER_RE.match(line)) for n, line in enumerate(lines)]
+    banners = [(n, m.group(1)) for n, m in banners if m]
+    if not any(title in KEPT_SECTIONS for _, title in banners):
+        return lines
+    out: List[str] = []
+    for index, (start, title) in enumerate(banners):
+        end = banners[index + 1][0] if index + 1 < len(banners) else len(lines)
+        if title in KEPT_SECTIONS:
+            out.extend(lines[start:end])
+        elif title.startswith("shard ") or RESULTS_RE.search(title):
+            out.append(lines[start])
+    return out
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    """Keep the head (first failure) and the longer tail (summary), cut on line boundaries"""
+    if len(text) <= max_chars:
+        return text
+    lines = text.split("\n")
+    head: List[str] = []
+    tail: List[str] = []
+    head_budget, tail_budget = max_chars // 3, max_chars - max_chars // 3
+    while lines and len(lines[0]) + 1 <= head_budget:
+        head_budget -= len(lines[0]) + 1
+        head.append(lines.pop(0))
+    while lines and len(lines[-1]) + 1 <= tail_budget:
+        tail_budget -= len(lines[-1]) + 1
+        tail.insert(0, lines.pop())
+    if not lines:
+        return "\n".join(head + tail)
+    return "\n".join(head + [f"... {len(lines)} lines omitted ..."] + tail)
+
+
+def condense_traceback(traceback: Optional[str]) -> str:
+    """One test's traceback with its library frames collapsed, as `condense_log` does"""
+    if not traceback:
+        return ""
+    return "\n".join(_collapse_library_frames(traceback.strip("\n").split("\n")))
+
+
+def traceback_signature(traceback: str) -> tuple:
+    """What two failures with the same underlying error have in common"""
+    return _failure_signature(traceback.split("\n"))
+
+
+def condense_log(logs: Optional[str], max_chars: int = DEFAULT_LOG_CHARS) -> str:
+    """
+    Prompt- and state-sized version of pytest/pip output: drops pip noise, the session
+    header and passing tests, collapses library frames, names failures that repeat an
+    earlier traceback instead of repeating it, keeps only the failure sections and trims
+    what's left to `max_chars`. The full log belongs on disk.
+    """
+    if not logs:
+        return ""
+    lines = _drop_noise(logs.split("\n"))
+    lines = _failure_sections(lines)
+    lines = _collapse_library_frames(lines)
+    lines = _dedupe_failures(lines)
+    return _truncate("\n".join(lines).strip("\n"), max_chars)
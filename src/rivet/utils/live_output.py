@@ -0,0 +1,46 @@
+import asyncio
+import logging
+import threading
+from typing import Optional, TextIO
+
+from langgraph.config import get_stream_writer
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "sandbox_output"
+
+
+class LiveTestOutput:
+    """
+    Output callback for sandbox runs: forwards each line to the graph's custom stream (the TUI),
+    the rivet log and `logs_path` while pytest is still running. Safe to call from any thread.
+    """
+
+    def __init__(self, logs_path: Optional[str] = None):
+        self._loop = asyncio.get_running_loop()
+        self._lock = threading.Lock()
+        try:
+            self._writer = get_stream_writer()
+        except RuntimeError:
+            self._writer = None  # Not running inside a graph
+        self._file: Optional[TextIO] = None
+        if logs_path:
+            try:
+                self._file = open(logs_path, "w", encoding="utf-8")
+            except OSError as e:
+                logger.warning(f"⚠️ Cannot stream test logs to {logs_path}: {str(e)}")
+
+    def __call__(self, line: str):
+        logger.debug(f"🧪 | {line}")
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + "\n")
+                self._file.flush()
+        if self._writer is not None:
+            self._loop.call_soon_threadsafe(self._writer, {STREAM_KEY: line})
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,42 @@
+import threading
+from collections import defaultdict
+from typing import Dict
+
+
+class RunMetrics:
+    """Thread-safe counters and timers collected over a single run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, seconds: float):
+        """Record a duration as `<name>.count`, `<name>.total_s` and `<name>.max_s`"""
+        with self._lock:
+            self._counters[f"{name}.count"] += 1
+            self._counters[f"{name}.total_s"] += seconds
+            self._counters[f"{name}.max_s"] = max(self._counters[f"{name}.max_s"], seconds)
+
+    def peak(self, name: str, value: float):
+        """Keep the highest `value` seen for `name` (e.g. a queue's maximum depth)"""
+        with self._lock:
+            self._counters[name] = max(self._counters[name], value)
+
+    def get(self, name: str, default: float = 0) -> float:
+        with self._lock:
+            return self._counters.get(name, default)
+
+    def snapshot(self, prefix: str = "") -> Dict[str, float]:
+        with self._lock:
+            return {k: v for k, v in sorted(self._counters.items()) if k.startswith(prefix)}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+run_metrics = RunMetrics()
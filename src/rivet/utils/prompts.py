@@ -228,6 +228,12 @@ def get_test_usr_prompt(
     return prompt
 
 
+EXCERPT_NOTE = (
+    "(EXCERPT: only the code around the failure. Omitted parts are marked with "
+    "`# ... lines omitted ...` comments; leave them alone.)"
+)
+
+
 def get_fix_sdk_usr_prompt(
     current_sdk: str,
     error_logs: str,
@@ -236,9 +242,11 @@ def get_fix_sdk_usr_prompt(
     error_message: str,
     file_path: Optional[str] = None,
     line_number: Optional[int] = None,
+    patch: bool = False,
+    excerpt: bool = False,
 ) -> str:
-    # Use the last 2000 chars of logs to capture the actual traceback
-    relevant_logs = error_logs[-2000:] if error_logs else "No logs available"
+    # Callers pass prompt-sized failure context (structured summary or the tail of the logs)
+    relevant_logs = error_logs or "No logs available"
 
     location_info = f"Line {line_number}" if line_number else "Unknown Line"
     if file_path:
@@ -253,7 +261,7 @@ def get_fix_sdk_usr_prompt(
     - **Specific Error:** {error_message}
     - **Location:** {location_info}
 
-    ### 2. CURRENT SDK CODE
+    ### 2. CURRENT SDK CODE {EXCERPT_NOTE if excerpt else ""}
     ```python
     {current_sdk}
     ```
@@ -271,20 +279,26 @@ def get_fix_sdk_usr_prompt(
     3. **Verify Imports:** Scan the code to ensure all used types (`List`, `Optional`, `Dict`, `Any`) and libraries (`httpx`, `pydantic`) are imported.
 
     ### 5. OUTPUT
-    Return the **COMPLETE** fixed `client.py` file.
+    {get_patch_output_format("client.py") if patch else "Return the **COMPLETE** fixed `client.py` file."}
     """).strip()
 
 
-def get_fix_test_sys_prompt():
-    return """### ROLE
+def get_fix_test_sys_prompt(patch: bool = False):
+    if patch:
+        output_rules = """2. **PATCH ONLY:** Return only the tests you change, as patch blocks in the format the user asks for. Never re-emit unchanged code.
+3. **IMPORT SAFETY:** You must explicitly ensure `pytest`, `pytest_asyncio`, `httpx`, and all SDK classes are imported (add missing ones with `### ADD_IMPORTS`).
+4. **NO FILLER:** Return ONLY the patch blocks. No conversational filler."""
+    else:
+        output_rules = """2. **FULL REWRITE:** You must return the **ENTIRE** content of the fixed test file. Do not return snippets or diffs.
+3. **IMPORT SAFETY:** You must explicitly ensure `pytest`, `pytest_asyncio`, `httpx`, and all SDK classes are imported.
+4. **NO MARKDOWN:** Return ONLY the raw Python code. No conversational filler."""
+    return f"""### ROLE
 You are a Senior Python QA Automation Architect specializing in `pytest`, `httpx`, and `asyncio`. 
 Your goal is to fix a broken test suite to make it pass against a **verified correct** SDK.
 
 ### CRITICAL RULES
 1. **SDK IS IMMUTABLE:** Do not modify, assume, or suggest changes to the SDK code. If the Test expects `X` but SDK returns `Y`, change the Test to expect `Y`.
-2. **FULL REWRITE:** You must return the **ENTIRE** content of the fixed test file. Do not return snippets or diffs.
-3. **IMPORT SAFETY:** You must explicitly ensure `pytest`, `pytest_asyncio`, `httpx`, and all SDK classes are imported.
-4. **NO MARKDOWN:** Return ONLY the raw Python code. No conversational filler.
+{output_rules}
 """
 
 
@@ -295,9 +309,12 @@ def get_fix_test_usr_prompt(
     error_category: str,
     error_suggestion: str,
     error_message: str,
+    patch: bool = False,
+    sdk_excerpt: bool = False,
+    tests_excerpt: bool = False,
 ) -> str:
-    # Use the last 2000 chars to catch the pytest failure summary
-    relevant_logs = error_logs[-2000:] if error_logs else "No logs available"
+    # Callers pass prompt-sized failure context (structured summary or the tail of the logs)
+    relevant_logs = error_logs or "No logs available"
 
     return dedent(f"""
     We have a test failure. You need to fix `test_client.py` so it passes with the provided `client.py`.
@@ -307,12 +324,12 @@ def get_fix_test_usr_prompt(
     - **Issue:** {error_suggestion}
     - **Message:** {error_message}
 
-    ### 2. THE IMMUTABLE SDK (Source of Truth)
+    ### 2. THE IMMUTABLE SDK (Source of Truth) {EXCERPT_NOTE if sdk_excerpt else ""}
     ```python
     {sdk_code}
     ```
 
-    ### 3. THE BROKEN TEST FILE
+    ### 3. THE BROKEN TEST FILE {EXCERPT_NOTE if tests_excerpt else ""}
     ```python
     {current_tests}
     ```
@@ -331,19 +348,39 @@ def get_fix_test_usr_prompt(
     4. **Align Expectations:** If the SDK returns a Pydantic model, ensure the test asserts against model attributes, not dictionary keys.
 
     ### 6. OUTPUT
-    Return the **COMPLETE** fixed `test_client.py` file.
+    {get_patch_output_format("test_client.py") if patch else "Return the **COMPLETE** fixed `test_client.py` file."}
     """).strip()
 
 
-def get_fix_sdk_sys_prompt() -> str:
-    return dedent("""
+def get_fix_sdk_sys_prompt(patch: bool = False) -> str:
+    if patch:
+        output_rules = """
+    3. **PATCH ONLY:** Return only the definitions you change, as patch blocks in the format the user asks for. Never re-emit unchanged code.
+    4. **DEPENDENCY CHECK:** If the error is `NameError` or `ImportError`, add the missing import with an `### ADD_IMPORTS` block.
+    5. **NO FILLER:** Return ONLY the patch blocks. No explanations."""
+    else:
+        output_rules = """
+    3. **FULL REWRITE:** Return the **ENTIRE** corrected `client.py` file. Do not return snippets or diffs.
+    4. **DEPENDENCY CHECK:** If the error is `NameError` or `ImportError`, ensure the missing library is added to the top of the file.
+    5. **NO MARKDOWN:** Return ONLY the raw Python code. Start with imports."""
+    return dedent(f"""
     ### ROLE
     You are a Senior Python API Developer. You are fixing a specific bug in an existing SDK.
 
     ### CRITICAL RULES
     1. **SURGICAL FIX:** Only fix the specific error described. Do not refactor working code.
-    2. **PRESERVE INTERFACE:** Do not change method signatures or class names unless they are the direct cause of the error.
-    3. **FULL REWRITE:** Return the **ENTIRE** corrected `client.py` file. Do not return snippets or diffs.
-    4. **DEPENDENCY CHECK:** If the error is `NameError` or `ImportError`, ensure the missing library is added to the top of the file.
-    5. **NO MARKDOWN:** Return ONLY the raw Python code. Start with imports.
+    2. **PRESERVE INTERFACE:** Do not change method signatures or class names unless they are the direct cause of the error.{output_rules}
     """).strip()
+
+
+def get_patch_output_format(file_name: str) -> str:
+    # Single line on purpose: it is spliced into dedented prompts
+    return (
+        f"Return ONLY the changes to `{file_name}` as patch blocks. To replace a top-level "
+        "function or class, or a single method, write `### REPLACE <name>` (e.g. "
+        "`### REPLACE Client.get_user` or `### REPLACE helper`) followed by a ```python block "
+        "with the complete new definition, decorators included. A name that doesn't exist yet "
+        "is added. For new imports write `### ADD_IMPORTS` followed by a ```python block of "
+        "import lines. If the file has a syntax error, return a unified diff (```diff, with "
+        "`@@` hunks and 3 lines of context) instead."
+    )
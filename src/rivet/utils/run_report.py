@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+from rivet.core.llm_client import NodeLLMSettings
+from rivet.utils.metrics import run_metrics
+
+logger = logging.getLogger(__name__)
+
+RUN_REPORT_FILE = "run_report.json"
+
+
+def _llm_node_breakdown(
+    metrics: Dict[str, float], config: Optional[RunnableConfig]
+) -> Dict[str, Dict[str, Any]]:
+    """Latency, tokens and cost per graph node, from the `llm.node.<node>.*` metrics"""
+    prefix = "llm.node."
+    nodes = sorted(
+        {key[len(prefix) :].split(".", 1)[0] for key in metrics if key.startswith(prefix)}
+    )
+    breakdown = {}
+    for node in nodes:
+
+        def metric(name: str, default: float = 0) -> float:
+            return metrics.get(f"{prefix}{node}.{name}", default)
+
+        calls = int(metric("count"))
+        cost = metrics.get(f"{prefix}{node}.cost_usd")
+        breakdown[node] = {
+            "model": NodeLLMSettings.from_config(config, node).model,
+            "calls": calls,
+            "cache_hits": int(metric("cache_hits")),
+            "latency_s": round(metric("total_s"), 3),
+            "avg_latency_s": round(metric("total_s") / calls, 3) if calls else 0.0,
+            "max_latency_s": round(metric("max_s"), 3),
+            "retries": int(metric("retries")),
+            "prompt_tokens": int(metric("prompt_tokens")),
+            "completion_tokens": int(metric("completion_tokens")),
+            "cached_tokens": int(metric("cached_tokens")),
+            "tokens_estimated": bool(metric("estimated_calls")),
+            "cost_usd": round(cost, 6) if cost is not None else None,
+        }
+    return breakdown
+
+
+def _graph_node_timings(metrics: Dict[str, float]) -> Dict[str, Dict[str, Any]]:
+    """Wall time of each graph node over the run, from the `node.<name>.*` timers"""
+    prefix = "node."
+    names = sorted(
+        {key[len(prefix) :].rsplit(".", 1)[0] for key in metrics if key.startswith(prefix)}
+    )
+    return {
+        name: {
+            "runs": int(metrics.get(f"{prefix}{name}.count", 0)),
+            "total_s": round(metrics.get(f"{prefix}{name}.total_s", 0.0), 3),
+            "max_s": round(metrics.get(f"{prefix}{name}.max_s", 0.0), 3),
+        }
+        for name in names
+    }
+
+
+def _llm_totals(metrics: Dict[str, float], llm_nodes: Dict[str, Dict[str, Any]]):
+    def total(field: str):
+        return sum(node[field] for node in llm_nodes.values())
+
+    costs = [node["cost_usd"] for node in llm_nodes.values() if node["cost_usd"] is not None]
+    return {
+        "calls": total("calls"),
+        "cache_hits": total("cache_hits"),
+        "retries": int(metrics.get("llm.retries", 0)),
+        "latency_s": round(total("latency_s"), 3),
+        "prompt_tokens": total("prompt_tokens"),
+        "completion_tokens": total("completion_tokens"),
+        "cached_tokens": total("cached_tokens"),
+        "cost_usd": round(sum(costs), 6) if costs else None,
+        "queue_wait_s": round(metrics.get("llm.queue.wait.total_s", 0.0), 3),
+        "max_queue_depth": int(metrics.get("llm.queue.max_depth", 0)),
+    }
+
+
+def build_run_report(
+    status: Optional[str],
+    duration: float,
+    sandbox_stats: Dict[str, Dict[str, float]],
+    config: Optional[RunnableConfig] = None,
+) -> Dict[str, Any]:
+    metrics = run_metrics.snapshot()
+    llm_nodes = _llm_node_breakdown(metrics, config)
+    return {
+        "status": status or "unknown",
+        "duration_s": round(duration, 3),  # End-to-end wall time
+        "nodes": _graph_node_timings(metrics),
+        "llm": _llm_totals(metrics, llm_nodes),
+        "tests": {
+            "full_runs": metrics.get("tests.full_runs", 0),
+            "failed_first_runs": metrics.get("tests.failed_first.runs", 0),
+            "full_runs_skipped": metrics.get("tests.failed_first.full_runs_skipped", 0),
+            "failed_first_spent_s": round(metrics.get("tests.failed_first.spent_s", 0.0), 3),
+            "time_saved_s": round(metrics.get("tests.failed_first.saved_s", 0.0), 3),
+        },
+        "slice": {
+            "operations": int(metrics.get("slice.operations", 0)),
+            "spec_tokens": int(metrics.get("slice.prompt_tokens", 0)),
+            # Compared with taking the whole path item of every selected operation
+            "tokens_saved": int(metrics.get("slice.prompt_tokens_saved", 0)),
+        },
+        "llm_nodes": llm_nodes,
+        "sandbox_time_s": round(metrics.get("sandbox.run.total_s", 0.0), 3),
+        "sandbox": sandbox_stats,
+        "metrics": metrics,
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def write_run_report(output_dir: str, report: Dict[str, Any]) -> Optional[str]:
+    """Write `run_report.json` next to the generated SDK. Never fails the run."""
+    path = os.path.join(output_dir, RUN_REPORT_FILE)
+    try:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to save run report: {str(e)}")
+        return None
+    return path